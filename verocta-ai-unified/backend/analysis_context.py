@@ -0,0 +1,91 @@
+"""
+VeroctaAI Analysis Context
+Aggregates computed once per upload and shared by scoring, GPT insights and the PDF report
+"""
+
+import numpy as np
+from functools import cached_property
+from typing import List, Dict, Any, Union
+
+from transaction_batch import TransactionBatch
+from quantile_sketch import QuantileSketch
+from subscription_detector import detect_subscriptions
+from duplicate_detector import detect_duplicates
+from anomaly_detector import detect_anomalies
+from forecasting import forecast_spending
+
+
+class AnalysisContext:
+    """Totals, group-bys, month buckets and quantiles of one set of transactions
+
+    Built once from a ``TransactionBatch`` (or anything it can be coerced
+    from) so that each consumer reads the same aggregates instead of
+    re-iterating the transactions. Exact quantiles (which sort the amounts)
+    and the amount sketch are computed on first use.
+    """
+
+    def __init__(self, transactions: Union[TransactionBatch, List[Dict[str, Any]]]):
+        self.batch = TransactionBatch.coerce(transactions)
+        batch = self.batch
+
+        self.num_transactions = len(batch)
+        self.amounts = batch.amounts
+        self.total_amount = float(self.amounts.sum()) if self.num_transactions else 0.0
+        self.mean_amount = self.total_amount / self.num_transactions if self.num_transactions else 0
+
+        # Group-bys in order of first appearance
+        self.category_totals = batch.group_totals('category')
+        self.category_counts = batch.group_counts('category')
+        self.vendor_totals = batch.group_totals('vendor')
+        self.vendor_counts = batch.group_counts('vendor')
+
+        # Spend per month ('YYYY-MM', sorted) and dated transactions in date order
+        self.monthly_totals = batch.month_totals(absolute=True)
+        self.sorted_dates = np.sort(batch.dates[~np.isnat(batch.dates)])
+
+    @cached_property
+    def sorted_amounts(self) -> np.ndarray:
+        return np.sort(self.amounts)
+
+    @cached_property
+    def median_amount(self) -> float:
+        return float(np.median(self.sorted_amounts)) if self.num_transactions else 0
+
+    # Quartiles use the engine's index rule (sorted[n // 4], sorted[3n // 4])
+    @cached_property
+    def q1(self) -> float:
+        n = self.num_transactions
+        return float(self.sorted_amounts[n // 4]) if n >= 4 else None
+
+    @cached_property
+    def q3(self) -> float:
+        n = self.num_transactions
+        return float(self.sorted_amounts[3 * n // 4]) if n >= 4 else None
+
+    @cached_property
+    def amount_sketch(self) -> QuantileSketch:
+        """Approximate amount distribution, built in one pass without sorting"""
+        return QuantileSketch().add(self.amounts)
+
+    @cached_property
+    def subscriptions(self) -> Dict[str, Any]:
+        """Recurring vendor charges, shared by the GPT prompt, the response and the PDF"""
+        return detect_subscriptions(self.batch)
+
+    @cached_property
+    def duplicates(self) -> Dict[str, Any]:
+        """Exact and near-duplicate expense groups, shared by the GPT prompt, the response and the PDF"""
+        return detect_duplicates(self.batch)
+
+    @cached_property
+    def anomalies(self) -> Dict[str, Any]:
+        """Spending spikes within each vendor and category, shared by the GPT prompt, the response and the PDF"""
+        return detect_anomalies(self.batch)
+
+    @cached_property
+    def forecast(self) -> Dict[str, Any]:
+        """Projected next-quarter spend per category, shared by the GPT prompt, the response and the PDF"""
+        return forecast_spending(self.batch)
+
+    def __len__(self) -> int:
+        return self.num_transactions
@@ -0,0 +1,140 @@
+"""
+VeroctaAI Anomaly Detector
+Spending spikes flagged by robust z-scores within each vendor and category
+"""
+
+import numpy as np
+from typing import Dict, Any, Tuple
+
+from transaction_batch import TransactionBatch
+
+# Robust z-score (0.6745 * (amount - median) / MAD) above which a transaction is a spike
+ROBUST_Z_THRESHOLD = 3.5
+
+# Groups with fewer transactions have no meaningful typical amount and are skipped
+MIN_GROUP_SIZE = 5
+
+# Median and MAD of larger groups are estimated from a random sample of this many transactions
+RESERVOIR_SIZE = 10000
+
+# Spikes listed in the result, highest z-score first
+SPIKE_LIMIT = 20
+
+# MAD of a normal distribution is 0.6745 standard deviations; mean absolute deviation is 0.7979
+_MAD_SCALE = 0.6745
+_MEAN_AD_SCALE = 0.7979
+
+SEGMENTS = ('vendor', 'category')
+
+
+def _grouped_median(values: np.ndarray, groups: np.ndarray, num_groups: int) -> np.ndarray:
+    """Median of ``values`` per group code, from one sort by (group, value)"""
+    order = np.lexsort((values, groups))
+    sorted_values = values[order]
+    counts = np.bincount(groups, minlength=num_groups)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    medians = np.zeros(num_groups)
+    present = counts > 0
+    lower = starts + np.maximum(counts - 1, 0) // 2
+    upper = starts + counts // 2
+    medians[present] = (sorted_values[lower[present]] + sorted_values[upper[present]]) / 2
+    return medians
+
+
+def _reservoir(groups: np.ndarray, num_groups: int, sample_size: int, seed: int) -> Tuple[np.ndarray, int]:
+    """Positions of every transaction in small groups and a random ``sample_size`` of each larger one"""
+    counts = np.bincount(groups, minlength=num_groups)
+    giant = np.flatnonzero(counts > sample_size)
+    if not len(giant):
+        return np.arange(len(groups)), 0
+
+    rng = np.random.RandomState(seed)
+    by_group = np.argsort(groups, kind='stable')
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    keep = np.ones(len(groups), dtype=bool)
+    keep[np.isin(groups, giant)] = False
+    samples = [by_group[starts[group] + rng.choice(counts[group], sample_size, replace=False)] for group in giant.tolist()]
+    return np.concatenate([np.flatnonzero(keep)] + samples), int(len(giant))
+
+
+def robust_z_scores(amounts: np.ndarray, groups: np.ndarray, num_groups: int,
+                    min_group_size: int = MIN_GROUP_SIZE, sample_size: int = RESERVOIR_SIZE,
+                    seed: int = 0) -> Tuple[np.ndarray, np.ndarray, int]:
+    """Robust z-score of each amount within its group, the group medians, and how many groups were sampled
+
+    Groups smaller than ``min_group_size`` score 0. Where a group's MAD is
+    0 (most of its amounts are identical) the mean absolute deviation is
+    used instead, so a one-off charge among identical ones still stands out.
+    """
+    sample, sampled_groups = _reservoir(groups, num_groups, sample_size, seed)
+    sample_groups = groups[sample]
+    sample_amounts = amounts[sample]
+
+    medians = _grouped_median(sample_amounts, sample_groups, num_groups)
+    deviations = np.abs(sample_amounts - medians[sample_groups])
+    mads = _grouped_median(deviations, sample_groups, num_groups) / _MAD_SCALE
+    sample_counts = np.bincount(sample_groups, minlength=num_groups)
+    mean_ads = np.bincount(sample_groups, weights=deviations, minlength=num_groups) / np.maximum(sample_counts, 1) / _MEAN_AD_SCALE
+    scales = np.where(mads > 0, mads, mean_ads)
+
+    eligible = (np.bincount(groups, minlength=num_groups) >= min_group_size) & (scales > 0)
+    group_scales = np.where(eligible, scales, 1.0)
+    z_scores = np.where(eligible[groups], (amounts - medians[groups]) / group_scales[groups], 0.0)
+    return z_scores, medians, sampled_groups
+
+
+def segment_z_scores(amounts: np.ndarray, vendor_codes: np.ndarray, category_codes: np.ndarray,
+                     min_group_size: int = MIN_GROUP_SIZE, sample_size: int = RESERVOIR_SIZE) -> Dict[str, Tuple[np.ndarray, np.ndarray, int]]:
+    """Robust z-scores, medians and sampled-group counts within each vendor and each category"""
+    segments = {'vendor': vendor_codes, 'category': category_codes}
+    return {
+        segment: robust_z_scores(amounts, codes, int(codes.max()) + 1 if len(codes) else 0, min_group_size, sample_size)
+        for segment, codes in segments.items()
+    }
+
+
+def detect_anomalies(batch: TransactionBatch, threshold: float = ROBUST_Z_THRESHOLD,
+                     min_group_size: int = MIN_GROUP_SIZE, sample_size: int = RESERVOIR_SIZE,
+                     limit: int = SPIKE_LIMIT) -> Dict[str, Any]:
+    """Flag transactions far above the typical amount of their vendor or category
+
+    Each vendor and each category gets its own median and MAD, computed for
+    all groups at once from sorts by (group, amount); a $5k payroll run is
+    judged against payroll, not against coffee. A transaction is a spike
+    when its robust z-score within either segment exceeds ``threshold``.
+    """
+    result = {
+        'count': 0, 'flagged_amount': 0.0, 'threshold': threshold,
+        'by_segment': {segment: 0 for segment in SEGMENTS}, 'sampled_groups': 0, 'spikes': []
+    }
+    if not len(batch):
+        return result
+
+    scores = segment_z_scores(batch.amounts, batch.vendor_codes, batch.category_codes, min_group_size, sample_size)
+    z_scores = np.column_stack([scores[segment][0] for segment in SEGMENTS])
+    flags = z_scores > threshold
+    flagged = np.flatnonzero(flags.any(axis=1))
+
+    result['count'] = int(len(flagged))
+    result['flagged_amount'] = round(float(batch.amounts[flagged].sum()), 2) if len(flagged) else 0.0
+    result['by_segment'] = {segment: int(np.count_nonzero(flags[:, column])) for column, segment in enumerate(SEGMENTS)}
+    result['sampled_groups'] = sum(scores[segment][2] for segment in SEGMENTS)
+
+    # Highest z-score first; each spike reports the segment it stands out in most
+    peak = z_scores[flagged].max(axis=1)
+    for index in flagged[np.argsort(-peak, kind='stable')[:limit]].tolist():
+        column = int(np.argmax(z_scores[index]))
+        segment = SEGMENTS[column]
+        codes = batch.vendor_codes if segment == 'vendor' else batch.category_codes
+        date = batch.dates[index]
+        result['spikes'].append({
+            'index': index,
+            'vendor': str(batch.vendor_names[batch.vendor_codes[index]]),
+            'category': str(batch.category_names[batch.category_codes[index]]),
+            'date': None if np.isnat(date) else str(date),
+            'amount': round(float(batch.amounts[index]), 2),
+            'segment': segment,
+            'typical_amount': round(float(scores[segment][1][codes[index]]), 2),
+            'robust_z': round(float(z_scores[index, column]), 2)
+        })
+    return result
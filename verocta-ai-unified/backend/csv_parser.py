@@ -1,8 +1,13 @@
 import pandas as pd
+import codecs
+import io
 import logging
 from datetime import datetime
 import re
 
+from transaction_batch import TransactionBatch, TRANSACTION_FIELDS
+from parse_cache import parse_cache, file_digest, cache_key
+
 # Enhanced header mapping for different CSV formats from various platforms
 HEADER_MAPPINGS = {
     'vendor': [
@@ -31,6 +36,131 @@ HEADER_MAPPINGS = {
     ]
 }
 
+# Date formats tried by parse_date_value, in priority order
+DATE_FORMATS = [
+    '%Y-%m-%d',
+    '%m/%d/%Y',
+    '%d/%m/%Y',
+    '%Y-%m-%d %H:%M:%S',
+    '%m/%d/%Y %H:%M:%S',
+    '%d-%m-%Y',
+    '%m-%d-%Y',
+    '%d.%m.%Y',
+    '%m.%d.%Y'
+]
+
+# Distinct values sampled when inferring a column's date format
+DATE_SAMPLE_SIZE = 500
+
+# Paired outflow/inflow columns that together describe one signed amount
+DEBIT_CREDIT_COLUMNS = [
+    ('paid out', 'paid in'),
+    ('debit', 'credit'),
+    ('debit amount', 'credit amount'),
+    ('money out', 'money in'),
+    ('withdrawals', 'deposits'),
+    ('withdrawal', 'deposit')
+]
+
+# Currency symbols, ISO currency codes, whitespace and apostrophes (Swiss thousands) in amounts
+AMOUNT_NOISE_PATTERN = r"[£$€¥₹\s']|^[A-Za-z]{3}|[A-Za-z]{3}$"
+
+# Distinct values sampled when inferring a column's decimal separator
+AMOUNT_SAMPLE_SIZE = 500
+
+# Keys of a resolved column mapping
+MAPPING_FIELDS = [
+    'amount', 'debit', 'credit', 'vendor', 'date', 'category', 'description',
+    'date_format', 'decimal_separator'
+]
+
+# Rows per batch when streaming large CSV files
+STREAM_CHUNK_SIZE = 50000
+
+# Bytes read from the start of a file when sniffing its encoding
+ENCODING_SNIFF_BYTES = 64 * 1024
+
+# Bounds on how much of a file the mapping preview reads
+PREVIEW_ROWS = 200
+PREVIEW_BYTES = 256 * 1024
+
+# Rows returned as examples by the mapping preview
+PREVIEW_SAMPLE_ROWS = 5
+
+# Share of non-empty values that must parse for a column to be typed as date or
+# number; the rest are reported as parse failures
+TYPE_INFERENCE_THRESHOLD = 0.5
+
+# Byte order marks, longest first so UTF-32 LE is not mistaken for UTF-16 LE
+BOM_ENCODINGS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16')
+]
+
+# Bytes in 0x80-0x9F that cp1252 leaves undefined
+CP1252_UNDEFINED_BYTES = {0x81, 0x8D, 0x8F, 0x90, 0x9D}
+
+def sniff_encoding(sample):
+    """Pick a text encoding for a byte prefix of a CSV file
+
+    Returns a dict with the codec name, a 0-1 confidence and whether it was
+    decided by a byte order mark.
+    """
+    for bom, encoding in BOM_ENCODINGS:
+        if sample.startswith(bom):
+            return {'encoding': encoding, 'confidence': 1.0, 'bom': True}
+    
+    if sample.isascii():
+        # Valid in every supported codec; a later non-ASCII byte is still possible
+        return {'encoding': 'utf-8', 'confidence': 0.8, 'bom': False}
+    
+    try:
+        # Incremental decode so a multi-byte character cut at the end of the sample is not an error
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return {'encoding': 'utf-8', 'confidence': 0.99, 'bom': False}
+    except UnicodeDecodeError:
+        pass
+    
+    if CP1252_UNDEFINED_BYTES.isdisjoint(sample):
+        return {'encoding': 'cp1252', 'confidence': 0.9, 'bom': False}
+    return {'encoding': 'latin-1', 'confidence': 0.7, 'bom': False}
+
+def detect_encoding(filepath, sample_size=ENCODING_SNIFF_BYTES):
+    """Sniff the encoding of a CSV file from a bounded prefix"""
+    with open(filepath, 'rb') as f:
+        sample = f.read(sample_size)
+    encoding_info = sniff_encoding(sample)
+    logging.info(f"Detected {encoding_info['encoding']} encoding (confidence {encoding_info['confidence']})")
+    return encoding_info
+
+def read_csv_file(filepath, encoding_info=None):
+    """Read a CSV file in a single pass using a sniffed encoding
+
+    Only if a byte beyond the sniffed prefix fails to decode is the file read
+    again, with cp1252 and then latin-1 (which accepts every byte).
+    """
+    if encoding_info is None:
+        encoding_info = detect_encoding(filepath)
+    
+    try:
+        return pd.read_csv(filepath, encoding=encoding_info['encoding']), encoding_info
+    except UnicodeDecodeError as e:
+        logging.warning(f"{encoding_info['encoding']} decoding failed past the sniffed prefix: {str(e)}")
+    
+    for fallback in ['cp1252', 'latin-1']:
+        if fallback == encoding_info['encoding']:
+            continue
+        try:
+            df = pd.read_csv(filepath, encoding=fallback)
+            return df, {'encoding': fallback, 'confidence': 0.5, 'bom': False}
+        except UnicodeDecodeError:
+            continue
+    
+    raise ValueError("Could not read CSV file with any supported encoding")
+
 def normalize_header(header):
     """Normalize header name to lowercase and remove special characters"""
     return re.sub(r'[^\w\s]', '', header.lower().strip())
@@ -73,13 +203,43 @@ def find_matching_column(df_columns, target_field):
             if any(keyword in col_name for keyword in ['usd', 'gbp', 'eur', 'dollar', 'pound', 'euro']):
                 return original_col
         
-        # Special handling for date fields
+        # Special handling for date fields ('on' and 'when' only as whole words)
         if target_field == 'date':
-            if any(keyword in col_name for keyword in ['time', 'when', 'on']):
+            if 'time' in col_name or any(word in ['when', 'on'] for word in col_name.split()):
                 return original_col
     
     return None
 
+def find_debit_credit_columns(df_columns):
+    """Find a pair of separate outflow/inflow columns, e.g. 'Paid out'/'Paid in'"""
+    normalized_columns = {normalize_header(col): col for col in df_columns}
+    
+    for debit, credit in DEBIT_CREDIT_COLUMNS:
+        if debit in normalized_columns and credit in normalized_columns:
+            return normalized_columns[debit], normalized_columns[credit]
+    
+    return None, None
+
+def detect_columns(df_columns):
+    """Auto-detect a column mapping from CSV headers"""
+    mapping = {
+        field: find_matching_column(df_columns, field)
+        for field in ['amount', 'vendor', 'date', 'category', 'description']
+    }
+    
+    # Separate debit/credit columns are merged unless there is an explicit amount column
+    if 'amount' not in {normalize_header(col) for col in df_columns}:
+        debit_col, credit_col = find_debit_credit_columns(df_columns)
+        if debit_col and credit_col:
+            mapping.update(amount=None, debit=debit_col, credit=credit_col)
+    
+    return mapping
+
+def lookup_layout(df_columns, tenant=None):
+    """Look up a known export layout, or one learned by ``tenant``, for these CSV headers"""
+    from layout_registry import layout_registry
+    return layout_registry.lookup(list(df_columns), tenant)
+
 def clean_amount_value(value):
     """Clean and convert amount values to float"""
     if pd.isna(value):
@@ -101,211 +261,619 @@ def clean_amount_value(value):
         logging.warning(f"Could not convert amount value: {value}")
         return 0.0
 
+def _strptime_any(str_value):
+    """Try each supported date format in priority order"""
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(str_value, fmt).date()
+        except ValueError:
+            continue
+    return None
+
 def parse_date_value(value):
     """Parse date values with multiple format support"""
     if pd.isna(value):
         return None
     
-    str_value = str(value).strip()
+    parsed = _strptime_any(str(value).strip())
+    if parsed is None:
+        logging.warning(f"Could not parse date value: {value}")
+    return parsed
+
+def infer_date_format(values, sample_size=DATE_SAMPLE_SIZE):
+    """Infer the date format of a column from a sample of its distinct values
+
+    Every format in DATE_FORMATS is scored by how many sampled values it
+    parses and the best one wins, ties going to the earlier format. A single
+    day above 12 in the sample is therefore enough to settle DD/MM vs MM/DD.
+    """
+    sample = values.dropna().astype(str).str.strip()
+    sample = pd.Series(sample[sample != ''].unique()[:sample_size])
+    if sample.empty:
+        return None
     
-    # Common date formats
-    date_formats = [
-        '%Y-%m-%d',
-        '%m/%d/%Y',
-        '%d/%m/%Y',
-        '%Y-%m-%d %H:%M:%S',
-        '%m/%d/%Y %H:%M:%S',
-        '%d-%m-%Y',
-        '%m-%d-%Y',
-        '%d.%m.%Y',
-        '%m.%d.%Y'
-    ]
+    best_format = None
+    best_count = 0
+    for fmt in DATE_FORMATS:
+        count = pd.to_datetime(sample, format=fmt, errors='coerce').notna().sum()
+        if count > best_count:
+            best_format, best_count = fmt, count
     
-    for fmt in date_formats:
-        try:
-            return datetime.strptime(str_value, fmt).date()
-        except ValueError:
-            continue
+    logging.info(f"Inferred date format {best_format} ({best_count}/{len(sample)} sampled values)")
+    return best_format
+
+def _strip_amount_noise(text):
+    """Remove currency markers and whitespace from amount strings"""
+    return text.str.strip().str.replace(AMOUNT_NOISE_PATTERN, '', regex=True)
+
+def infer_decimal_separator(values, sample_size=AMOUNT_SAMPLE_SIZE):
+    """Infer whether an amount column uses '.' or ',' as its decimal separator
+
+    Each sampled value votes by its last separator: one followed by one or
+    two digits, or preceded by the other separator, is the decimal mark.
+    Ambiguous values such as '1,234' do not vote; ties keep '.'.
+    """
+    if pd.api.types.is_numeric_dtype(values):
+        return '.'
     
-    logging.warning(f"Could not parse date value: {value}")
-    return None
+    sample = pd.Series(values.dropna().astype(str).unique()[:sample_size], dtype=object)
+    sample = _strip_amount_noise(sample).str.replace(r'^[(+-]+|[)-]+$', '', regex=True)
+    
+    comma_votes = sample.str.contains(r',\d{1,2}$|\..*,|\d\.\d{3}\.\d{3}').sum()
+    dot_votes = sample.str.contains(r'\.\d{1,2}$|,.*\.|\d,\d{3},\d{3}').sum()
+    
+    return ',' if comma_votes > dot_votes else '.'
+
+def parse_amount_column(values, decimal_separator=None):
+    """Vectorized, locale-aware conversion of an amount column to floats
+
+    Handles currency symbols and codes, '.'/',' decimal conventions,
+    parentheses and trailing-minus negatives. Missing and unparseable values
+    become NaN.
+    """
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        return values.astype(float)
+    
+    if decimal_separator is None:
+        decimal_separator = infer_decimal_separator(values)
+    thousands_separator = '.' if decimal_separator == ',' else ','
+    
+    text = _strip_amount_noise(values.astype(str))
+    
+    # Handle parentheses and trailing minus (negative values)
+    parenthesized = text.str.startswith('(') & text.str.endswith(')')
+    trailing_minus = text.str.endswith('-') & ~text.str.startswith('-')
+    text = text.where(~parenthesized, text.str[1:-1])
+    text = text.where(~trailing_minus, text.str[:-1])
+    
+    text = text.str.replace(thousands_separator, '', regex=False)
+    if decimal_separator != '.':
+        text = text.str.replace(decimal_separator, '.', regex=False)
+    
+    amounts = pd.to_numeric(text, errors='coerce').where(values.notna())
+    return amounts.where(~(parenthesized | trailing_minus), -amounts)
+
+def normalize_amount_column(values, decimal_separator=None):
+    """Convert an amount column to floats (see ``parse_amount_column``), unparseable values becoming 0"""
+    amounts = parse_amount_column(values, decimal_separator)
+    failed = amounts.isna() & values.notna()
+    if failed.any():
+        logging.warning(f"Could not convert {int(failed.sum())} amount values, e.g. {values[failed].iloc[0]}")
+    return amounts.fillna(0.0)
+
+def merge_debit_credit(debit_values, credit_values, decimal_separator=None):
+    """Merge separate debit/credit columns into one signed amount (credit positive)"""
+    if decimal_separator is None:
+        decimal_separator = infer_decimal_separator(pd.concat([debit_values, credit_values]))
+    debits = normalize_amount_column(debit_values, decimal_separator).abs()
+    credits = normalize_amount_column(credit_values, decimal_separator).abs()
+    return credits - debits
+
+def parse_date_series(values, date_format=None):
+    """Parse a date column to datetime64 with a single vectorized pd.to_datetime call
+
+    Uses ``date_format`` or infers one; only values that do not match it
+    fall back to trying each format, once per distinct value. Missing and
+    unparseable values become NaT.
+    """
+    if date_format is None:
+        date_format = infer_date_format(values)
+    
+    text = values.dropna().astype(str).str.strip()
+    if date_format:
+        parsed = pd.to_datetime(text, format=date_format, errors='coerce').dt.normalize()
+    else:
+        parsed = pd.Series(pd.NaT, index=text.index, dtype='datetime64[ns]')
+    
+    dates = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+    dates[parsed.index] = parsed
+    
+    stragglers = text[parsed.isna()]
+    if not stragglers.empty:
+        fallback = {value: _strptime_any(value) for value in stragglers.unique()}
+        dates[stragglers.index] = pd.to_datetime(stragglers.map(fallback), errors='coerce')
+        unparsed = [value for value, date in fallback.items() if date is None]
+        if unparsed:
+            logging.warning(f"Could not parse {len(unparsed)} distinct date values, e.g. {unparsed[0]}")
+    
+    return dates
+
+def parse_date_column(values, date_format=None):
+    """Parse a date column to ``datetime.date`` objects (None when missing), see ``parse_date_series``"""
+    dates = parse_date_series(values, date_format)
+    return dates.dt.date.astype(object).where(dates.notna(), None)
 
-def parse_csv_file(filepath):
-    """Parse CSV file and return standardized transaction data"""
+def clean_text_column(values, default):
+    """Strip a text column and fill missing values with a default"""
+    cleaned = values.astype(str).str.strip().astype(object)
+    return cleaned.where(values.notna(), default)
+
+def resolve_mapping(df, mapping):
+    """Validate a column mapping against a DataFrame and fill in inferred formats
+
+    Columns missing from the file are dropped, and a date format or decimal
+    separator saved with the mapping is kept so re-uploads skip inference.
+    """
+    def mapped(field):
+        col = mapping.get(field)
+        return col if col and col in df.columns else None
+    
+    resolved = {field: mapped(field) for field in ['amount', 'debit', 'credit', 'vendor', 'date', 'category', 'description']}
+    
+    if resolved['debit'] and resolved['credit']:
+        resolved['amount'] = None
+    elif not resolved['amount']:
+        raise ValueError(f"Amount column '{mapping.get('amount')}' not found in CSV file")
+    else:
+        resolved['debit'] = resolved['credit'] = None
+    
+    date_format = mapping.get('date_format')
+    if date_format is None and resolved['date'] is not None:
+        date_format = infer_date_format(df[resolved['date']])
+    resolved['date_format'] = date_format
+    
+    decimal_separator = mapping.get('decimal_separator')
+    if decimal_separator is None:
+        if resolved['amount']:
+            decimal_separator = infer_decimal_separator(df[resolved['amount']])
+        else:
+            decimal_separator = infer_decimal_separator(pd.concat([df[resolved['debit']], df[resolved['credit']]]))
+    resolved['decimal_separator'] = decimal_separator
+    
+    return resolved
+
+def build_transactions(df, mapping, as_frame=False, as_batch=False):
+    """Normalize mapped DataFrame columns into standardized transactions.
+
+    ``mapping`` is a resolved mapping (see ``resolve_mapping``). Works
+    column-at-a-time instead of row-by-row. With ``as_frame=True`` the
+    normalized columns are returned as a DataFrame, and with ``as_batch=True``
+    as a columnar ``TransactionBatch``, instead of a list of dicts.
+    """
+    if mapping.get('debit') and mapping.get('credit'):
+        amounts = merge_debit_credit(df[mapping['debit']], df[mapping['credit']], mapping.get('decimal_separator'))
+    else:
+        amounts = normalize_amount_column(df[mapping['amount']], mapping.get('decimal_separator'))
+    
+    # Skip zero or very small amounts
+    keep = ~(amounts.abs() < 0.01)
+    df = df[keep]
+    index = df.index
+    
+    def optional_column(field, default):
+        col = mapping.get(field)
+        if col is None:
+            return pd.Series([default] * len(index), index=index, dtype=object)
+        return clean_text_column(df[col], default)
+    
+    date_col = mapping.get('date')
+    if date_col is not None:
+        dates = parse_date_series(df[date_col], mapping.get('date_format'))
+    else:
+        dates = pd.Series(pd.NaT, index=index, dtype='datetime64[ns]')
+    
+    frame = pd.DataFrame({
+        'amount': amounts[keep].abs(),  # Use absolute value for spend analysis
+        'vendor': optional_column('vendor', 'Unknown Vendor'),
+        'date': dates,
+        'category': optional_column('category', 'Uncategorized'),
+        'description': optional_column('description', '')
+    }, columns=TRANSACTION_FIELDS).reset_index(drop=True)
+    
+    if as_batch:
+        return TransactionBatch.from_frame(frame)
+    
+    frame['date'] = _date_objects(frame['date'])
+    if as_frame:
+        return frame
+    return frame.to_dict('records')
+
+def _date_objects(dates):
+    """Convert a datetime64 Series to ``datetime.date`` objects, None when missing"""
+    return dates.dt.date.astype(object).where(dates.notna(), None)
+
+def _convert_batch(batch, as_frame=False, as_batch=False):
+    """Return a batch as a list of dicts, a DataFrame or itself, as requested"""
+    if as_batch:
+        return batch
+    if as_frame:
+        frame = batch.to_frame()
+        frame['date'] = _date_objects(frame['date'])
+        return frame
+    return batch.to_records()
+
+def _header_layout(filepath, encoding_info=None, tenant=None):
+    """Known or learned layout for a CSV file's header row, reading only that row"""
+    if encoding_info is None:
+        encoding_info = detect_encoding(filepath)
+    try:
+        columns = pd.read_csv(filepath, encoding=encoding_info['encoding'], nrows=0).columns
+    except UnicodeDecodeError:
+        columns = pd.read_csv(filepath, encoding='latin-1', nrows=0).columns
+    except (ValueError, pd.errors.EmptyDataError):
+        return None
+    return lookup_layout(columns, tenant)
+
+def _lookup_parse_cache(filepath, mapping, encoding_info, tenant=None):
+    """Hash a file and look up an earlier parse of it with the same mapping and layout
+
+    The layout registered for the file's headers is part of the key, so
+    learning or correcting a layout invalidates parses made with the old
+    one. Returns the cache key, the file digest and the cached
+    ``(batch, parse_info)``, which is None on a miss.
+    """
+    layout = _header_layout(filepath, encoding_info, tenant)
+    digest = file_digest(filepath)
+    key = cache_key(digest, {
+        'mapping': mapping or None,
+        'layout': {'fingerprint': layout['fingerprint'], 'mapping': layout['mapping']} if layout else None
+    }, encoding_info)
+    cached = parse_cache.get(key)
+    if cached:
+        logging.info(f"Loaded {len(cached[0])} parsed transactions from cache")
+        cached[1].update(file_sha256=digest, cached=True)
+    return key, digest, cached
+
+def _build_and_cache(df, mapping, parse_info, key, as_frame=False, as_batch=False):
+    """Build transactions, storing them in the parse cache when a key is given"""
+    if key is None:
+        return build_transactions(df, mapping, as_frame=as_frame, as_batch=as_batch)
+    
+    batch = build_transactions(df, mapping, as_batch=True)
+    parse_cache.put(key, batch, parse_info)
+    parse_info['cached'] = False
+    return _convert_batch(batch, as_frame, as_batch)
+
+def _empty_transactions(as_frame=False, as_batch=False):
+    """Empty result in the requested representation"""
+    if as_batch:
+        return TransactionBatch.from_records([])
+    return pd.DataFrame(columns=TRANSACTION_FIELDS) if as_frame else []
+
+def parse_csv_file(filepath, as_frame=False, encoding_info=None, return_info=False, as_batch=False, use_cache=True, tenant=None):
+    """Parse CSV file and return standardized transaction data
+
+    Pass ``as_frame=True`` to get the normalized columns as a DataFrame,
+    ``as_batch=True`` to get a columnar ``TransactionBatch``, and
+    ``return_info=True`` to also get a dict describing how the file was read.
+    Results are cached by file content, so re-parsing an unchanged file is
+    a cache read unless ``use_cache=False``. Layouts learned by ``tenant``
+    are recognized alongside the built-in ones.
+    """
     try:
         logging.info(f"Starting to parse CSV file: {filepath}")
         
-        # Try different encodings
-        encodings = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
-        df = None
+        key = None
+        if use_cache and parse_cache.enabled:
+            key, digest, cached = _lookup_parse_cache(filepath, None, encoding_info, tenant)
+            if cached:
+                transactions = _convert_batch(cached[0], as_frame, as_batch)
+                return (transactions, cached[1]) if return_info else transactions
         
-        for encoding in encodings:
-            try:
-                df = pd.read_csv(filepath, encoding=encoding)
-                logging.info(f"Successfully read CSV with {encoding} encoding")
-                break
-            except UnicodeDecodeError:
-                continue
-        
-        if df is None:
-            raise ValueError("Could not read CSV file with any supported encoding")
+        df, encoding_info = read_csv_file(filepath, encoding_info)
+        logging.info(f"Successfully read CSV with {encoding_info['encoding']} encoding")
+        # The digest identifies the dataset (e.g. for score snapshots) whether or not the cache is on
+        parse_info = {'encoding': encoding_info, 'file_sha256': digest if key else file_digest(filepath)}
         
         if df.empty:
             logging.warning("CSV file is empty")
-            return []
+            empty = _empty_transactions(as_frame, as_batch)
+            return (empty, parse_info) if return_info else empty
         
         logging.info(f"CSV loaded with {len(df)} rows and columns: {list(df.columns)}")
         
-        # Find matching columns
-        vendor_col = find_matching_column(df.columns, 'vendor')
-        amount_col = find_matching_column(df.columns, 'amount')
-        date_col = find_matching_column(df.columns, 'date')
-        category_col = find_matching_column(df.columns, 'category')
-        description_col = find_matching_column(df.columns, 'description')
+        # Known layouts skip heuristic column matching and format inference
+        layout = lookup_layout(df.columns, tenant)
+        parse_info['headers'] = list(df.columns)
+        parse_info['layout'] = {k: layout[k] for k in ['name', 'source', 'fingerprint']} if layout else None
+        
+        if layout:
+            logging.info(f"Recognized {layout['name']} CSV layout")
+            mapping = layout['mapping']
+        else:
+            # Find matching columns
+            mapping = detect_columns(df.columns)
         
-        logging.info(f"Column mapping - Vendor: {vendor_col}, Amount: {amount_col}, Date: {date_col}, Category: {category_col}")
+        logging.info(f"Column mapping - Vendor: {mapping['vendor']}, Amount: {mapping['amount'] or (mapping.get('debit'), mapping.get('credit'))}, Date: {mapping['date']}, Category: {mapping['category']}")
         
-        if not amount_col:
+        if not mapping['amount'] and not mapping.get('debit'):
             raise ValueError("Could not find amount column in CSV file")
         
-        transactions = []
-        
-        for index, row in df.iterrows():
-            try:
-                # Extract and clean data
-                amount = clean_amount_value(row[amount_col]) if amount_col else 0.0
-                
-                # Skip zero or very small amounts
-                if abs(amount) < 0.01:
-                    continue
-                
-                transaction = {
-                    'amount': abs(amount),  # Use absolute value for spend analysis
-                    'vendor': str(row[vendor_col]).strip() if vendor_col is not None and pd.notna(row[vendor_col]) else 'Unknown Vendor',
-                    'date': parse_date_value(row[date_col]) if date_col is not None else None,
-                    'category': str(row[category_col]).strip() if category_col is not None and pd.notna(row[category_col]) else 'Uncategorized',
-                    'description': str(row[description_col]).strip() if description_col is not None and pd.notna(row[description_col]) else ''
-                }
-                
-                transactions.append(transaction)
-                
-            except Exception as e:
-                logging.warning(f"Error processing row {index}: {str(e)}")
-                continue
+        mapping = resolve_mapping(df, mapping)
+        parse_info['mapping'] = mapping
+        
+        transactions = _build_and_cache(df, mapping, parse_info, key, as_frame=as_frame, as_batch=as_batch)
         
         logging.info(f"Successfully parsed {len(transactions)} valid transactions")
         
-        if not transactions:
+        if len(transactions) == 0:
             logging.warning("No valid transactions found after parsing")
         
-        return transactions
+        return (transactions, parse_info) if return_info else transactions
         
     except Exception as e:
         logging.error(f"Error parsing CSV file: {str(e)}")
         raise ValueError(f"Failed to parse CSV file: {str(e)}")
 
-def parse_csv_file_with_mapping(filepath, mapping):
-    """Parse CSV file using provided column mapping"""
+def parse_csv_file_with_mapping(filepath, mapping, as_frame=False, encoding_info=None, return_info=False, as_batch=False, use_cache=True, tenant=None):
+    """Parse CSV file using provided column mapping
+
+    Pass ``as_frame=True`` to get the normalized columns as a DataFrame,
+    ``as_batch=True`` to get a columnar ``TransactionBatch``, and
+    ``return_info=True`` to also get a dict describing how the file was read.
+    Results are cached by file content, so re-parsing an unchanged file is
+    a cache read unless ``use_cache=False``. Layouts learned by ``tenant``
+    are recognized alongside the built-in ones.
+    """
     try:
         logging.info(f"Starting to parse CSV file with mapping: {filepath}")
         
-        # Try different encodings
-        encodings = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
-        df = None
-        
-        for encoding in encodings:
-            try:
-                df = pd.read_csv(filepath, encoding=encoding)
-                logging.info(f"Successfully read CSV with {encoding} encoding")
-                break
-            except UnicodeDecodeError:
-                continue
+        key = None
+        if use_cache and parse_cache.enabled:
+            key, digest, cached = _lookup_parse_cache(filepath, mapping, encoding_info, tenant)
+            if cached:
+                transactions = _convert_batch(cached[0], as_frame, as_batch)
+                return (transactions, cached[1]) if return_info else transactions
         
-        if df is None:
-            raise ValueError("Could not read CSV file with any supported encoding")
+        df, encoding_info = read_csv_file(filepath, encoding_info)
+        logging.info(f"Successfully read CSV with {encoding_info['encoding']} encoding")
+        # The digest identifies the dataset (e.g. for score snapshots) whether or not the cache is on
+        parse_info = {'encoding': encoding_info, 'file_sha256': digest if key else file_digest(filepath)}
         
         if df.empty:
             logging.warning("CSV file is empty")
-            return []
+            empty = _empty_transactions(as_frame, as_batch)
+            return (empty, parse_info) if return_info else empty
         
         logging.info(f"CSV loaded with {len(df)} rows and columns: {list(df.columns)}")
         
         # Use provided mapping
         amount_col = mapping.get('amount')
-        vendor_col = mapping.get('vendor')
-        date_col = mapping.get('date')
-        category_col = mapping.get('category')
-        description_col = mapping.get('description')
-        
-        logging.info(f"Using mapping - Amount: {amount_col}, Vendor: {vendor_col}, Date: {date_col}, Category: {category_col}")
-        
-        if not amount_col:
-            raise ValueError("Amount column must be specified in mapping")
-        
-        if amount_col not in df.columns:
-            raise ValueError(f"Amount column '{amount_col}' not found in CSV file")
-        
-        transactions = []
-        
-        for index, row in df.iterrows():
-            try:
-                # Extract and clean data using mapping
-                amount = clean_amount_value(row[amount_col]) if amount_col else 0.0
-                
-                # Skip zero or very small amounts
-                if abs(amount) < 0.01:
-                    continue
-                
-                transaction = {
-                    'amount': abs(amount),  # Use absolute value for spend analysis
-                    'vendor': str(row[vendor_col]).strip() if vendor_col and vendor_col in df.columns and pd.notna(row[vendor_col]) else 'Unknown Vendor',
-                    'date': parse_date_value(row[date_col]) if date_col and date_col in df.columns else None,
-                    'category': str(row[category_col]).strip() if category_col and category_col in df.columns and pd.notna(row[category_col]) else 'Uncategorized',
-                    'description': str(row[description_col]).strip() if description_col and description_col in df.columns and pd.notna(row[description_col]) else ''
-                }
-                
-                transactions.append(transaction)
-                
-            except Exception as e:
-                logging.warning(f"Error processing row {index}: {str(e)}")
-                continue
+        debit_col = mapping.get('debit')
+        credit_col = mapping.get('credit')
+        
+        logging.info(f"Using mapping - Amount: {amount_col or (debit_col, credit_col)}, Vendor: {mapping.get('vendor')}, Date: {mapping.get('date')}, Category: {mapping.get('category')}")
+        
+        if not amount_col and not (debit_col and credit_col):
+            raise ValueError("Amount column (or debit and credit columns) must be specified in mapping")
+        
+        for col in [amount_col, debit_col, credit_col]:
+            if col and col not in df.columns:
+                raise ValueError(f"Amount column '{col}' not found in CSV file")
+        
+        # Reuse formats saved for this layout when the columns agree
+        layout = lookup_layout(df.columns, tenant)
+        parse_info['headers'] = list(df.columns)
+        parse_info['layout'] = {k: layout[k] for k in ['name', 'source', 'fingerprint']} if layout else None
+        if layout and all(layout['mapping'].get(field) == mapping.get(field) for field in ['amount', 'debit', 'credit', 'date']):
+            mapping = dict(mapping)
+            for field in ['date_format', 'decimal_separator']:
+                if mapping.get(field) is None:
+                    mapping[field] = layout['mapping'].get(field)
+        
+        mapping = resolve_mapping(df, mapping)
+        parse_info['mapping'] = mapping
+        
+        transactions = _build_and_cache(df, mapping, parse_info, key, as_frame=as_frame, as_batch=as_batch)
         
         logging.info(f"Successfully parsed {len(transactions)} valid transactions using mapping")
         
-        if not transactions:
+        if len(transactions) == 0:
             logging.warning("No valid transactions found after parsing with mapping")
         
-        return transactions
+        return (transactions, parse_info) if return_info else transactions
         
     except Exception as e:
         logging.error(f"Error parsing CSV file with mapping: {str(e)}")
         raise ValueError(f"Failed to parse CSV file with mapping: {str(e)}")
 
-def get_transaction_summary(transactions):
-    """Generate summary statistics for transactions"""
-    if not transactions:
-        return {}
+def iter_csv_batches(filepath, mapping=None, chunksize=STREAM_CHUNK_SIZE, as_frame=False, encoding_info=None, as_batch=False, tenant=None):
+    """Stream a CSV file as batches of standardized transactions
+
+    Reads ``chunksize`` rows at a time so peak memory stays bounded by the
+    batch size rather than the file size. Columns are resolved once from the
+    header, using ``mapping`` when given and otherwise a known layout (or
+    one learned by ``tenant``) or auto-detection.
+    """
+    logging.info(f"Starting to stream CSV file: {filepath}")
     
-    total_amount = sum(t['amount'] for t in transactions)
+    # A bad byte past the sniffed prefix cannot be retried once batches have
+    # been yielded, so undecodable bytes are replaced instead
+    if encoding_info is None:
+        encoding_info = detect_encoding(filepath)
+    reader = pd.read_csv(
+        filepath, encoding=encoding_info['encoding'], encoding_errors='replace', chunksize=chunksize
+    )
+    logging.info(f"Streaming CSV with {encoding_info['encoding']} encoding")
     
-    # Category breakdown
-    category_totals = {}
-    for transaction in transactions:
-        category = transaction.get('category', 'Uncategorized')
-        category_totals[category] = category_totals.get(category, 0) + transaction['amount']
+    with reader:
+        yield from _stream_batches(reader, next(reader, None), mapping, as_frame, as_batch, tenant)
+
+def _stream_batches(reader, first_chunk, mapping, as_frame, as_batch, tenant=None):
+    """Resolve columns from the first chunk and normalize every chunk"""
+    if first_chunk is None or first_chunk.empty:
+        logging.warning("CSV file is empty")
+        return
+    
+    if not mapping:
+        layout = lookup_layout(first_chunk.columns, tenant)
+        mapping = layout['mapping'] if layout else detect_columns(first_chunk.columns)
+        if not mapping['amount'] and not mapping.get('debit'):
+            raise ValueError("Could not find amount column in CSV file")
+    
+    # Resolve columns and infer formats once from the first chunk and reuse them for the rest
+    mapping = resolve_mapping(first_chunk, mapping)
+    logging.info(f"Column mapping - {mapping}")
+    
+    total = 0
+    chunk = first_chunk
+    while chunk is not None:
+        batch = build_transactions(chunk, mapping, as_frame=as_frame, as_batch=as_batch)
+        total += len(batch)
+        if len(batch):
+            yield batch
+        chunk = next(reader, None)
     
-    # Vendor breakdown (top 10)
+    logging.info(f"Successfully streamed {total} valid transactions")
+
+def get_transaction_summary(transactions=None, batches=None):
+    """Generate summary statistics for transactions
+
+    Accepts either a list of transactions or an iterable of transaction
+    batches (see ``iter_csv_batches``); batches are folded into running
+    totals so they never need to be held in memory together.
+    """
+    if batches is None:
+        batches = [transactions] if transactions else []
+    
+    total_amount = 0
+    total_transactions = 0
+    category_totals = {}
     vendor_totals = {}
-    for transaction in transactions:
-        vendor = transaction.get('vendor', 'Unknown')
-        vendor_totals[vendor] = vendor_totals.get(vendor, 0) + transaction['amount']
     
+    for batch in batches:
+        if isinstance(batch, TransactionBatch):
+            total_amount += batch.total_amount()
+            total_transactions += len(batch)
+            for field, totals in [('category', category_totals), ('vendor', vendor_totals)]:
+                for name, amount in batch.group_totals(field).items():
+                    totals[name] = totals.get(name, 0) + amount
+            continue
+        
+        for transaction in batch:
+            amount = transaction['amount']
+            total_amount += amount
+            total_transactions += 1
+            
+            # Category breakdown
+            category = transaction.get('category', 'Uncategorized')
+            category_totals[category] = category_totals.get(category, 0) + amount
+            
+            # Vendor breakdown
+            vendor = transaction.get('vendor', 'Unknown')
+            vendor_totals[vendor] = vendor_totals.get(vendor, 0) + amount
+    
+    if not total_transactions:
+        return {}
+    
+    # Top 10 vendors
     top_vendors = sorted(vendor_totals.items(), key=lambda x: x[1], reverse=True)[:10]
     
     return {
-        'total_transactions': len(transactions),
+        'total_transactions': total_transactions,
         'total_amount': total_amount,
-        'average_amount': total_amount / len(transactions),
+        'average_amount': total_amount / total_transactions,
         'category_breakdown': category_totals,
         'top_vendors': top_vendors
     }
+
+def infer_column_type(values):
+    """Infer whether a column holds dates, numbers or text
+
+    Returns the type, the share of non-empty values that fail to parse as
+    that type, and the date format or decimal separator used.
+    """
+    present = values[values.notna() & (values.astype(str).str.strip() != '')]
+    if present.empty:
+        return {'type': 'empty', 'parse_failure_rate': 0.0}
+    
+    date_format = infer_date_format(present)
+    if date_format:
+        parsed = pd.to_datetime(present.astype(str).str.strip(), format=date_format, errors='coerce')
+        failure_rate = float(parsed.isna().mean())
+        if failure_rate <= 1 - TYPE_INFERENCE_THRESHOLD:
+            return {'type': 'date', 'parse_failure_rate': round(failure_rate, 4), 'date_format': date_format}
+    
+    decimal_separator = infer_decimal_separator(present)
+    failure_rate = float(parse_amount_column(present, decimal_separator).isna().mean())
+    if failure_rate <= 1 - TYPE_INFERENCE_THRESHOLD:
+        return {'type': 'number', 'parse_failure_rate': round(failure_rate, 4), 'decimal_separator': decimal_separator}
+    
+    return {'type': 'text', 'parse_failure_rate': 0.0}
+
+def read_csv_head(source, nrows=PREVIEW_ROWS, max_bytes=PREVIEW_BYTES):
+    """Read at most ``nrows`` rows from the first ``max_bytes`` of a CSV file
+
+    ``source`` is a path or a binary file object. A row cut off by the byte
+    limit is dropped. Returns the DataFrame, encoding info and whether the
+    file continues past what was read.
+    """
+    if hasattr(source, 'read'):
+        head = source.read(max_bytes + 1)
+    else:
+        with open(source, 'rb') as f:
+            head = f.read(max_bytes + 1)
+    
+    truncated = len(head) > max_bytes
+    head = head[:max_bytes]
+    encoding_info = sniff_encoding(head)
+    
+    text = codecs.getincrementaldecoder(encoding_info['encoding'])(errors='replace').decode(head, final=not truncated)
+    if truncated:
+        text = text[:text.rfind('\n') + 1]
+    
+    if not text.strip():
+        return pd.DataFrame(), encoding_info, False
+    
+    df = pd.read_csv(io.StringIO(text), nrows=nrows)
+    return df, encoding_info, truncated or len(df) >= nrows
+
+def preview_csv(source, nrows=PREVIEW_ROWS, max_bytes=PREVIEW_BYTES, tenant=None):
+    """Describe the head of a CSV file for interactive column mapping
+
+    Reads only a bounded prefix of the file and returns its headers, a
+    suggested mapping, per-column types with null and parse-failure rates,
+    and a few sample rows. Layouts learned by ``tenant`` shape the suggestion.
+    """
+    try:
+        df, encoding_info, truncated = read_csv_head(source, nrows, max_bytes)
+        
+        if df.empty and len(df.columns) == 0:
+            raise ValueError("CSV file is empty")
+        
+        layout = lookup_layout(df.columns, tenant)
+        mapping = dict(layout['mapping']) if layout else detect_columns(df.columns)
+        
+        columns = []
+        for col in df.columns:
+            values = df[col]
+            column_info = {'name': str(col), 'null_rate': round(float(values.isna().mean()), 4) if len(values) else 0.0}
+            column_info.update(infer_column_type(values))
+            columns.append(column_info)
+        
+        sample_rows = df.head(PREVIEW_SAMPLE_ROWS).astype(object).where(df.head(PREVIEW_SAMPLE_ROWS).notna(), None)
+        
+        return {
+            'headers': [str(col) for col in df.columns],
+            'suggested_mapping': mapping,
+            'columns': columns,
+            'encoding': encoding_info,
+            'layout': {k: layout[k] for k in ['name', 'source', 'fingerprint']} if layout else None,
+            'sample_rows': sample_rows.to_dict('records'),
+            'rows_sampled': len(df),
+            'truncated': truncated
+        }
+        
+    except Exception as e:
+        logging.error(f"Error previewing CSV file: {str(e)}")
+        raise ValueError(f"Failed to preview CSV file: {str(e)}")
@@ -0,0 +1,170 @@
+"""
+VeroctaAI Duplicate Detector
+Exact and near-duplicate expenses found with a hash join and a sorted date-window scan
+"""
+
+import numpy as np
+import pandas as pd
+from typing import Dict, Any, List
+
+from transaction_batch import TransactionBatch
+from subscription_detector import CADENCE_TOLERANCE, MIN_REGULAR_SHARE, interval_medians
+
+# Charges from the same vendor at most this many days after a group's first charge are near-duplicates
+NEAR_DUPLICATE_WINDOW_DAYS = 3
+
+# Largest difference from a group's first amount a near-duplicate may have, in currency units (49.99 matches 50.00)
+AMOUNT_TOLERANCE = 1.0
+
+# Fewest repeats of a vendor and amount that establish a regular cadence (a daily coffee, a weekly delivery)
+MIN_CADENCE_CHARGES = 4
+
+# Groups listed in the result, largest at-risk amount first, and transaction indices listed per group
+DUPLICATE_GROUP_LIMIT = 20
+GROUP_INDEX_LIMIT = 10
+
+
+def _anchored_groups(linked: np.ndarray, days: np.ndarray, cents: np.ndarray,
+                     window_days: int, tolerance: int) -> List[List[int]]:
+    """Split runs of linked positions into groups measured from each group's first charge
+
+    A position joins the open group while it is within ``window_days`` and
+    ``tolerance`` cents of the group's first charge; otherwise it starts the
+    next group. Only positions inside runs are visited.
+    """
+    edges = np.diff(np.concatenate([[0], linked.astype(np.int8), [0]]))
+    run_starts = np.flatnonzero(edges == 1) - 1
+    run_ends = np.flatnonzero(edges == -1) - 1
+
+    groups = []
+    for run_start, run_end in zip(run_starts.tolist(), run_ends.tolist()):
+        run_days = days[run_start:run_end + 1].tolist()
+        run_cents = cents[run_start:run_end + 1].tolist()
+        members = [0]
+        for offset in range(1, len(run_days)):
+            anchor = members[0]
+            if run_days[offset] - run_days[anchor] <= window_days and abs(run_cents[offset] - run_cents[anchor]) <= tolerance:
+                members.append(offset)
+                continue
+            if len(members) > 1:
+                groups.append([run_start + member for member in members])
+            members = [offset]
+        if len(members) > 1:
+            groups.append([run_start + member for member in members])
+    return groups
+
+
+def detect_duplicates(batch: TransactionBatch, window_days: int = NEAR_DUPLICATE_WINDOW_DAYS,
+                      amount_tolerance: float = AMOUNT_TOLERANCE, limit: int = DUPLICATE_GROUP_LIMIT) -> Dict[str, Any]:
+    """Group dated, non-zero transactions that look like the same expense recorded twice
+
+    Exact duplicates share vendor, amount (to the cent) and date, and are
+    found by hashing that key. The first transaction of each exact key then
+    takes part in the near-duplicate scan. Each vendor's charges are split
+    into amount series where sorted amounts jump by more than
+    ``amount_tolerance``, and each series is scanned in date order: a group
+    holds the charges at most ``window_days`` after, and within
+    ``amount_tolerance`` of, its first charge. Series that recur on a
+    regular cadence, found from their median interval as
+    subscription_detector does, only group charges that arrive well ahead
+    of that cadence, so 30 daily coffees are not one group. Every charge
+    after the first of a group is at risk; exact extras are left out of the
+    near scan, so no charge is counted twice. Hashing is linear and the
+    sorts are O(n log n).
+    """
+    result = {
+        'count': 0, 'exact_groups': 0, 'near_groups': 0,
+        'duplicate_transactions': 0, 'at_risk_amount': 0.0, 'groups': []
+    }
+
+    dated = np.flatnonzero(~np.isnat(batch.dates) & (batch.amounts != 0))
+    if len(dated) < 2:
+        return result
+
+    vendors = batch.vendor_codes[dated]
+    cents = np.round(batch.amounts[dated] * 100).astype(np.int64)
+    days = batch.dates[dated].astype(np.int64)
+    amounts = np.abs(batch.amounts[dated])
+
+    # Exact duplicates: hash join on (vendor, cents, day)
+    keys = pd.DataFrame({'vendor': vendors, 'cents': cents, 'day': days})
+    exact_ids = keys.groupby(['vendor', 'cents', 'day'], sort=False).ngroup().to_numpy()
+    exact_sizes = np.bincount(exact_ids)
+    first_of_key = ~keys.duplicated().to_numpy()
+
+    # Near duplicates: one transaction per exact key, split into amount series per vendor and sign
+    representatives = np.flatnonzero(first_of_key)
+    tolerance = int(round(amount_tolerance * 100))
+    by_amount = representatives[np.lexsort((cents[representatives], vendors[representatives]))]
+    new_series = np.ones(len(by_amount), dtype=bool)
+    new_series[1:] = ((vendors[by_amount][1:] != vendors[by_amount][:-1]) | (np.diff(cents[by_amount]) > tolerance) |
+                      (np.sign(cents[by_amount][1:]) != np.sign(cents[by_amount][:-1])))
+    series = np.empty(len(cents), dtype=np.int64)
+    series[by_amount] = np.cumsum(new_series) - 1
+    num_series = int(new_series.sum())
+
+    # Each series in date order, with its median interval and how regularly it recurs
+    order = representatives[np.lexsort((days[representatives], series[representatives]))]
+    sorted_series = series[order]
+    sorted_days = days[order]
+    interval_groups, intervals, interval_counts, median_interval = interval_medians(sorted_series, sorted_days, num_series)
+    on_cadence = np.abs(intervals - median_interval[interval_groups]) <= CADENCE_TOLERANCE * median_interval[interval_groups]
+    regular_share = np.bincount(interval_groups, weights=on_cadence, minlength=num_series) / np.maximum(interval_counts, 1)
+    regular = (interval_counts + 1 >= MIN_CADENCE_CHARGES) & (median_interval >= 1) & (regular_share >= MIN_REGULAR_SHARE)
+
+    # A charge links to the previous one of its series within the window, or well ahead of a regular cadence
+    gaps = np.diff(sorted_days)
+    follows = sorted_series[1:]
+    linked = np.zeros(len(order), dtype=bool)
+    linked[1:] = ((follows == sorted_series[:-1]) & (gaps <= window_days) &
+                  (~regular[follows] | (gaps < (1 - CADENCE_TOLERANCE) * median_interval[follows])))
+    near_members = [order[positions] for positions in _anchored_groups(linked, sorted_days, cents[order], window_days, tolerance)]
+
+    groups = []
+
+    exact_groups = np.flatnonzero(exact_sizes > 1)
+    exact_first = np.empty(len(exact_sizes), dtype=np.intp)
+    exact_first[exact_ids[representatives]] = representatives
+    exact_at_risk = amounts[exact_first[exact_groups]] * (exact_sizes[exact_groups] - 1)
+    for group, at_risk in zip(exact_groups.tolist(), exact_at_risk.tolist()):
+        groups.append(('exact', at_risk, group))
+
+    near_sizes = np.array([len(members) for members in near_members], dtype=np.int64)
+    near_at_risk = np.array([amounts[members[1:]].sum() for members in near_members])
+    for group, at_risk in enumerate(near_at_risk.tolist()):
+        groups.append(('near', at_risk, group))
+
+    result['exact_groups'] = int(len(exact_groups))
+    result['near_groups'] = len(near_members)
+    result['count'] = len(groups)
+    result['duplicate_transactions'] = int((exact_sizes[exact_groups] - 1).sum() + (near_sizes - 1).sum())
+    result['at_risk_amount'] = round(float(exact_at_risk.sum() + near_at_risk.sum()), 2)
+    if not groups:
+        return result
+
+    # Members of the listed groups, in date order
+    groups.sort(key=lambda group: group[1], reverse=True)
+    groups = groups[:limit]
+    exact_members = {group: [] for kind, _, group in groups if kind == 'exact'}
+    if exact_members:
+        for position in np.flatnonzero(np.isin(exact_ids, list(exact_members))).tolist():
+            exact_members[exact_ids[position]].append(position)
+
+    for kind, at_risk, group in groups:
+        if kind == 'exact':
+            members = np.array(exact_members[group])
+        else:
+            members = near_members[group]
+        first = dated[members[0]]
+        result['groups'].append({
+            'type': kind,
+            'vendor': str(batch.vendor_names[batch.vendor_codes[first]]),
+            'amount': round(float(batch.amounts[first]), 2),
+            'first_date': str(batch.dates[first]),
+            'last_date': str(batch.dates[dated[members[-1]]]),
+            'transactions': int(len(members)),
+            'total_amount': round(float(amounts[members].sum()), 2),
+            'at_risk_amount': round(float(at_risk), 2),
+            'indices': dated[members[:GROUP_INDEX_LIMIT]].tolist()
+        })
+    return result
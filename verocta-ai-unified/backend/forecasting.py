@@ -0,0 +1,139 @@
+"""
+VeroctaAI Spend Forecasting
+Next-quarter spend per category from Holt and Holt-Winters smoothing fitted to every category at once
+"""
+
+import numpy as np
+from typing import Dict, Any, Tuple
+
+from transaction_batch import TransactionBatch
+
+# Months projected (one quarter) and the fewest months of history to project from
+FORECAST_HORIZON = 3
+MIN_HISTORY_MONTHS = 3
+
+# Seasonal (Holt-Winters) models need two full years of history
+SEASON_LENGTH = 12
+
+# Candidate level and trend smoothing factors; each category keeps the pair with the lowest one-step error
+LEVEL_SMOOTHING = (0.2, 0.4, 0.6, 0.8)
+TREND_SMOOTHING = (0.05, 0.1, 0.2, 0.4)
+SEASONAL_SMOOTHING = 0.1
+
+# Categories listed in the result, largest projected spend first
+FORECAST_CATEGORY_LIMIT = 20
+
+
+def _smoothing_grid() -> Tuple[np.ndarray, np.ndarray]:
+    alphas, betas = np.meshgrid(LEVEL_SMOOTHING, TREND_SMOOTHING, indexing='ij')
+    return alphas.reshape(-1, 1), betas.reshape(-1, 1)
+
+
+def holt_forecast(series: np.ndarray, horizon: int = FORECAST_HORIZON) -> np.ndarray:
+    """Holt linear-trend forecasts of each row of a 2-D array of evenly spaced values
+
+    Every candidate (alpha, beta) pair is run over every row in the same
+    pass, one time step at a time, so the work is vectorized across both;
+    each row is then forecast with the pair that had the lowest squared
+    one-step error.
+    """
+    alphas, betas = _smoothing_grid()
+    rows, length = series.shape
+    level = np.broadcast_to(series[:, 0], (len(alphas), rows)).copy()
+    trend = np.broadcast_to(series[:, 1] - series[:, 0], (len(alphas), rows)).copy()
+    errors = np.zeros((len(alphas), rows))
+
+    for t in range(1, length):
+        observed = series[:, t]
+        errors += (observed - (level + trend)) ** 2
+        new_level = alphas * observed + (1 - alphas) * (level + trend)
+        trend = betas * (new_level - level) + (1 - betas) * trend
+        level = new_level
+
+    best = np.argmin(errors, axis=0)
+    columns = np.arange(rows)
+    steps = np.arange(1, horizon + 1)
+    return level[best, columns][:, None] + trend[best, columns][:, None] * steps[None, :]
+
+
+def holt_winters_forecast(series: np.ndarray, horizon: int = FORECAST_HORIZON,
+                          season_length: int = SEASON_LENGTH) -> np.ndarray:
+    """Additive Holt-Winters forecasts of each row, seeded from the first two seasons"""
+    alphas, betas = _smoothing_grid()
+    rows, length = series.shape
+    first, second = series[:, :season_length], series[:, season_length:2 * season_length]
+    seasonal_means = (first.mean(axis=1) + second.mean(axis=1)) / 2
+
+    initial_trend = (second.mean(axis=1) - first.mean(axis=1)) / season_length
+
+    # Seasonal offsets: the two seasons' average shape with the within-season trend removed
+    offsets = (first + second) / 2 - seasonal_means[:, None]
+    offsets -= initial_trend[:, None] * (np.arange(season_length) - (season_length - 1) / 2)[None, :]
+
+    level = np.broadcast_to(first.mean(axis=1) - initial_trend * (season_length - 1) / 2, (len(alphas), rows)).copy()
+    trend = np.broadcast_to(initial_trend, (len(alphas), rows)).copy()
+    seasonal = np.broadcast_to(offsets.T[:, None, :], (season_length, len(alphas), rows)).copy()
+    errors = np.zeros((len(alphas), rows))
+
+    for t in range(length):
+        observed = series[:, t]
+        season = seasonal[t % season_length]
+        errors += (observed - (level + trend + season)) ** 2
+        new_level = alphas * (observed - season) + (1 - alphas) * (level + trend)
+        trend = betas * (new_level - level) + (1 - betas) * trend
+        seasonal[t % season_length] = SEASONAL_SMOOTHING * (observed - new_level) + (1 - SEASONAL_SMOOTHING) * season
+        level = new_level
+
+    best = np.argmin(errors, axis=0)
+    columns = np.arange(rows)
+    steps = np.arange(1, horizon + 1)
+    future_seasons = seasonal[(length + steps - 1) % season_length][:, best, columns].T
+    return level[best, columns][:, None] + trend[best, columns][:, None] * steps[None, :] + future_seasons
+
+
+def forecast_spending(batch: TransactionBatch, horizon: int = FORECAST_HORIZON,
+                      limit: int = FORECAST_CATEGORY_LIMIT) -> Dict[str, Any]:
+    """Project each category's spend for the next ``horizon`` months
+
+    Categories are fitted together as one categories x months array of the
+    same monthly spend buckets the trend chart plots (absolute amounts,
+    dated transactions only). With two years of history the model is
+    additive Holt-Winters; otherwise Holt's linear trend. Projections are
+    floored at zero, and the total is the sum of the category projections.
+    """
+    names, months, totals = batch.group_month_totals('category', absolute=True)
+    result = {
+        'method': None, 'horizon_months': horizon, 'history_months': int(len(months)), 'months': [],
+        'total': {'monthly': [], 'next_quarter': 0.0, 'last_quarter': 0.0}, 'categories': []
+    }
+    active = totals.sum(axis=1) > 0
+    if len(months) < MIN_HISTORY_MONTHS or not active.any():
+        return result
+
+    names, totals = names[active], totals[active]
+    if len(months) >= 2 * SEASON_LENGTH:
+        result['method'] = 'holt_winters'
+        projected = holt_winters_forecast(totals, horizon)
+    else:
+        result['method'] = 'holt'
+        projected = holt_forecast(totals, horizon)
+    projected = np.maximum(projected, 0)
+
+    next_quarter = projected.sum(axis=1)
+    last_quarter = totals[:, -horizon:].sum(axis=1)
+    result['months'] = (months[-1] + np.arange(1, horizon + 1)).astype(str).tolist()
+    result['total'] = {
+        'monthly': np.round(projected.sum(axis=0), 2).tolist(),
+        'next_quarter': round(float(next_quarter.sum()), 2),
+        'last_quarter': round(float(last_quarter.sum()), 2)
+    }
+
+    for row in np.argsort(-next_quarter, kind='stable')[:limit].tolist():
+        result['categories'].append({
+            'category': str(names[row]),
+            'monthly': np.round(projected[row], 2).tolist(),
+            'next_quarter': round(float(next_quarter[row]), 2),
+            'last_quarter': round(float(last_quarter[row]), 2),
+            'change_percent': round(float((next_quarter[row] - last_quarter[row]) / last_quarter[row] * 100), 1) if last_quarter[row] > 0 else None
+        })
+    return result
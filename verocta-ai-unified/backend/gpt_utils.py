@@ -3,6 +3,8 @@ import os
 import logging
 from openai import OpenAI
 
+from analysis_context import AnalysisContext
+
 # Initialize OpenAI client
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
@@ -40,56 +42,46 @@ def load_prompt_template():
         and vendor optimization based on the actual data provided.
         """
 
-def format_transactions_for_gpt(transactions):
-    """Enhanced format transaction data for GPT analysis with detailed insights"""
-    if not transactions:
+def format_transactions_for_gpt(transactions, context=None):
+    """Enhanced format transaction data for GPT analysis with detailed insights
+
+    Accepts a list of transaction dicts or a ``TransactionBatch``; pass a
+    shared ``AnalysisContext`` to reuse its aggregates.
+    """
+    if context is None:
+        if transactions is None or len(transactions) == 0:
+            return "No transaction data available."
+        context = AnalysisContext(transactions)
+    if len(context) == 0:
         return "No transaction data available."
     
+    batch = context.batch
+    
     # Create comprehensive statistics
-    total_amount = sum(t['amount'] for t in transactions)
-    avg_amount = total_amount / len(transactions)
+    total_amount = context.total_amount
+    avg_amount = context.mean_amount
     
     # Enhanced breakdowns
-    categories = {}
-    vendors = {}
-    vendor_frequency = {}
-    monthly_patterns = {}
-    
-    for transaction in transactions:
-        category = transaction.get('category', 'Uncategorized')
-        vendor = transaction.get('vendor', 'Unknown')
-        amount = transaction.get('amount', 0)
-        date = transaction.get('date')
-        
-        # Category and vendor tracking
-        categories[category] = categories.get(category, 0) + amount
-        vendors[vendor] = vendors.get(vendor, 0) + amount
-        vendor_frequency[vendor] = vendor_frequency.get(vendor, 0) + 1
-        
-        # Monthly pattern analysis
-        if date:
-            month_key = date.strftime('%Y-%m') if hasattr(date, 'strftime') else str(date)[:7]
-            monthly_patterns[month_key] = monthly_patterns.get(month_key, 0) + amount
+    categories = context.category_totals
+    category_counts = context.category_counts
+    vendors = context.vendor_totals
+    vendor_frequency = context.vendor_counts
+    monthly_patterns = context.monthly_totals
     
     # Sort by amount and identify patterns
     top_categories = sorted(categories.items(), key=lambda x: x[1], reverse=True)[:10]
     top_vendors = sorted(vendors.items(), key=lambda x: x[1], reverse=True)[:15]
     frequent_vendors = sorted(vendor_frequency.items(), key=lambda x: x[1], reverse=True)[:10]
     
-    # Identify recurring subscriptions (vendors with regular amounts)
-    likely_subscriptions = []
-    for vendor, total_spent in top_vendors[:10]:
-        frequency = vendor_frequency.get(vendor, 0)
-        if frequency >= 2:  # Appears multiple times
-            avg_per_transaction = total_spent / frequency
-            likely_subscriptions.append((vendor, total_spent, frequency, avg_per_transaction))
+    # Recurring subscriptions: vendors charged at a regular cadence with a stable amount
+    subscriptions = context.subscriptions
     
     # Format enhanced data for GPT
     formatted_data = f"""
     ENHANCED FINANCIAL DATA ANALYSIS REQUEST
     
     Executive Summary:
-    - Total Transactions: {len(transactions):,}
+    - Total Transactions: {len(batch):,}
     - Total Amount: ${total_amount:,.2f}
     - Average Transaction: ${avg_amount:,.2f}
     - Unique Vendors: {len(vendors)}
@@ -100,7 +92,7 @@ def format_transactions_for_gpt(transactions):
     
     for category, amount in top_categories:
         percentage = (amount / total_amount) * 100
-        transaction_count = sum(1 for t in transactions if t.get('category') == category)
+        transaction_count = category_counts.get(category, 0)
         avg_per_category = amount / transaction_count if transaction_count > 0 else 0
         formatted_data += f"- {category}: ${amount:,.2f} ({percentage:.1f}%) | {transaction_count} transactions | Avg: ${avg_per_category:,.2f}\n"
     
@@ -111,18 +103,28 @@ def format_transactions_for_gpt(transactions):
         formatted_data += f"- {vendor}: ${amount:,.2f} ({percentage:.1f}%) | {frequency} transactions\n"
     
     # Add subscription analysis
-    if likely_subscriptions:
-        formatted_data += "\nLikely Recurring Subscriptions/Services:\n"
-        for vendor, total, freq, avg in likely_subscriptions:
-            formatted_data += f"- {vendor}: ${avg:,.2f}/transaction × {freq} times = ${total:,.2f} total\n"
-    
-    # Add outlier analysis
-    high_value_threshold = avg_amount * 3  # Transactions 3x above average
-    outliers = [t for t in transactions if t.get('amount', 0) > high_value_threshold]
-    if outliers:
-        formatted_data += f"\nHigh-Value Outliers (>${high_value_threshold:,.2f}+):\n"
-        for transaction in sorted(outliers, key=lambda x: x.get('amount', 0), reverse=True)[:5]:
-            formatted_data += f"- {transaction.get('vendor', 'Unknown')}: ${transaction.get('amount', 0):,.2f} ({transaction.get('category', 'Uncategorized')})\n"
+    if subscriptions['subscriptions']:
+        formatted_data += f"\nRecurring Subscriptions/Services ({subscriptions['count']}, ${subscriptions['annualized_cost']:,.2f}/year projected):\n"
+        for subscription in subscriptions['subscriptions'][:15]:
+            formatted_data += (f"- {subscription['vendor']}: ${subscription['average_amount']:,.2f} {subscription['cadence']} × "
+                               f"{subscription['charges']} charges | ${subscription['annualized_cost']:,.2f}/year | last {subscription['last_charge']}\n")
+    
+    # Add duplicate expense analysis
+    duplicates = context.duplicates
+    if duplicates['groups']:
+        formatted_data += (f"\nPossible Duplicate Expenses ({duplicates['count']} groups, "
+                           f"${duplicates['at_risk_amount']:,.2f} at risk):\n")
+        for group in duplicates['groups'][:10]:
+            formatted_data += (f"- {group['vendor']}: {group['transactions']} × ~${abs(group['amount']):,.2f} "
+                               f"({group['type']}, {group['first_date']} to {group['last_date']}) | ${group['at_risk_amount']:,.2f} at risk\n")
+    
+    # Add spending spikes: amounts far above their own vendor's or category's typical amount
+    anomalies = context.anomalies
+    if anomalies['spikes']:
+        formatted_data += f"\nSpending Spikes ({anomalies['count']} transactions, ${anomalies['flagged_amount']:,.2f}):\n"
+        for spike in anomalies['spikes'][:5]:
+            formatted_data += (f"- {spike['vendor']}: ${spike['amount']:,.2f} ({spike['category']}) | "
+                               f"typical {spike['segment']} amount ${spike['typical_amount']:,.2f}\n")
     
     # Monthly spending patterns
     if len(monthly_patterns) > 1:
@@ -130,9 +132,18 @@ def format_transactions_for_gpt(transactions):
         for month, amount in sorted(monthly_patterns.items())[-6:]:  # Last 6 months
             formatted_data += f"- {month}: ${amount:,.2f}\n"
     
+    # Projected spend for the next quarter
+    forecast = context.forecast
+    if forecast['categories']:
+        formatted_data += (f"\nProjected Next Quarter ({forecast['months'][0]} to {forecast['months'][-1]}): "
+                           f"${forecast['total']['next_quarter']:,.2f} vs ${forecast['total']['last_quarter']:,.2f} last quarter\n")
+        for category in forecast['categories'][:10]:
+            change = f"{category['change_percent']:+.1f}%" if category['change_percent'] is not None else "new"
+            formatted_data += f"- {category['category']}: ${category['next_quarter']:,.2f} ({change})\n"
+    
     return formatted_data
 
-def generate_financial_insights(transactions):
+def generate_financial_insights(transactions, context=None):
     """Generate AI-powered financial insights using GPT-4o"""
     if not openai_client:
         logging.error("OpenAI client not initialized - API key missing")
@@ -144,7 +155,7 @@ def generate_financial_insights(transactions):
     
     try:
         prompt_template = load_prompt_template()
-        transaction_data = format_transactions_for_gpt(transactions)
+        transaction_data = format_transactions_for_gpt(transactions, context=context)
         
         full_prompt = f"{prompt_template}\n\nTRANSACTION DATA:\n{transaction_data}"
         
@@ -0,0 +1,194 @@
+"""
+VeroctaAI Layout Registry
+Remembers column mappings for known bank/accounting CSV export layouts
+"""
+
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+from csv_parser import normalize_header
+
+# Learned layouts are kept per tenant, one JSON file each
+LAYOUT_REGISTRY_DIR = os.environ.get('LAYOUT_REGISTRY_DIR', os.path.join('cache', 'layouts'))
+
+# Mapping keys that name a column (stored by header position)
+COLUMN_FIELDS = ['amount', 'debit', 'credit', 'vendor', 'date', 'category', 'description']
+
+# Mapping keys that carry inferred formats
+FORMAT_FIELDS = ['date_format', 'decimal_separator']
+
+# Built-in layouts for the export formats advertised in /api/docs
+KNOWN_LAYOUTS = {
+    'QuickBooks': {
+        'headers': ['Date', 'Transaction Type', 'Num', 'Name', 'Memo/Description', 'Account', 'Split', 'Amount'],
+        'mapping': {
+            'amount': 'Amount', 'vendor': 'Name', 'date': 'Date', 'category': 'Account',
+            'description': 'Memo/Description', 'date_format': '%m/%d/%Y', 'decimal_separator': '.'
+        }
+    },
+    'Xero': {
+        # Xero's statement format is locale dependent, so dates are still inferred
+        'headers': ['*Date', '*Amount', 'Payee', 'Description', 'Reference', 'Check Number'],
+        'mapping': {
+            'amount': '*Amount', 'vendor': 'Payee', 'date': '*Date', 'category': None,
+            'description': 'Description', 'date_format': None, 'decimal_separator': '.'
+        }
+    },
+    'Wave': {
+        'headers': [
+            'Transaction ID', 'Transaction Date', 'Account Name', 'Transaction Description',
+            'Transaction Line Description', 'Amount (One column)', 'Debit Amount (Two Column Approach)',
+            'Credit Amount (Two Column Approach)', 'Other Accounts for this Transaction', 'Customer', 'Vendor',
+            'Invoice Number', 'Bill Number', 'Notes / Memo', 'Amount Before Sales Tax', 'Sales Tax Amount',
+            'Sales Tax Name', 'Transaction Date Added', 'Transaction Date Last Modified', 'Account Group',
+            'Account Type', 'Account ID'
+        ],
+        'mapping': {
+            'amount': 'Amount (One column)', 'vendor': 'Vendor', 'date': 'Transaction Date',
+            'category': 'Account Name', 'description': 'Transaction Description',
+            'date_format': '%Y-%m-%d', 'decimal_separator': '.'
+        }
+    },
+    'Revolut': {
+        'headers': ['Type', 'Product', 'Started Date', 'Completed Date', 'Description', 'Amount', 'Fee', 'Currency', 'State', 'Balance'],
+        'mapping': {
+            'amount': 'Amount', 'vendor': 'Description', 'date': 'Completed Date', 'category': 'Type',
+            'description': 'Description', 'date_format': '%Y-%m-%d %H:%M:%S', 'decimal_separator': '.'
+        }
+    }
+}
+
+
+def fingerprint_headers(headers: List[Any]) -> str:
+    """Hash the normalized, ordered header tuple of a CSV file"""
+    normalized = '\x1f'.join(normalize_header(str(header)) for header in headers)
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+class LayoutRegistry:
+    """Fingerprint-keyed store of column mappings for known CSV layouts
+
+    Columns are stored by header position so a layout matches any file whose
+    headers normalize to the same tuple. Built-in layouts apply to everyone;
+    learned layouts belong to the tenant that taught them and are persisted
+    to that tenant's JSON file, shared by all workers.
+    """
+
+    def __init__(self, directory: str = LAYOUT_REGISTRY_DIR):
+        self.directory = directory
+        self.builtin = {}
+        self.learned = {}
+        self._loaded_mtimes = {}
+        self._lock = threading.RLock()
+
+        for name, layout in KNOWN_LAYOUTS.items():
+            self.builtin[fingerprint_headers(layout['headers'])] = self._entry(layout['headers'], layout['mapping'], name, 'builtin')
+
+    @staticmethod
+    def _entry(headers: List[Any], mapping: Dict[str, Any], name: str, source: str) -> Dict[str, Any]:
+        """A stored mapping, with column names converted to header positions"""
+        positions = {str(header): i for i, header in enumerate(headers)}
+        return {
+            'name': name,
+            'source': source,
+            'headers': [normalize_header(str(header)) for header in headers],
+            'columns': {field: positions.get(str(mapping.get(field))) for field in COLUMN_FIELDS},
+            'formats': {field: mapping.get(field) for field in FORMAT_FIELDS},
+            'updated_at': datetime.now().isoformat()
+        }
+
+    def _path(self, tenant: str) -> str:
+        return os.path.join(self.directory, f"{re.sub(r'[^A-Za-z0-9_.-]', '_', str(tenant))}.json")
+
+    def _reload(self, tenant: str):
+        """Load a tenant's learned layouts if their file changed since the last load"""
+        path = self._path(tenant)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return
+        if mtime == self._loaded_mtimes.get(tenant):
+            return
+
+        try:
+            with open(path, 'r') as f:
+                learned = json.load(f)
+            with self._lock:
+                self.learned.setdefault(tenant, {}).update(learned)
+                self._loaded_mtimes[tenant] = mtime
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not load learned layouts for {tenant}: {str(e)}")
+
+    def _save(self, tenant: str):
+        """Atomically persist a tenant's learned layouts"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(tenant)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.learned.get(tenant, {}), f, indent=2)
+        os.replace(tmp_path, path)
+        self._loaded_mtimes[tenant] = os.path.getmtime(path)
+
+    def lookup(self, headers: List[Any], tenant: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Return the built-in or tenant-learned layout for these headers, with the mapping in terms of their names
+
+        Without a tenant (anonymous uploads) only built-in layouts match.
+        """
+        fingerprint = fingerprint_headers(headers)
+        entry = self.builtin.get(fingerprint)
+        if entry is None and tenant:
+            # Layouts learned or corrected in other workers take effect immediately
+            self._reload(tenant)
+            entry = self.learned.get(tenant, {}).get(fingerprint)
+        if entry is None:
+            return None
+
+        headers = list(headers)
+        mapping = {
+            field: headers[position] if position is not None else None
+            for field, position in entry['columns'].items()
+        }
+        mapping.update(entry['formats'])
+
+        return {
+            'name': entry['name'],
+            'source': entry['source'],
+            'fingerprint': fingerprint,
+            'mapping': mapping
+        }
+
+    def learn(self, headers: List[Any], mapping: Dict[str, Any], tenant: str, name: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Remember a successful mapping for this header layout for one tenant
+
+        Built-in layouts are never overwritten, and the file is not rewritten
+        when the tenant's stored mapping is unchanged.
+        """
+        fingerprint = fingerprint_headers(headers)
+        if fingerprint in self.builtin:
+            return self.builtin[fingerprint]
+
+        try:
+            with self._lock:
+                # Pick up layouts learned by other workers so saving does not drop them
+                self._reload(tenant)
+                learned = self.learned.setdefault(tenant, {})
+                existing = learned.get(fingerprint)
+                entry = self._entry(headers, mapping, name or (existing or {}).get('name') or 'Custom layout', 'learned')
+                if existing and all(existing[field] == entry[field] for field in ('name', 'headers', 'columns', 'formats')):
+                    return existing
+                learned[fingerprint] = entry
+                self._save(tenant)
+            logging.info(f"Learned CSV layout {fingerprint[:12]} ({entry['name']}) for {tenant}")
+            return entry
+        except OSError as e:
+            logging.warning(f"Could not save learned layouts for {tenant}: {str(e)}")
+            return None
+
+
+layout_registry = LayoutRegistry()
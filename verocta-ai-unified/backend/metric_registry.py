@@ -0,0 +1,183 @@
+"""
+VeroctaAI Metric Registry
+Pluggable SpendScore metrics computed from shared columnar inputs
+"""
+
+import os
+import json
+import logging
+from typing import List, Dict, Any, Callable, Iterable, Optional, Tuple, Union
+
+# Columns every engine provides to metrics, one value per transaction (or per category for names)
+COLUMNS = ('amounts', 'dates', 'vendor_codes', 'category_codes', 'category_names')
+
+# Amount statistics every engine provides, exact or sketched depending on its quantile mode
+ENGINE_INPUTS = ('median', 'quartiles')
+
+
+class SpendMetric:
+    """A SpendScore metric computed from arrays
+
+    ``requires`` names the columns, engine inputs and registered
+    precomputations the metric reads; the engine computes each of them once
+    per dataset and shares it with every other metric that needs it.
+    ``compute`` takes a MetricInputs and returns a 0-100 score; ``fallback``
+    is scored instead if it raises.
+    """
+
+    def __init__(self, name: str, compute: Callable[['MetricInputs'], float], weight: float,
+                 requires: Iterable[str] = (), fallback: float = 50.0):
+        self.name = name
+        self.compute = compute
+        self.weight = weight
+        self.requires = tuple(requires)
+        self.fallback = fallback
+
+
+# Registered metrics and precomputations: name -> SpendMetric / (requires, function)
+METRICS: Dict[str, SpendMetric] = {}
+PRECOMPUTATIONS: Dict[str, Tuple[Tuple[str, ...], Callable[['MetricInputs'], Any]]] = {}
+
+# Named sets of enabled metrics and their weights
+METRIC_PROFILES: Dict[str, Dict[str, float]] = {}
+
+# JSON file of extra profiles, e.g. {"bookkeeping": {"waste_ratio": 30, "budget_adherence": null}}
+PROFILES_PATH = os.environ.get('METRIC_PROFILES_PATH')
+
+
+def register_metric(name: str, weight: float, requires: Iterable[str] = (), fallback: float = 50.0):
+    """Decorator registering ``compute(inputs) -> score`` as a metric"""
+    def decorator(compute: Callable[['MetricInputs'], float]):
+        METRICS[name] = SpendMetric(name, compute, weight, requires, fallback)
+        return compute
+    return decorator
+
+
+def register_precomputation(name: str, requires: Iterable[str] = ()):
+    """Decorator registering ``function(inputs) -> value`` as a shared precomputation"""
+    if name in COLUMNS or name in ENGINE_INPUTS:
+        raise ValueError(f"'{name}' is provided by the engine and cannot be registered")
+
+    def decorator(function: Callable[['MetricInputs'], Any]):
+        PRECOMPUTATIONS[name] = (tuple(requires), function)
+        return function
+    return decorator
+
+
+def register_profile(name: str, metrics: Union[Iterable[str], Dict[str, Optional[float]]]):
+    """Register a named profile from metric names, or a mapping of names to weights
+
+    A weight of None (or a bare name) uses the metric's registered weight.
+    """
+    METRIC_PROFILES[name] = resolve_metrics(metrics)
+
+
+def load_profiles(path: Optional[str] = PROFILES_PATH):
+    """Register every profile in a JSON file of profile names to metric lists or weight mappings"""
+    if not path:
+        return
+    try:
+        with open(path, 'r') as f:
+            profiles = json.load(f)
+        for name, metrics in profiles.items():
+            register_profile(name, metrics)
+    except (OSError, ValueError, AttributeError) as e:
+        logging.warning(f"Could not load metric profiles {path}: {str(e)}")
+
+
+def resolve_metrics(profile: Union[str, Iterable[str], Dict[str, Optional[float]]] = 'default') -> Dict[str, float]:
+    """Weights of the enabled metrics for a profile name, metric list or metric-to-weight mapping"""
+    if isinstance(profile, str):
+        if profile not in METRIC_PROFILES:
+            raise ValueError(f"Unknown metric profile '{profile}'. Choose from: {', '.join(METRIC_PROFILES)}")
+        return dict(METRIC_PROFILES[profile])
+
+    if not isinstance(profile, dict):
+        profile = {name: None for name in profile}
+
+    weights = {}
+    for name, weight in profile.items():
+        if name not in METRICS:
+            raise ValueError(f"Unknown metric '{name}'. Choose from: {', '.join(METRICS)}")
+        weight = METRICS[name].weight if weight is None else weight
+        if not isinstance(weight, (int, float)) or isinstance(weight, bool) or weight < 0:
+            raise ValueError(f"Weight for '{name}' must be a non-negative number")
+        weights[name] = weight
+    if not weights or sum(weights.values()) <= 0:
+        raise ValueError("A metric profile needs at least one metric with a positive weight")
+    return weights
+
+
+class MetricInputs:
+    """Columns and precomputations for one dataset, each computed at most once
+
+    ``sources`` maps every column and engine input to a zero-argument
+    function, so nothing is materialized unless an enabled metric needs it.
+    Metrics may record per-transaction arrays in ``contributions``.
+    """
+
+    def __init__(self, sources: Dict[str, Callable[[], Any]], contributions: Optional[Dict[str, Any]] = None):
+        self.sources = sources
+        self.contributions = contributions if contributions is not None else {}
+        self._values = {}
+
+    def schedule(self, names: Iterable[str]) -> List[str]:
+        """Order the precomputations behind ``names`` so dependencies come first"""
+        order = []
+        visiting = set()
+
+        def visit(name: str):
+            if name in self._values or name in order:
+                return
+            if name in self.sources:
+                order.append(name)
+                return
+            if name not in PRECOMPUTATIONS:
+                raise ValueError(f"Unknown metric input '{name}'")
+            if name in visiting:
+                raise ValueError(f"Metric input '{name}' depends on itself")
+            visiting.add(name)
+            for dependency in PRECOMPUTATIONS[name][0]:
+                visit(dependency)
+            visiting.discard(name)
+            order.append(name)
+
+        for name in names:
+            visit(name)
+        return order
+
+    def prepare(self, names: Iterable[str]):
+        """Compute everything ``names`` need, in dependency order"""
+        for name in self.schedule(names):
+            self[name]
+
+    def __contains__(self, name: str) -> bool:
+        """Whether ``name`` has already been computed"""
+        return name in self._values
+
+    def __getitem__(self, name: str) -> Any:
+        if name not in self._values:
+            if name in self.sources:
+                self._values[name] = self.sources[name]()
+            elif name in PRECOMPUTATIONS:
+                self._values[name] = PRECOMPUTATIONS[name][1](self)
+            else:
+                raise KeyError(f"Unknown metric input '{name}'")
+        return self._values[name]
+
+
+def compute_metrics(inputs: MetricInputs, names: Iterable[str]) -> Dict[str, float]:
+    """Score the named metrics from shared inputs, scheduling their precomputations once"""
+    metrics = [METRICS[name] for name in names]
+    inputs.schedule(requirement for metric in metrics for requirement in metric.requires)
+
+    # Inputs are cached, so one shared by several metrics is still computed once
+    scores = {}
+    for metric in metrics:
+        try:
+            inputs.prepare(metric.requires)
+            scores[metric.name] = metric.compute(inputs)
+        except Exception as e:
+            logging.error(f"Error calculating {metric.name}: {str(e)}")
+            scores[metric.name] = metric.fallback
+    return scores
@@ -0,0 +1,185 @@
+"""
+VeroctaAI Parse Cache
+Content-addressed on-disk cache of parsed CSV uploads
+"""
+
+import os
+import json
+import hashlib
+import logging
+import numpy as np
+import pandas as pd
+from typing import Dict, Any, Optional, Tuple
+
+from transaction_batch import TransactionBatch
+
+PARSE_CACHE_DIR = os.environ.get('PARSE_CACHE_DIR', os.path.join('cache', 'parses'))
+
+# Total size of cached parses before the least recently used are evicted (0 disables the cache)
+PARSE_CACHE_MAX_MB = int(os.environ.get('PARSE_CACHE_MAX_MB', 256))
+
+# Bump when parser output changes so stale entries are never served
+PARSE_CACHE_VERSION = 2
+
+HASH_CHUNK_BYTES = 1024 * 1024
+
+# Dictionary-encoded string columns stored in each entry
+STRING_FIELDS = ('vendor', 'category', 'description')
+
+
+def file_digest(filepath: str) -> str:
+    """SHA-256 of a file's bytes"""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(digest: str, mapping: Optional[Dict[str, Any]] = None, encoding_info: Optional[Dict[str, Any]] = None) -> str:
+    """Key a parse by file content, the mapping it was parsed with and any forced encoding"""
+    payload = json.dumps({
+        'file': digest,
+        'mapping': mapping or None,
+        'encoding': encoding_info['encoding'] if encoding_info else None,
+        'version': PARSE_CACHE_VERSION
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _pack_strings(values) -> Tuple[np.ndarray, np.ndarray]:
+    """Variable-length strings as one UTF-8 byte buffer and the character offset where each ends
+
+    Fixed-width unicode arrays size every cell to the longest string, so one
+    long description would multiply the size of the whole entry.
+    """
+    strings = [str(value) for value in values]
+    offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+    np.cumsum([len(string) for string in strings], out=offsets[1:])
+    data = np.frombuffer(''.join(strings).encode('utf-8', 'surrogatepass'), dtype=np.uint8)
+    return data, offsets
+
+
+def _unpack_strings(data: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """Object array of the strings packed by ``_pack_strings``"""
+    text = data.tobytes().decode('utf-8', 'surrogatepass')
+    bounds = offsets.tolist()
+    strings = np.empty(len(bounds) - 1, dtype=object)
+    strings[:] = [text[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+    return strings
+
+
+class ParseCache:
+    """Parsed transactions stored as .npz files named by cache key
+
+    Entries are left uncompressed so hits cost little more than a file read.
+    Strings are dictionary-encoded with int32 codes, the distinct strings are
+    packed as variable-length UTF-8 and parse metadata is stored as JSON, so
+    loading never unpickles. Entries larger than the size limit are not
+    stored; hits refresh the file's mtime and the oldest files are evicted
+    once the directory exceeds its size limit.
+    """
+
+    def __init__(self, directory: str = PARSE_CACHE_DIR, max_bytes: int = PARSE_CACHE_MAX_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def get(self, key: str) -> Optional[Tuple[TransactionBatch, Dict[str, Any]]]:
+        """Return the cached batch and parse info for a key, or None on a miss"""
+        if not self.enabled:
+            return None
+
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                names = {
+                    field: _unpack_strings(data[f'{field}_names'], data[f'{field}_offsets'])
+                    for field in STRING_FIELDS
+                }
+                batch = TransactionBatch(
+                    amounts=data['amounts'],
+                    dates=data['dates'],
+                    vendor_codes=data['vendor_codes'],
+                    vendor_names=names['vendor'],
+                    category_codes=data['category_codes'],
+                    category_names=names['category'],
+                    descriptions=names['description'][data['description_codes']]
+                )
+                parse_info = json.loads(str(data['parse_info']))
+            os.utime(path)
+            return batch, parse_info
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Discarding unreadable parse cache entry {key[:12]}: {str(e)}")
+            self._remove(path)
+            return None
+
+    def put(self, key: str, batch: TransactionBatch, parse_info: Dict[str, Any]):
+        """Store a parsed batch, then evict old entries beyond the size limit"""
+        if not self.enabled:
+            return
+
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        description_codes, description_names = pd.factorize(pd.Series(batch.descriptions, dtype=object))
+        arrays = {
+            'amounts': batch.amounts,
+            'dates': batch.dates,
+            'vendor_codes': batch.vendor_codes.astype(np.int32),
+            'category_codes': batch.category_codes.astype(np.int32),
+            'description_codes': description_codes.astype(np.int32),
+            'parse_info': np.array(json.dumps(parse_info, default=str))
+        }
+        for field, names in (('vendor', batch.vendor_names), ('category', batch.category_names), ('description', description_names)):
+            arrays[f'{field}_names'], arrays[f'{field}_offsets'] = _pack_strings(names)
+
+        # An entry larger than the whole cache would only be evicted straight away
+        size = sum(array.nbytes for array in arrays.values())
+        if size > self.max_bytes:
+            logging.info(f"Skipping parse cache entry {key[:12]}: {size} bytes exceeds the cache size limit")
+            return
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_path, path)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not write parse cache entry {key[:12]}: {str(e)}")
+            self._remove(tmp_path)
+            return
+
+        self._evict()
+
+    def _evict(self):
+        """Remove least recently used entries until the cache fits its size limit"""
+        try:
+            entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith('.npz')]
+            stats = sorted(((entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries), reverse=True)
+        except OSError as e:
+            logging.warning(f"Could not scan parse cache: {str(e)}")
+            return
+
+        total = 0
+        for _, size, path in stats:
+            total += size
+            if total > self.max_bytes:
+                self._remove(path)
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+parse_cache = ParseCache()
@@ -9,13 +9,16 @@ from reportlab.lib.units import inch
 from reportlab.platypus.flowables import HRFlowable
 import matplotlib.pyplot as plt
 import matplotlib
+import matplotlib.dates as mdates
 matplotlib.use('Agg')  # Use non-interactive backend
 import numpy as np
 import io
 import base64
 from reportlab.platypus import Image as ReportLabImage
 from statistics import median
-from collections import defaultdict
+
+from transaction_batch import TransactionBatch
+from analysis_context import AnalysisContext
 
 def create_enhanced_pie_chart(category_data, title="Spending by Category"):
     """Create enhanced pie chart with superior design and fallback to bar chart for many categories"""
@@ -193,45 +196,49 @@ def create_clean_pie_chart(category_data, title="Spending by Category"):
         logging.error(f"Error creating clean pie chart: {str(e)}")
         return None
 
-def create_spending_trend_chart(transactions, title="Monthly Spending Trend"):
-    """Create a spending trend chart over time"""
+def create_spending_trend_chart(transactions, title="Monthly Spending Trend", context=None, score_series=None):
+    """Create a spending trend chart over time from transaction dicts, a TransactionBatch or an AnalysisContext
+
+    When a ``score_series`` (see score_series.calculate_score_series) is given,
+    the SpendScore of each window is drawn on a second axis.
+    """
     try:
-        if not transactions:
+        if context is not None:
+            monthly_data = context.monthly_totals
+        elif transactions is None or len(transactions) == 0:
             return None
-
-        # Group transactions by month
-        monthly_data = defaultdict(float)
-        for transaction in transactions:
-            date_str = transaction.get('date', '')
-            amount = abs(float(transaction.get('amount', 0)))
-
-            # Try to parse date
-            try:
-                if '/' in date_str:
-                    date_obj = datetime.strptime(date_str.split()[0], '%m/%d/%Y')
-                elif '-' in date_str:
-                    date_obj = datetime.strptime(date_str.split()[0], '%Y-%m-%d')
-                else:
-                    continue
-
-                month_key = date_obj.strftime('%Y-%m')
-                monthly_data[month_key] += amount
-            except:
-                continue
+        else:
+            # Group transactions by month
+            monthly_data = TransactionBatch.coerce(transactions).month_totals(absolute=True)
 
         if len(monthly_data) < 2:
             return None
 
-        # Sort by month
+        # Sort by month, plotting each month at its midpoint
         sorted_months = sorted(monthly_data.items())
-        months = [item[0] for item in sorted_months]
+        months = np.array([item[0] for item in sorted_months], dtype='datetime64[M]').astype('datetime64[D]') + 14
         amounts = [item[1] for item in sorted_months]
 
         fig, ax = plt.subplots(figsize=(12, 6))
 
         # Create line chart
-        ax.plot(months, amounts, marker='o', linewidth=3, markersize=8, color='#3498db')
+        ax.plot(months, amounts, marker='o', linewidth=3, markersize=8, color='#3498db', label='Spending')
         ax.fill_between(months, amounts, alpha=0.3, color='#3498db')
+        ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m'))
+
+        # SpendScore of each window, at the window's midpoint
+        windows = (score_series or {}).get('windows', [])
+        if len(windows) >= 2:
+            starts = np.array([window['start'] for window in windows], dtype='datetime64[D]')
+            ends = np.array([window['end'] for window in windows], dtype='datetime64[D]')
+            midpoints = starts + (ends - starts) // 2
+            score_ax = ax.twinx()
+            score_ax.plot(midpoints, [window['final_score'] for window in windows], marker='s', linewidth=2,
+                          markersize=6, color='#27ae60', label='SpendScore')
+            score_ax.set_ylim(0, 100)
+            score_ax.set_ylabel('SpendScore', fontsize=12, fontweight='bold', color='#27ae60')
+            lines = ax.get_lines() + score_ax.get_lines()
+            ax.legend(lines, [line.get_label() for line in lines], loc='upper left')
 
         ax.set_title(title, fontsize=16, fontweight='bold', pad=20, color='#2c3e50')
         ax.set_xlabel('Month', fontsize=12, fontweight='bold')
@@ -257,6 +264,60 @@ def create_spending_trend_chart(transactions, title="Monthly Spending Trend"):
         logging.error(f"Error creating trend chart: {str(e)}")
         return None
 
+def create_forecast_chart(monthly_data, forecast, title="Next Quarter Forecast"):
+    """Chart monthly spending with its projection, beside each top category's last and projected quarter
+
+    ``forecast`` is the result of forecasting.forecast_spending.
+    """
+    try:
+        if not forecast or not forecast.get('categories') or not monthly_data:
+            return None
+
+        sorted_months = sorted(monthly_data.items())
+        months = np.array([item[0] for item in sorted_months], dtype='datetime64[M]').astype('datetime64[D]') + 14
+        amounts = [item[1] for item in sorted_months]
+        projected_months = np.array(forecast['months'], dtype='datetime64[M]').astype('datetime64[D]') + 14
+
+        fig, (trend_ax, category_ax) = plt.subplots(1, 2, figsize=(14, 6), gridspec_kw={'width_ratios': [3, 2]})
+
+        # History, then the projection continuing from the last actual month
+        trend_ax.plot(months, amounts, marker='o', linewidth=3, markersize=8, color='#3498db', label='Actual')
+        trend_ax.plot(np.concatenate([months[-1:], projected_months]), [amounts[-1]] + forecast['total']['monthly'],
+                      marker='o', linewidth=3, markersize=8, linestyle='--', color='#e67e22', label='Projected')
+        trend_ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m'))
+        trend_ax.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'${x:,.0f}'))
+        trend_ax.set_title('Monthly Spending', fontsize=13, fontweight='bold', color='#2c3e50')
+        trend_ax.tick_params(axis='x', rotation=45)
+        trend_ax.grid(True, alpha=0.3)
+        trend_ax.legend(loc='upper left')
+
+        # Last quarter against the projected quarter for the largest categories
+        top = forecast['categories'][:8][::-1]
+        positions = np.arange(len(top))
+        category_ax.barh(positions - 0.2, [category['last_quarter'] for category in top], height=0.4, color='#95a5a6', label='Last quarter')
+        category_ax.barh(positions + 0.2, [category['next_quarter'] for category in top], height=0.4, color='#e67e22', label='Projected')
+        category_ax.set_yticks(positions)
+        category_ax.set_yticklabels([str(category['category'])[:20] for category in top])
+        category_ax.xaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'${x:,.0f}'))
+        category_ax.set_title('By Category', fontsize=13, fontweight='bold', color='#2c3e50')
+        category_ax.tick_params(axis='x', rotation=45)
+        category_ax.grid(True, axis='x', alpha=0.3)
+        category_ax.legend(loc='lower right')
+
+        fig.suptitle(title, fontsize=16, fontweight='bold', color='#2c3e50')
+        plt.tight_layout()
+
+        img_buffer = io.BytesIO()
+        plt.savefig(img_buffer, format='png', dpi=300, bbox_inches='tight', facecolor='white')
+        img_buffer.seek(0)
+        plt.close()
+
+        return img_buffer
+
+    except Exception as e:
+        logging.error(f"Error creating forecast chart: {str(e)}")
+        return None
+
 def create_horizontal_bar_chart(category_data, title="Spending by Category"):
     """Create horizontal bar chart for categories > 6"""
     try:
@@ -491,7 +552,7 @@ def create_score_badge_section(story, styles, score, tier_info):
     except Exception as e:
         logging.error(f"Error creating score badge: {str(e)}")
 
-def generate_report_pdf(analysis_data, transactions, company_name=None, logo_path=None):
+def generate_report_pdf(analysis_data, transactions, company_name=None, logo_path=None, context=None):
     """Generate comprehensive PDF report with enhanced features"""
     try:
         # Ensure output directory exists
@@ -616,6 +677,49 @@ def generate_report_pdf(analysis_data, transactions, company_name=None, logo_pat
         story.append(metrics_table)
         story.append(Spacer(1, 20))
 
+        # Transactions costing the most SpendScore points
+        top_detractors = analysis_data.get('top_detractors') or []
+        if top_detractors:
+            story.append(Paragraph("Biggest Detractors", styles['Heading3']))
+
+            detractor_data = [['Vendor', 'Date', 'Amount', 'Reasons', 'Points']]
+            for detractor in top_detractors:
+                reasons = []
+                if detractor.get('outlier'):
+                    reasons.append('Spike')
+                if detractor.get('redundancy_penalty'):
+                    reasons.append('Duplicate')
+                if detractor.get('waste'):
+                    reasons.append('Low-value')
+                if detractor.get('deviation_penalty'):
+                    reasons.append('Off-budget')
+                detractor_data.append([
+                    str(detractor.get('vendor', ''))[:25],
+                    detractor.get('date') or '-',
+                    f"${detractor.get('amount', 0):,.2f}",
+                    ', '.join(reasons[:2]),
+                    f"-{detractor.get('score_impact', 0):.2f}"
+                ])
+
+            detractor_table = Table(detractor_data, colWidths=[1.7*inch, 0.9*inch, 1*inch, 1.4*inch, 0.7*inch])
+            detractor_table.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2E86AB')),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+                ('ALIGN', (2, 1), (2, -1), 'RIGHT'),
+                ('ALIGN', (4, 1), (4, -1), 'RIGHT'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, 0), 11),
+                ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+                ('FONTSIZE', (0, 1), (-1, -1), 9),
+                ('GRID', (0, 0), (-1, -1), 1, colors.black),
+                ('BACKGROUND', (0, 1), (-1, -1), colors.lightgrey)
+            ]))
+
+            story.append(detractor_table)
+            story.append(Paragraph("<i>Points: estimated SpendScore points each transaction costs.</i>", metadata_style))
+            story.append(Spacer(1, 20))
+
         # Enhanced AI Recommendations with action items
         story.append(Paragraph("🤖 AI-Powered Financial Recommendations", heading_style))
 
@@ -649,21 +753,16 @@ def generate_report_pdf(analysis_data, transactions, company_name=None, logo_pat
             story.append(Spacer(1, 12))
 
         # Category Analysis
-        if transactions:
+        if context is None and transactions is not None and len(transactions) > 0:
+            context = AnalysisContext(transactions)
+
+        if context is not None and len(context) > 0:
             story.append(Spacer(1, 20))
             story.append(Paragraph("Spending Analysis", heading_style))
 
-            # Calculate category breakdown
-            category_totals = {}
-            vendor_totals = {}
-
-            for transaction in transactions:
-                category = transaction.get('category', 'Uncategorized')
-                vendor = transaction.get('vendor', 'Unknown')
-                amount = transaction.get('amount', 0)
-
-                category_totals[category] = category_totals.get(category, 0) + amount
-                vendor_totals[vendor] = vendor_totals.get(vendor, 0) + amount
+            # Category breakdown
+            category_totals = context.category_totals
+            vendor_totals = context.vendor_totals
 
             # Top categories table
             if category_totals:
@@ -722,6 +821,118 @@ def generate_report_pdf(analysis_data, transactions, company_name=None, logo_pat
 
                 story.append(vendor_table)
 
+        # Recurring subscriptions detected from charge cadence
+        subscriptions = (analysis_data.get('subscriptions') or {}).get('subscriptions', [])
+        if subscriptions:
+            story.append(Spacer(1, 15))
+            story.append(Paragraph("Recurring Subscriptions", styles['Heading3']))
+            story.append(Paragraph(
+                f"{len(subscriptions)} recurring charges with a projected annual cost of "
+                f"${analysis_data['subscriptions'].get('annualized_cost', 0):,.2f}.", body_style))
+
+            subscription_data = [['Vendor', 'Cadence', 'Avg Charge', 'Charges', 'Annualized']]
+            for subscription in subscriptions[:10]:
+                subscription_data.append([
+                    str(subscription.get('vendor', ''))[:30],
+                    subscription.get('cadence', '').title(),
+                    f"${subscription.get('average_amount', 0):,.2f}",
+                    str(subscription.get('charges', 0)),
+                    f"${subscription.get('annualized_cost', 0):,.2f}"
+                ])
+
+            subscription_table = Table(subscription_data, colWidths=[2*inch, 1*inch, 1.1*inch, 0.8*inch, 1.1*inch])
+            subscription_table.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2E86AB')),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+                ('ALIGN', (2, 1), (-1, -1), 'RIGHT'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, 0), 11),
+                ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+                ('FONTSIZE', (0, 1), (-1, -1), 9),
+                ('GRID', (0, 0), (-1, -1), 1, colors.black),
+                ('BACKGROUND', (0, 1), (-1, -1), colors.lightgrey)
+            ]))
+
+            story.append(subscription_table)
+
+        # Exact and near-duplicate expenses
+        duplicate_groups = (analysis_data.get('duplicates') or {}).get('groups', [])
+        if duplicate_groups:
+            story.append(Spacer(1, 15))
+            story.append(Paragraph("Possible Duplicate Expenses", styles['Heading3']))
+            story.append(Paragraph(
+                f"{analysis_data['duplicates'].get('count', len(duplicate_groups))} groups of possibly duplicated charges with "
+                f"${analysis_data['duplicates'].get('at_risk_amount', 0):,.2f} at risk.", body_style))
+
+            duplicate_data = [['Vendor', 'Type', 'Amount', 'Charges', 'Dates', 'At Risk']]
+            for group in duplicate_groups[:10]:
+                dates = group.get('first_date', '')
+                if group.get('last_date') and group.get('last_date') != dates:
+                    dates = f"{dates} to {group['last_date']}"
+                duplicate_data.append([
+                    str(group.get('vendor', ''))[:25],
+                    group.get('type', '').title(),
+                    f"${group.get('amount', 0):,.2f}",
+                    str(group.get('transactions', 0)),
+                    dates,
+                    f"${group.get('at_risk_amount', 0):,.2f}"
+                ])
+
+            duplicate_table = Table(duplicate_data, colWidths=[1.6*inch, 0.6*inch, 0.9*inch, 0.7*inch, 1.7*inch, 0.9*inch])
+            duplicate_table.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2E86AB')),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+                ('ALIGN', (2, 1), (3, -1), 'RIGHT'),
+                ('ALIGN', (5, 1), (5, -1), 'RIGHT'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, 0), 11),
+                ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+                ('FONTSIZE', (0, 1), (-1, -1), 9),
+                ('GRID', (0, 0), (-1, -1), 1, colors.black),
+                ('BACKGROUND', (0, 1), (-1, -1), colors.lightgrey)
+            ]))
+
+            story.append(duplicate_table)
+
+        # Spending spikes within their own vendor or category
+        spikes = (analysis_data.get('anomalies') or {}).get('spikes', [])
+        if spikes:
+            story.append(Spacer(1, 15))
+            story.append(Paragraph("Spending Spikes", styles['Heading3']))
+            story.append(Paragraph(
+                f"{analysis_data['anomalies'].get('count', len(spikes))} transactions totalling "
+                f"${analysis_data['anomalies'].get('flagged_amount', 0):,.2f} are far above the typical amount "
+                f"for their vendor or category.", body_style))
+
+            spike_data = [['Vendor', 'Category', 'Date', 'Amount', 'Typical', 'Compared To']]
+            for spike in spikes[:10]:
+                spike_data.append([
+                    str(spike.get('vendor', ''))[:22],
+                    str(spike.get('category', ''))[:18],
+                    spike.get('date') or '',
+                    f"${spike.get('amount', 0):,.2f}",
+                    f"${spike.get('typical_amount', 0):,.2f}",
+                    spike.get('segment', '').title()
+                ])
+
+            spike_table = Table(spike_data, colWidths=[1.5*inch, 1.2*inch, 0.9*inch, 0.9*inch, 0.9*inch, 0.9*inch])
+            spike_table.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2E86AB')),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+                ('ALIGN', (3, 1), (4, -1), 'RIGHT'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, 0), 11),
+                ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+                ('FONTSIZE', (0, 1), (-1, -1), 9),
+                ('GRID', (0, 0), (-1, -1), 1, colors.black),
+                ('BACKGROUND', (0, 1), (-1, -1), colors.lightgrey)
+            ]))
+
+            story.append(spike_table)
+
         # Enhanced Visual Analytics Section
         story.append(Spacer(1, 30))
         story.append(HRFlowable(width="100%", thickness=2, lineCap='round', color=colors.HexColor('#2E86AB')))
@@ -760,13 +971,16 @@ def generate_report_pdf(analysis_data, transactions, company_name=None, logo_pat
 
             # Chart 3: Spending Trend Over Time
             story.append(Paragraph("📅 Spending Trends Over Time", styles['Heading3']))
-            trend_chart_buffer = create_spending_trend_chart(transactions, "Monthly Spending Patterns")
+            trend_chart_buffer = create_spending_trend_chart(transactions, "Monthly Spending Patterns", context=context,
+                                                             score_series=analysis_data.get('score_series'))
             if trend_chart_buffer:
                 story.append(Spacer(1, 10))
                 trend_description = """
                 <b>Temporal Analysis:</b> Track your spending patterns over time to identify seasonal trends, 
                 spending spikes, and overall financial behavior patterns.
                 """
+                if len((analysis_data.get('score_series') or {}).get('windows', [])) >= 2:
+                    trend_description += " The green line shows the SpendScore of each period on its own."
                 story.append(Paragraph(trend_description, body_style))
                 story.append(Spacer(1, 10))
 
@@ -774,6 +988,25 @@ def generate_report_pdf(analysis_data, transactions, company_name=None, logo_pat
                 story.append(trend_chart_image)
                 story.append(Spacer(1, 15))
 
+            # Chart 4: Next quarter forecast
+            forecast = analysis_data.get('forecast') or {}
+            forecast_monthly = context.monthly_totals if context is not None else {}
+            forecast_chart_buffer = create_forecast_chart(forecast_monthly, forecast)
+            if forecast_chart_buffer:
+                story.append(Paragraph("🔮 Next Quarter Forecast", styles['Heading3']))
+                story.append(Spacer(1, 10))
+                forecast_description = f"""
+                <b>Projected Spending:</b> ${forecast['total']['next_quarter']:,.2f} over {forecast['months'][0]} to
+                {forecast['months'][-1]}, against ${forecast['total']['last_quarter']:,.2f} in the last three months,
+                projected per category from {forecast['history_months']} months of history.
+                """
+                story.append(Paragraph(forecast_description, body_style))
+                story.append(Spacer(1, 10))
+
+                forecast_chart_image = ReportLabImage(forecast_chart_buffer, width=7*inch, height=3*inch)
+                story.append(forecast_chart_image)
+                story.append(Spacer(1, 15))
+
             # Add comprehensive insights about all visualizations
             total_spending = sum(category_totals.values())
             top_category = max(category_totals.items(), key=lambda x: x[1])
@@ -818,6 +1051,15 @@ def generate_report_pdf(analysis_data, transactions, company_name=None, logo_pat
 2. Schedule monthly reviews to track progress
 3. Reassess SpendScore quarterly to measure improvement
 4. Consider professional consultation for complex optimizations"""
+        forecast = analysis_data.get('forecast') or {}
+        if forecast.get('categories'):
+            growing = [category for category in forecast['categories'][:5]
+                       if category['change_percent'] is not None and category['change_percent'] > 10]
+            action_summary += (f"\n5. Budget ${forecast['total']['next_quarter']:,.2f} for "
+                               f"{forecast['months'][0]} to {forecast['months'][-1]} (projected)")
+            if growing:
+                action_summary += "; watch " + ", ".join(
+                    f"{category['category']} (+{category['change_percent']:.0f}%)" for category in growing)
         story.append(Paragraph(action_summary, body_style))
         story.append(Spacer(1, 15))
 
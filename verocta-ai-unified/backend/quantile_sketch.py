@@ -0,0 +1,199 @@
+"""
+VeroctaAI Quantile Sketch
+Mergeable, fixed-memory approximation of a distribution of amounts
+"""
+
+import math
+import numpy as np
+from typing import Dict, Any, Tuple
+
+# Default relative accuracy of values returned by the sketch
+DEFAULT_RELATIVE_ACCURACY = 0.01
+
+# Buckets kept per sign before the smallest magnitudes are collapsed together
+DEFAULT_MAX_BUCKETS = 2048
+
+# Magnitudes below this are counted as zero
+MIN_MAGNITUDE = 1e-9
+
+
+class QuantileSketch:
+    """Log-bucketed quantile sketch (DDSketch)
+
+    Each value is counted in the bucket ``ceil(log(|v|) / log(gamma))`` with
+    ``gamma = (1 + a) / (1 - a)``, so any quantile read back is within a
+    relative error ``a`` of a true value at that rank. Memory is bounded by
+    ``max_buckets`` per sign, sketches of different data merge by adding
+    bucket counts, and count, sum, min and max are kept exactly.
+    """
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY, max_buckets: int = DEFAULT_MAX_BUCKETS):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be between 0 and 1")
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+
+        self.positive: Dict[int, int] = {}
+        self.negative: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.collapsed = False
+        self._sorted = None
+
+    def add(self, values) -> 'QuantileSketch':
+        """Count an array (or iterable) of values"""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return self
+
+        self.count += len(values)
+        self.sum += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+        magnitudes = np.abs(values)
+        nonzero = magnitudes >= MIN_MAGNITUDE
+        self.zero_count += int(len(values) - np.count_nonzero(nonzero))
+        indices = np.ceil(np.log(magnitudes[nonzero]) / self._log_gamma).astype(np.int64)
+        negative = values[nonzero] < 0
+        self._add_indices(self.positive, indices[~negative])
+        self._add_indices(self.negative, indices[negative])
+        return self
+
+    def merge(self, other: 'QuantileSketch') -> 'QuantileSketch':
+        """Add another sketch's counts to this one (both must share relative accuracy)"""
+        if not math.isclose(other.gamma, self.gamma):
+            raise ValueError("Cannot merge quantile sketches with different relative accuracy")
+
+        for buckets, other_buckets in ((self.positive, other.positive), (self.negative, other.negative)):
+            for index, count in other_buckets.items():
+                buckets[index] = buckets.get(index, 0) + count
+            self._collapse(buckets)
+
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.collapsed = self.collapsed or other.collapsed
+        self._sorted = None
+        return self
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def error_bound(self) -> float:
+        """Relative error of returned values
+
+        Ranks that fall in the bucket the smallest magnitudes were collapsed
+        into (see ``collapsed``) are not covered by this bound.
+        """
+        return self.relative_accuracy
+
+    def buckets(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Representative value and count of every bucket, in ascending value order"""
+        if self._sorted is None:
+            negative = sorted(self.negative.items(), reverse=True)
+            positive = sorted(self.positive.items())
+            values = [-self._bucket_value(index) for index, _ in negative]
+            counts = [count for _, count in negative]
+            if self.zero_count:
+                values.append(0.0)
+                counts.append(self.zero_count)
+            values.extend(self._bucket_value(index) for index, _ in positive)
+            counts.extend(count for _, count in positive)
+            self._sorted = (np.array(values, dtype=np.float64), np.array(counts, dtype=np.int64))
+        return self._sorted
+
+    def value_at_rank(self, rank: int) -> float:
+        """Approximate value at 0-based position ``rank`` of the sorted data"""
+        if not self.count:
+            raise ValueError("Quantile of an empty sketch")
+        rank = min(max(int(rank), 0), self.count - 1)
+        if rank == 0:
+            return self.min
+        if rank == self.count - 1:
+            return self.max
+
+        values, counts = self.buckets()
+        position = int(np.searchsorted(np.cumsum(counts), rank, side='right'))
+        return min(max(float(values[position]), self.min), self.max)
+
+    def quantile(self, q: float) -> float:
+        """Approximate q-quantile (0 <= q <= 1), at rank ``floor(q * (count - 1))``"""
+        return self.value_at_rank(math.floor(q * (self.count - 1)))
+
+    def median(self) -> float:
+        """Approximate median, averaging the two middle ranks as statistics.median does"""
+        return (self.value_at_rank((self.count - 1) // 2) + self.value_at_rank(self.count // 2)) / 2
+
+    def count_above(self, threshold: float) -> int:
+        """Approximate number of values greater than ``threshold``"""
+        if threshold >= self.max:
+            return 0
+        if threshold < self.min:
+            return self.count
+        values, counts = self.buckets()
+        return int(counts[values > threshold].sum())
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-serializable form of the sketch"""
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'max_buckets': self.max_buckets,
+            'positive': {str(index): count for index, count in self.positive.items()},
+            'negative': {str(index): count for index, count in self.negative.items()},
+            'zero_count': self.zero_count,
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None,
+            'collapsed': self.collapsed
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'QuantileSketch':
+        """Rebuild a sketch from ``to_dict`` output"""
+        sketch = cls(data.get('relative_accuracy', DEFAULT_RELATIVE_ACCURACY), data.get('max_buckets', DEFAULT_MAX_BUCKETS))
+        sketch.positive = {int(index): int(count) for index, count in data.get('positive', {}).items()}
+        sketch.negative = {int(index): int(count) for index, count in data.get('negative', {}).items()}
+        sketch.zero_count = int(data.get('zero_count', 0))
+        sketch.count = int(data.get('count', 0))
+        sketch.sum = float(data.get('sum', 0.0))
+        if sketch.count:
+            sketch.min = float(data['min'])
+            sketch.max = float(data['max'])
+        sketch.collapsed = bool(data.get('collapsed', False))
+        return sketch
+
+    def _bucket_value(self, index: int) -> float:
+        """Value within relative accuracy of everything counted in bucket ``index``"""
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def _add_indices(self, buckets: Dict[int, int], indices: np.ndarray):
+        if not len(indices):
+            return
+        # Indices span a narrow range, so counting by offset avoids sorting
+        lowest = int(indices.min())
+        counts = np.bincount(indices - lowest)
+        for offset in np.flatnonzero(counts).tolist():
+            buckets[lowest + offset] = buckets.get(lowest + offset, 0) + int(counts[offset])
+        self._collapse(buckets)
+        self._sorted = None
+
+    def _collapse(self, buckets: Dict[int, int]):
+        """Fold the smallest magnitudes into one bucket once ``max_buckets`` is exceeded"""
+        if len(buckets) <= self.max_buckets:
+            return
+        indices = sorted(buckets)
+        excess = indices[:len(indices) - self.max_buckets + 1]
+        target = excess[-1]
+        buckets[target] = sum(buckets.pop(index) for index in excess[:-1]) + buckets[target]
+        self.collapsed = True
@@ -4,7 +4,7 @@ import logging
 import random
 from datetime import datetime
 from flask import render_template, request, flash, redirect, url_for, send_file, send_from_directory, jsonify
-from flask_jwt_extended import jwt_required, create_access_token, get_jwt_identity
+from flask_jwt_extended import jwt_required, create_access_token, get_jwt_identity, verify_jwt_in_request
 from werkzeug.utils import secure_filename
 from app import app
 from auth import validate_user, create_user, get_current_user, require_admin
@@ -13,11 +13,20 @@ try:
     from database import db_service
 except ImportError:
     db_service = None
-from csv_parser import parse_csv_file, parse_csv_file_with_mapping
+from csv_parser import parse_csv_file, parse_csv_file_with_mapping, preview_csv
+from layout_registry import layout_registry
 from gpt_utils import generate_financial_insights
-from spend_score_engine import calculate_spend_score, get_score_label, get_score_color, get_enhanced_analysis
+from spend_score_engine import calculate_spend_score, get_score_label, get_score_color, get_enhanced_analysis, score_many, ENGINES
 from pdf_generator import generate_report_pdf
+from analysis_context import AnalysisContext
+from score_series import calculate_score_series, SERIES_PERIODS
+from metric_registry import METRIC_PROFILES, resolve_metrics
+from score_snapshots import ScoreSnapshot, score_snapshots, dataset_fingerprint, is_fingerprint
 from clone_verifier import verify_project_integrity
+from vendor_resolution import vendor_resolver
+from duplicate_detector import detect_duplicates
+from anomaly_detector import detect_anomalies
+from transaction_batch import TransactionBatch
 
 # Initialize sample data
 init_sample_data()
@@ -27,7 +36,11 @@ UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'csv'}
 ALLOWED_LOGO_EXTENSIONS = {'png', 'jpg', 'jpeg', 'svg'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+# Uploads are parsed into memory in full, since every analysis needs the whole batch
+MAX_UPLOAD_MB = 16
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_MB * 1024 * 1024
+# Datasets accepted by one batch scoring request
+MAX_BATCH_DATASETS = int(os.environ.get('MAX_BATCH_DATASETS', 500))
 
 # Ensure upload directory exists
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -37,6 +50,14 @@ def allowed_file(filename):
     """Check if uploaded file has allowed extension"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def optional_identity():
+    """JWT identity of the caller, or None for anonymous requests"""
+    try:
+        verify_jwt_in_request(optional=True)
+        return get_jwt_identity()
+    except Exception:
+        return None
+
 def allowed_logo_file(filename):
     """Check if uploaded logo file has allowed extension"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_LOGO_EXTENSIONS
@@ -256,6 +277,59 @@ def delete_report_endpoint(report_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/reports/<report_id>/simulate', methods=['POST'])
+@jwt_required()
+def simulate_report(report_id):
+    """Re-score a report's dataset under custom weights and category classifications"""
+    try:
+        user = get_current_user()
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+
+        # Try database first
+        report_data = None
+        if db_service and db_service.connected:
+            try:
+                report_data = db_service.get_report_by_id(str(report_id), str(user['id']))
+            except Exception as db_error:
+                logging.error(f"Database error: {str(db_error)}")
+
+        # Fallback to in-memory storage
+        if report_data is None:
+            try:
+                report = get_report_by_id(int(report_id), user['id'])
+            except ValueError:
+                return jsonify({'error': 'Invalid report ID format'}), 400
+            if not report:
+                return jsonify({'error': 'Report not found'}), 404
+            report_data = report.to_dict()
+
+        fingerprint = (report_data.get('data') or {}).get('dataset_fingerprint')
+        snapshot = score_snapshots.get(fingerprint) if is_fingerprint(fingerprint) else None
+        if snapshot is None:
+            return jsonify({
+                'error': 'No cached analysis for this report',
+                'details': 'Upload the CSV file again to enable simulation'
+            }), 404
+
+        data = request.get_json(silent=True) or {}
+        try:
+            baseline = snapshot.simulate()
+            simulation = snapshot.simulate(data.get('weights'), data.get('category_overrides'))
+        except (ValueError, AttributeError) as e:
+            return jsonify({'error': f'Invalid simulation parameters: {str(e)}'}), 400
+
+        return jsonify({
+            'report_id': report_id,
+            'dataset_fingerprint': fingerprint,
+            'baseline': baseline,
+            'simulation': simulation
+        })
+
+    except Exception as e:
+        logging.error(f"Simulation error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/reports/<report_id>/pdf', methods=['GET'])
 @jwt_required()
 def download_report_pdf(report_id):
@@ -312,8 +386,10 @@ def download_report_pdf(report_id):
             'score_label': get_score_label(report_data.get('spend_score', 75)),
             'score_color': get_score_color(report_data.get('spend_score', 75)),
             'waste_percentage': report_data.get('insights', {}).get('waste_percentage', 12.4),
-            'duplicate_expenses': report_data.get('insights', {}).get('duplicate_expenses', 23),
-            'spending_spikes': report_data.get('insights', {}).get('spending_spikes', 5),
+            'duplicate_expenses': report_data.get('insights', {}).get('duplicate_expenses', 0),
+            'duplicates': report_data.get('insights', {}).get('duplicates'),
+            'spending_spikes': report_data.get('insights', {}).get('spending_spikes', 0),
+            'anomalies': report_data.get('insights', {}).get('anomalies'),
             'savings_opportunities': report_data.get('insights', {}).get('savings_opportunities', 8)
         }
 
@@ -395,12 +471,35 @@ def create_report_endpoint():
             'upload_timestamp': datetime.now().isoformat()
         }
         
+        # Find duplicate expenses and spending spikes when the report carries real upload data
+        duplicates = None
+        anomalies = None
+        report_data = data.get('data') or {}
+        raw_analysis = report_data.get('raw_analysis') or {}
+
+        # Link the report to its upload's cached metric scores for what-if simulation
+        # The fingerprint comes back from the client, so only a well-formed one is kept
+        fingerprint = report_data.get('dataset_fingerprint') or raw_analysis.get('dataset_fingerprint')
+        if is_fingerprint(fingerprint):
+            sample_data['dataset_fingerprint'] = fingerprint
+        if isinstance(report_data.get('transactions'), list) and report_data['transactions']:
+            batch = TransactionBatch.coerce(report_data['transactions'])
+            duplicates = detect_duplicates(batch)
+            anomalies = detect_anomalies(batch)
+        else:
+            if isinstance(raw_analysis.get('duplicates'), dict):
+                duplicates = raw_analysis['duplicates']
+            if isinstance(raw_analysis.get('anomalies'), dict):
+                anomalies = raw_analysis['anomalies']
+
         # Generate realistic insights
         spend_score = random.randint(60, 95)
         insights_data = {
             'waste_percentage': max(5, 25 - (spend_score - 60) / 2),
-            'duplicate_expenses': random.randint(10, 50),
-            'spending_spikes': random.randint(2, 12),
+            'duplicate_expenses': duplicates.get('duplicate_transactions', 0) if duplicates else 0,
+            'duplicates': duplicates,
+            'spending_spikes': anomalies.get('count', 0) if anomalies else 0,
+            'anomalies': anomalies,
             'savings_opportunities': random.randint(5, 15),
             'recommendations': [
                 'Review subscription services for cost optimization',
@@ -476,6 +575,26 @@ def api_upload():
         except json.JSONDecodeError:
             mapping = {}
 
+        # Get score series options: windows of N weeks, months or quarters, tumbling unless rolling
+        series_period = request.form.get('series_period', 'month')
+        series_rolling = request.form.get('series_rolling', 'false').lower() == 'true'
+        try:
+            series_window = int(request.form.get('series_window', 1))
+        except ValueError:
+            series_window = 0
+        if series_period not in SERIES_PERIODS or series_window < 1:
+            return jsonify({
+                'error': 'Invalid score series options',
+                'details': f"series_period must be one of {', '.join(SERIES_PERIODS)} and series_window a positive number of periods"
+            }), 400
+
+        metric_profile = request.form.get('metric_profile', 'default')
+        if metric_profile not in METRIC_PROFILES:
+            return jsonify({
+                'error': f'Invalid metric profile: {metric_profile}',
+                'details': f"Choose from: {', '.join(METRIC_PROFILES)}"
+            }), 400
+
         # Get company branding information
         company_name = request.form.get('company_name', '').strip()
         logo_path = None
@@ -493,14 +612,19 @@ def api_upload():
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         file.save(filepath)
 
+        # Signed-in uploaders get their own learned layouts and vendor map; anonymous
+        # uploads see only the built-in layouts and share the default vendor map
+        identity = optional_identity()
+        tenant = identity or 'default'
+
         # Parse CSV file with mapping
         try:
             if mapping and any(mapping.values()):
                 logging.info(f"Using provided mapping: {mapping}")
-                transactions = parse_csv_file_with_mapping(filepath, mapping)
+                transactions, parse_info = parse_csv_file_with_mapping(filepath, mapping, return_info=True, as_batch=True, tenant=identity)
             else:
                 logging.info("No mapping provided, using auto-detection")
-                transactions = parse_csv_file(filepath)
+                transactions, parse_info = parse_csv_file(filepath, return_info=True, as_batch=True, tenant=identity)
         except Exception as parse_error:
             logging.error(f"CSV parsing error: {str(parse_error)}")
             # Clean up uploaded file on error
@@ -524,9 +648,20 @@ def api_upload():
                 'details': 'Upload a file with more transaction records for meaningful analysis'
             }), 400
 
+        # Remember a signed-in user's confirmed mapping so their next upload of the same export layout is recognized
+        if identity and mapping and any(mapping.values()) and parse_info.get('headers'):
+            layout_registry.learn(parse_info['headers'], parse_info['mapping'], identity)
+
+        # Merge descriptor variants ('AMZN Digital', 'Amazon Mktp US') into canonical vendors,
+        # using the uploader's learned vendor map when they are signed in
+        transactions, vendor_resolution = vendor_resolver.resolve_batch(transactions, tenant)
+
+        # Aggregate once for scoring, insights and the PDF
+        context = AnalysisContext(transactions)
+
         # Calculate enhanced spend score
         try:
-            enhanced_analysis = get_enhanced_analysis(transactions)
+            enhanced_analysis = get_enhanced_analysis(context=context, engine='vectorized', quantile_mode='auto', metric_profile=metric_profile)
         except Exception as analysis_error:
             logging.error(f"Analysis error: {str(analysis_error)}")
             return jsonify({
@@ -534,9 +669,17 @@ def api_upload():
                 'details': 'There may be an issue with the transaction data format'
             }), 500
 
+        # Cache the per-metric results so reports on this dataset can be re-weighted
+        fingerprint = dataset_fingerprint(parse_info, metric_profile, tenant)
+        if fingerprint:
+            score_snapshots.put(ScoreSnapshot.from_analysis(fingerprint, enhanced_analysis))
+
+        # Score each time window for the trend view
+        score_series = calculate_score_series(context=context, period=series_period, window=series_window, rolling=series_rolling)
+
         # Generate AI insights
         try:
-            insights = generate_financial_insights(transactions)
+            insights = generate_financial_insights(transactions, context=context)
         except Exception as insight_error:
             logging.warning(f"AI insights generation failed: {str(insight_error)}")
             # Provide fallback insights
@@ -550,13 +693,22 @@ def api_upload():
             }
 
         # Calculate transaction summary
-        total_amount = sum(float(t.get('amount', 0)) for t in transactions)
+        total_amount = context.total_amount
 
         # Prepare analysis results with enhanced data
         analysis_data = {
             'spend_score': enhanced_analysis['final_score'],
             'tier_info': enhanced_analysis['tier_info'],
             'score_breakdown': enhanced_analysis['score_breakdown'],
+            'redundancy': enhanced_analysis['redundancy'],
+            'top_detractors': enhanced_analysis['top_detractors'],
+            'subscriptions': context.subscriptions,
+            'duplicates': context.duplicates,
+            'anomalies': context.anomalies,
+            'forecast': context.forecast,
+            'vendor_resolution': vendor_resolution,
+            'score_series': score_series,
+            'dataset_fingerprint': fingerprint,
             'suggestions': insights,
             'total_transactions': len(transactions),
             'total_amount': total_amount,
@@ -565,7 +717,7 @@ def api_upload():
             'green_reward_eligible': enhanced_analysis['tier_info'].get('green_reward_eligible', False),
             'company_name': company_name if company_name else None,
             'logo_path': logo_path if logo_path else None,
-            'mapping_used': mapping
+            'mapping_used': parse_info.get('mapping', mapping)
         }
 
         # Save JSON output
@@ -575,7 +727,7 @@ def api_upload():
 
         # Generate PDF report with company branding
         try:
-            pdf_path = generate_report_pdf(analysis_data, transactions, company_name, logo_path)
+            pdf_path = generate_report_pdf(analysis_data, transactions, company_name, logo_path, context=context)
             pdf_available = os.path.exists(pdf_path)
         except Exception as pdf_error:
             logging.warning(f"PDF generation failed: {str(pdf_error)}")
@@ -589,12 +741,23 @@ def api_upload():
             'tier_info': enhanced_analysis['tier_info'],
             'score_breakdown': enhanced_analysis['score_breakdown'],
             'transaction_summary': enhanced_analysis['transaction_summary'],
+            'redundancy': enhanced_analysis['redundancy'],
+            'top_detractors': enhanced_analysis['top_detractors'],
+            'subscriptions': context.subscriptions,
+            'duplicates': context.duplicates,
+            'anomalies': context.anomalies,
+            'forecast': context.forecast,
+            'vendor_resolution': vendor_resolution,
+            'score_series': score_series,
+            'dataset_fingerprint': fingerprint,
             'ai_insights': insights,
             'analysis_timestamp': datetime.now().isoformat(),
             'company_name': company_name if company_name else None,
             'logo_path': logo_path if logo_path else None,
             'pdf_available': pdf_available,
-            'mapping_used': mapping,
+            'mapping_used': parse_info.get('mapping', mapping),
+            'encoding': parse_info['encoding'],
+            'layout': parse_info.get('layout'),
             'total_transactions_processed': len(transactions),
             'total_amount_analyzed': total_amount
         }
@@ -616,6 +779,41 @@ def api_upload():
 
 
 
+@app.route('/api/upload/preview', methods=['POST', 'OPTIONS'])
+def api_upload_preview():
+    """Describe the first rows of a CSV file for column mapping, without saving or analyzing it"""
+    if request.method == 'OPTIONS':
+        response = jsonify({})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,Accept')
+        response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
+        return response
+    try:
+        if 'file' not in request.files:
+            return jsonify({'error': 'No file provided'}), 400
+
+        file = request.files['file']
+        if file.filename == '' or not allowed_file(file.filename):
+            return jsonify({'error': 'Invalid file type. Only CSV files are allowed.'}), 400
+
+        try:
+            preview = preview_csv(file.stream, tenant=optional_identity())
+        except Exception as preview_error:
+            return jsonify({
+                'error': str(preview_error),
+                'details': 'Please check that the file is a valid CSV with a header row'
+            }), 400
+
+        return jsonify({
+            'success': True,
+            'filename': secure_filename(file.filename),
+            **preview
+        })
+
+    except Exception as e:
+        logging.error(f"Preview error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/report', methods=['GET'])
 def api_download_report():
     """API endpoint to download latest PDF report"""
@@ -780,6 +978,77 @@ def get_spend_score():
             'created_at': None
         })
 
+@app.route('/api/spend-score/batch', methods=['POST'])
+@jwt_required()
+def score_batch():
+    """Score many datasets (e.g. one per client company) in one request"""
+    try:
+        user = get_current_user()
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+
+        data = request.get_json(silent=True) or {}
+        datasets = data.get('datasets')
+        if not isinstance(datasets, list) or not datasets:
+            return jsonify({
+                'error': 'No datasets provided',
+                'details': 'Send {"datasets": [{"name": ..., "transactions": [...]}, ...]}'
+            }), 400
+        if len(datasets) > MAX_BATCH_DATASETS:
+            return jsonify({
+                'error': 'Too many datasets',
+                'details': f'At most {MAX_BATCH_DATASETS} datasets can be scored per request'
+            }), 400
+
+        engine = data.get('engine', 'vectorized')
+        if engine not in ENGINES:
+            return jsonify({
+                'error': f'Invalid engine: {engine}',
+                'details': f"Choose from: {', '.join(ENGINES)}"
+            }), 400
+
+        metric_profile = data.get('metric_profile', 'default')
+        try:
+            resolve_metrics(metric_profile)
+        except (ValueError, TypeError, AttributeError) as e:
+            return jsonify({'error': 'Invalid metric profile', 'details': str(e)}), 400
+
+        # Malformed datasets fail on their own; the rest are scored together
+        names = []
+        results = []
+        valid = []
+        for index, dataset in enumerate(datasets):
+            transactions = dataset.get('transactions') if isinstance(dataset, dict) else dataset
+            names.append(dataset.get('name', str(index)) if isinstance(dataset, dict) else str(index))
+            if isinstance(transactions, list) and all(isinstance(t, dict) for t in transactions):
+                valid.append((index, transactions))
+                results.append(None)
+            else:
+                results.append({'error': 'Transactions must be a list of objects'})
+
+        analyses = score_many([transactions for _, transactions in valid], engine=engine, metric_profile=metric_profile)
+        for (index, _), analysis in zip(valid, analyses):
+            results[index] = analysis
+
+        response = []
+        for name, result in zip(names, results):
+            if 'error' in result:
+                response.append({'name': name, 'success': False, 'error': result['error']})
+            else:
+                response.append({'name': name, 'success': True, 'spend_score': result['final_score'], 'analysis': result})
+
+        return jsonify({
+            'success': True,
+            'engine': engine,
+            'total': len(response),
+            'failed': sum(not result['success'] for result in response),
+            'results': response
+        })
+
+    except Exception as e:
+        logging.error(f"Batch scoring error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/docs')
 def api_documentation():
     """API documentation endpoint"""
@@ -792,14 +1061,39 @@ def api_documentation():
             "POST /upload": {
                 "description": "Upload CSV and trigger analysis",
                 "parameters": {
-                    "file": "CSV file (multipart/form-data)"
+                    "file": "CSV file (multipart/form-data)",
+                    "metric_profile": "Named set of SpendScore metrics to score (optional, default 'default')"
                 },
                 "response": "Analysis results with SpendScore and insights"
             },
+            "POST /upload/preview": {
+                "description": "Preview the first rows of a CSV for column mapping",
+                "parameters": {
+                    "file": "CSV file (multipart/form-data)"
+                },
+                "response": "Headers, suggested mapping, column types, null and parse-failure rates"
+            },
+            "POST /reports/<report_id>/simulate": {
+                "description": "Re-score a report with custom metric weights and category classifications",
+                "parameters": {
+                    "weights": "Metric weights to override (JSON body)",
+                    "category_overrides": "Category to 'essential', 'low_value' or 'neutral' (JSON body)"
+                },
+                "response": "Baseline and simulated final scores"
+            },
             "GET /spend-score": {
                 "description": "Return JSON of latest SpendScore metrics",
                 "response": "SpendScore breakdown and tier information"
             },
+            "POST /spend-score/batch": {
+                "description": "Score many transaction datasets in parallel",
+                "parameters": {
+                    "datasets": "List of {name, transactions} objects (JSON body)",
+                    "engine": "'standard' or 'vectorized' (optional, JSON body)",
+                    "metric_profile": "Profile name, metric list or metric-to-weight mapping (optional, JSON body)"
+                },
+                "response": "Per-dataset analysis or error, in input order"
+            },
             "GET /report": {
                 "description": "Download latest PDF report",
                 "response": "PDF file download"
@@ -860,7 +1154,7 @@ def serve_static(filename):
 @app.errorhandler(413)
 def too_large(e):
     """Handle file too large error"""
-    return jsonify({'error': 'File is too large. Maximum size is 16MB.'}), 413
+    return jsonify({'error': f'File is too large. Maximum size is {MAX_UPLOAD_MB}MB.'}), 413
 
 @app.errorhandler(404)
 def not_found(e):
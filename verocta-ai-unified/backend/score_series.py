@@ -0,0 +1,183 @@
+"""
+VeroctaAI Score Series
+SpendScore and its six metrics per tumbling or rolling time window
+"""
+
+import numpy as np
+from typing import List, Dict, Any, Union
+
+from transaction_batch import TransactionBatch
+from analysis_context import AnalysisContext
+from spend_score_engine import SpendScoreEngine, find_redundant_pairs, _exact_mean
+
+# Calendar periods a window can be built from
+SERIES_PERIODS = ('week', 'month', 'quarter')
+
+# Day 4 of the epoch (1970-01-05) is a Monday; weeks start on Mondays
+_FIRST_MONDAY = 4
+
+
+def _period_index(dates: np.ndarray, period: str) -> np.ndarray:
+    """Sequential index of the week, month or quarter each date falls in"""
+    if period == 'week':
+        return (dates.astype('datetime64[D]').astype(np.int64) - _FIRST_MONDAY) // 7
+    months = dates.astype('datetime64[M]').astype(np.int64)
+    return months // 3 if period == 'quarter' else months
+
+
+def _period_start(index: int, period: str) -> np.datetime64:
+    """First day of the period with the given index"""
+    if period == 'week':
+        return np.datetime64(_FIRST_MONDAY + 7 * int(index), 'D')
+    months = int(index) * 3 if period == 'quarter' else int(index)
+    return np.datetime64(months, 'M').astype('datetime64[D]')
+
+
+def calculate_score_series(transactions: Union[TransactionBatch, List[Dict[str, Any]]] = None, context: AnalysisContext = None,
+                           period: str = 'month', window: int = 1, rolling: bool = False) -> Dict[str, Any]:
+    """Score each window of ``window`` consecutive periods with the SpendScore metrics
+
+    Tumbling windows step by ``window`` periods; rolling windows step by
+    one. Per-category counts and totals, and redundancy penalties, are
+    taken from cumulative sums over periods, and the amount quantiles of
+    each window from a partition of its slice of the date-sorted amounts,
+    so the engine is never re-run per window. Each window is scored as if
+    its transactions had been uploaded on their own; undated transactions
+    and empty windows are left out.
+    """
+    if period not in SERIES_PERIODS:
+        raise ValueError(f"Unknown series period '{period}'. Choose from: {', '.join(SERIES_PERIODS)}")
+    if window < 1:
+        raise ValueError("Series window must be at least one period")
+
+    batch = context.batch if context is not None else TransactionBatch.coerce(transactions)
+    series = {'period': period, 'window': window, 'rolling': rolling, 'windows': []}
+
+    dated = np.flatnonzero(~np.isnat(batch.dates))
+    if not len(dated):
+        return series
+
+    # Date-sorted transactions and the slice of them in each period
+    periods = _period_index(batch.dates[dated], period)
+    first_period = int(periods.min())
+    periods -= first_period
+    num_periods = int(periods.max()) + 1
+    order = dated[np.argsort(periods, kind='stable')]
+    periods = np.sort(periods, kind='stable')
+    bounds = np.searchsorted(periods, np.arange(num_periods + 1))
+    amounts = batch.amounts[order]
+
+    # Cumulative per-category counts and totals by period
+    names, category_codes = SpendScoreEngine._normalize_category_codes(batch)
+    num_categories = len(names)
+    cells = periods * num_categories + category_codes[order]
+    counts = np.bincount(cells, minlength=num_periods * num_categories).reshape(num_periods, num_categories)
+    totals = np.bincount(cells, weights=amounts, minlength=num_periods * num_categories).reshape(num_periods, num_categories)
+    count_sums = np.vstack([np.zeros((1, num_categories), dtype=np.int64), np.cumsum(counts, axis=0)])
+    total_sums = np.vstack([np.zeros((1, num_categories)), np.cumsum(totals, axis=0)])
+
+    waste_classes = [SpendScoreEngine._waste_class(name) for name in names]
+    low_value = np.array([waste_class == 'low_value' for waste_class in waste_classes], dtype=bool)
+    essential = np.array([waste_class == 'essential' for waste_class in waste_classes], dtype=bool)
+
+    # Redundant pairs lie in one period or straddle two neighbours (the window is under a week)
+    first, second, hours = find_redundant_pairs(batch.vendor_codes, batch.dates)
+    period_of = np.empty(len(batch), dtype=np.int64)
+    period_of[order] = periods
+    same_period = period_of[first] == period_of[second]
+    penalties = np.maximum(0, 100 - hours * 2)
+    pair_cells = period_of[first] * 2 + ~same_period
+    pair_counts = np.bincount(pair_cells, minlength=num_periods * 2).reshape(num_periods, 2)
+    pair_penalties = np.bincount(pair_cells, weights=penalties, minlength=num_periods * 2).reshape(num_periods, 2)
+    pair_count_sums = np.vstack([np.zeros((1, 2), dtype=np.int64), np.cumsum(pair_counts, axis=0)])
+    pair_penalty_sums = np.vstack([np.zeros((1, 2)), np.cumsum(pair_penalties, axis=0)])
+
+    weights = SpendScoreEngine.WEIGHTS
+    total_weight = sum(weights.values())
+    step = 1 if rolling else window
+    last_start = max(num_periods - window, 0)
+
+    for start in range(0, last_start + 1, step):
+        end = min(start + window, num_periods)
+        lo, hi = bounds[start], bounds[end]
+        n = hi - lo
+        if n == 0:
+            continue
+
+        window_counts = count_sums[end] - count_sums[start]
+        window_totals = total_sums[end] - total_sums[start]
+        present = window_counts > 0
+        window_amounts = amounts[lo:hi]
+
+        # Pairs within the window: same-period pairs of its periods, and straddling pairs except the last period's
+        pairs = (pair_count_sums[end, 0] - pair_count_sums[start, 0]) + (pair_count_sums[end - 1, 1] - pair_count_sums[start, 1])
+        penalty = (pair_penalty_sums[end, 0] - pair_penalty_sums[start, 0]) + (pair_penalty_sums[end - 1, 1] - pair_penalty_sums[start, 1])
+
+        scores = {
+            'frequency_score': _frequency_score(window_counts[present]),
+            'category_diversity': _category_diversity(int(present.sum())),
+            'budget_adherence': 0.0,
+            'redundancy_detection': 100.0 if n < 2 else (max(0, 100 - penalty / pairs) if pairs else 100),
+            'spike_detection': 100.0,
+            'waste_ratio': _waste_ratio(window_totals[present], low_value[present], essential[present])
+        }
+
+        # Median and quartiles at the engine's positions, from one partition of the window's amounts
+        kth = sorted({(n - 1) // 2, n // 2, n // 4, 3 * n // 4})
+        partitioned = np.partition(window_amounts, kth)
+        median_amount = (partitioned[(n - 1) // 2] + partitioned[n // 2]) / 2
+        scores['budget_adherence'] = _budget_adherence(window_amounts, median_amount)
+        if n >= 4:
+            scores['spike_detection'] = _spike_detection(window_amounts, partitioned[n // 4], partitioned[3 * n // 4], median_amount)
+
+        weighted_score = sum(score * weights[metric] / 100 for metric, score in scores.items())
+        series['windows'].append({
+            'start': str(_period_start(first_period + start, period)),
+            'end': str(_period_start(first_period + end, period)),
+            'transactions': int(n),
+            'total_amount': round(float(window_amounts.sum()), 2),
+            'final_score': round(weighted_score / total_weight * 100),
+            'scores': {metric: round(score, 2) for metric, score in scores.items()}
+        })
+
+    return series
+
+
+def _frequency_score(category_counts: np.ndarray) -> float:
+    ratios = category_counts / category_counts.sum()
+    scores = np.where(ratios < 0.05, ratios / 0.05 * 100,
+                      np.where(ratios <= 0.25, 100.0, np.maximum(0, 100 * (1 - (ratios - 0.25) / 0.75))))
+    return _exact_mean(scores.astype(np.float64))
+
+
+def _category_diversity(unique_categories: int) -> float:
+    if 5 <= unique_categories <= 15:
+        return 100
+    if unique_categories < 5:
+        return (unique_categories / 5) * 100
+    return max(0, 100 - (unique_categories - 15) * 5)
+
+
+def _budget_adherence(amounts: np.ndarray, benchmark: float) -> float:
+    if benchmark <= 0:
+        return 50
+    deviation = np.abs(amounts - benchmark) / benchmark
+    return _exact_mean(np.maximum(0, 100 * (1 - np.minimum(deviation, 2) / 2)))
+
+
+def _spike_detection(amounts: np.ndarray, q1: float, q3: float, median_amount: float) -> float:
+    outliers = amounts[amounts > q3 + 1.5 * (q3 - q1)]
+    if len(outliers) and median_amount > 0:
+        outlier_ratio = len(outliers) / len(amounts)
+        outlier_severity = float(outliers.max()) / median_amount
+        return max(0, 100 * (1 - outlier_ratio) * (1 - min(outlier_severity / 10, 1)))
+    return 100
+
+
+def _waste_ratio(category_totals: np.ndarray, low_value: np.ndarray, essential: np.ndarray) -> float:
+    total_spending = float(category_totals.sum())
+    if total_spending <= 0:
+        return 50
+    waste_ratio = float(category_totals[low_value].sum()) / total_spending
+    essential_ratio = float(category_totals[essential].sum()) / total_spending
+    return min(100, max(0, 100 * (1 - waste_ratio)) + min(20, essential_ratio * 40))
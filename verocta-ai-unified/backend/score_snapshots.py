@@ -0,0 +1,230 @@
+"""
+VeroctaAI Score Snapshots
+Per-metric results of an analysis, cached by dataset fingerprint for what-if re-weighting
+"""
+
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+from parse_cache import cache_key
+from spend_score_engine import SpendScoreEngine
+
+# Snapshots are JSON files here, so every worker can simulate any upload
+SCORE_SNAPSHOT_DIR = os.environ.get('SCORE_SNAPSHOT_DIR', os.path.join('cache', 'score_snapshots'))
+
+# Snapshots kept (in memory and on disk) before the least recently used are dropped
+SCORE_SNAPSHOT_LIMIT = 512
+
+# Fingerprints are SHA-256 hex digests; anything else never reaches the filesystem
+FINGERPRINT_PATTERN = re.compile(r'[0-9a-f]{64}')
+
+# Classes a category can be overridden to in a simulation
+CATEGORY_CLASSES = ('essential', 'low_value', 'neutral')
+
+
+def is_fingerprint(value: Any) -> bool:
+    """Whether a value, e.g. one sent back by a client, is a well-formed dataset fingerprint"""
+    return isinstance(value, str) and FINGERPRINT_PATTERN.fullmatch(value) is not None
+
+
+def dataset_fingerprint(parse_info: Dict[str, Any], metric_profile: str = 'default', tenant: str = 'default') -> Optional[str]:
+    """Identify an analysis by file content, mapping, metric profile and tenant
+
+    The tenant matters because its vendor map changes how vendors resolve.
+    Returns None when the file digest is unknown.
+    """
+    if not parse_info.get('file_sha256'):
+        return None
+    payload = json.dumps({
+        'parse': cache_key(parse_info['file_sha256'], parse_info.get('mapping')),
+        'metric_profile': metric_profile,
+        'tenant': tenant
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ScoreSnapshot:
+    """The raw metric scores, their weights and normalized category totals of one analysis
+
+    Only the waste ratio depends on how categories are classified, so it is
+    recomputed from the category totals when overrides are given; every
+    other metric is reused as is. Simulating never touches the transactions.
+    """
+
+    def __init__(self, fingerprint: str, individual_scores: Dict[str, float], category_spending: Dict[str, float],
+                 weights: Optional[Dict[str, float]] = None):
+        self.fingerprint = fingerprint
+        self.individual_scores = dict(individual_scores)
+        self.category_spending = dict(category_spending)
+        self.weights = dict(weights or SpendScoreEngine.WEIGHTS)
+
+    @classmethod
+    def from_analysis(cls, fingerprint: str, analysis: Dict[str, Any]) -> 'ScoreSnapshot':
+        """Snapshot the result of ``get_enhanced_analysis``"""
+        breakdown = analysis['score_breakdown']
+        return cls(fingerprint, breakdown['individual_scores'], analysis['category_spending'], breakdown.get('weights'))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'fingerprint': self.fingerprint,
+            'individual_scores': self.individual_scores,
+            'category_spending': self.category_spending,
+            'weights': self.weights
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ScoreSnapshot':
+        return cls(data['fingerprint'], data['individual_scores'], data['category_spending'], data.get('weights'))
+
+    def simulate(self, weights: Optional[Dict[str, float]] = None,
+                 category_overrides: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """Final score under custom metric weights and category classifications
+
+        ``weights`` replaces any of the weights the analysis was scored with;
+        ``category_overrides`` maps category names to 'essential', 'low_value'
+        or 'neutral'.
+        """
+        merged_weights = dict(self.weights)
+        for metric, weight in (weights or {}).items():
+            if metric not in merged_weights:
+                raise ValueError(f"Unknown metric '{metric}'. Choose from: {', '.join(merged_weights)}")
+            if not isinstance(weight, (int, float)) or isinstance(weight, bool) or weight < 0:
+                raise ValueError(f"Weight for '{metric}' must be a non-negative number")
+            merged_weights[metric] = weight
+        total_weight = sum(merged_weights.values())
+        if total_weight <= 0:
+            raise ValueError("At least one weight must be positive")
+
+        scores = dict(self.individual_scores)
+        if category_overrides and 'waste_ratio' in scores:
+            scores['waste_ratio'] = self._waste_ratio(category_overrides)
+
+        # Weighted exactly as SpendScoreEngine.calculate_spend_score does
+        weighted_score = 0
+        for metric, score in scores.items():
+            weighted_score += (score * merged_weights.get(metric, 0) / 100)
+        final_score = round((weighted_score / total_weight) * 100)
+
+        return {
+            'final_score': final_score,
+            'tier_info': SpendScoreEngine.get_score_tier(final_score),
+            'weights': merged_weights,
+            'individual_scores': scores
+        }
+
+    def _waste_ratio(self, category_overrides: Dict[str, str]) -> float:
+        """Waste ratio score with some categories reclassified"""
+        overrides = {}
+        for category, waste_class in category_overrides.items():
+            if waste_class not in CATEGORY_CLASSES:
+                raise ValueError(f"Category class for '{category}' must be one of: {', '.join(CATEGORY_CLASSES)}")
+            overrides[SpendScoreEngine._normalize_category(category)] = waste_class
+
+        total_spending = sum(self.category_spending.values())
+        if total_spending <= 0:
+            return 50
+
+        low_value_spending = 0
+        essential_spending = 0
+        for category, amount in self.category_spending.items():
+            waste_class = overrides.get(category) or SpendScoreEngine._waste_class(category)
+            if waste_class == 'low_value':
+                low_value_spending += amount
+            elif waste_class == 'essential':
+                essential_spending += amount
+
+        waste_score = max(0, 100 * (1 - low_value_spending / total_spending))
+        essential_bonus = min(20, essential_spending / total_spending * 40)
+        return min(100, waste_score + essential_bonus)
+
+
+class ScoreSnapshotStore:
+    """Snapshots keyed by dataset fingerprint, in JSON files shared by all workers
+
+    A thread-safe in-memory LRU sits in front of the directory, so repeated
+    simulations of one upload in a worker skip the file read. Files are
+    written atomically; the least recently used beyond ``limit`` are removed.
+    """
+
+    def __init__(self, directory: str = SCORE_SNAPSHOT_DIR, limit: int = SCORE_SNAPSHOT_LIMIT):
+        self.directory = directory
+        self.limit = limit
+        self._snapshots = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, fingerprint: str) -> Optional[str]:
+        """Snapshot file of a fingerprint, or None if it is not a well-formed fingerprint"""
+        if not is_fingerprint(fingerprint):
+            return None
+        return os.path.join(self.directory, f"{fingerprint}.json")
+
+    def _remember(self, snapshot: ScoreSnapshot):
+        with self._lock:
+            self._snapshots[snapshot.fingerprint] = snapshot
+            self._snapshots.move_to_end(snapshot.fingerprint)
+            while len(self._snapshots) > self.limit:
+                self._snapshots.popitem(last=False)
+
+    def put(self, snapshot: ScoreSnapshot):
+        path = self._path(snapshot.fingerprint)
+        if path is None:
+            logging.warning("Not storing score snapshot with a malformed fingerprint")
+            return
+        self._remember(snapshot)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump(snapshot.to_dict(), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"Could not save score snapshot {snapshot.fingerprint[:12]}: {str(e)}")
+            return
+        self._evict()
+
+    def get(self, fingerprint: str) -> Optional[ScoreSnapshot]:
+        path = self._path(fingerprint)
+        if path is None:
+            return None
+
+        with self._lock:
+            snapshot = self._snapshots.get(fingerprint)
+            if snapshot is not None:
+                self._snapshots.move_to_end(fingerprint)
+                return snapshot
+
+        # Stored by another worker, or before this one started
+        try:
+            with open(path, 'r') as f:
+                snapshot = ScoreSnapshot.from_dict(json.load(f))
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Could not load score snapshot {fingerprint[:12]}: {str(e)}")
+            return None
+        self._remember(snapshot)
+        return snapshot
+
+    def _evict(self):
+        """Remove the least recently used snapshot files beyond the limit"""
+        try:
+            entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith('.json')]
+            stale = sorted(entries, key=lambda entry: entry.stat().st_mtime, reverse=True)[self.limit:]
+        except OSError as e:
+            logging.warning(f"Could not scan score snapshots: {str(e)}")
+            return
+        for entry in stale:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+score_snapshots = ScoreSnapshotStore()
@@ -3,12 +3,71 @@ VeroctaAI SpendScore Engine - Enhanced Version
 Complete logic breakdown with weighted metrics as per requirements
 """
 
+import heapq
 import logging
 import math
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from fractions import Fraction
 from datetime import datetime, timedelta
 from collections import defaultdict, Counter
 from statistics import median, mean
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Iterable, Union, Optional, Callable
+
+import numpy as np
+import pandas as pd
+
+from transaction_batch import TransactionBatch
+from analysis_context import AnalysisContext
+from quantile_sketch import QuantileSketch
+from anomaly_detector import segment_z_scores, ROBUST_Z_THRESHOLD
+from metric_registry import MetricInputs, register_metric, register_precomputation, register_profile, resolve_metrics, compute_metrics, load_profiles
+
+# Same-vendor transactions closer together than this are flagged as redundant
+REDUNDANCY_WINDOW_HOURS = 24
+
+# Flagged pairs listed in the detailed analysis, closest first
+REDUNDANCY_PAIR_LIMIT = 20
+
+# Transactions listed as the biggest detractors in the detailed analysis
+DETRACTOR_LIMIT = 10
+
+# How the median and quartiles of amounts are found: sorted exactly, from a
+# QuantileSketch, or ('auto') from a sketch once there are enough transactions
+QUANTILE_MODES = ('exact', 'sketch', 'auto')
+SKETCH_MIN_TRANSACTIONS = 1_000_000
+
+# Datasets scored per worker task by score_many, and the batch size below which
+# scoring stays in-process because starting workers would cost more than it saves
+SCORE_MANY_CHUNK_SIZE = 8
+SCORE_MANY_MIN_PARALLEL = 4
+
+
+def find_redundant_pairs(vendor_codes: np.ndarray, timestamps: np.ndarray,
+                         window_hours: float = REDUNDANCY_WINDOW_HOURS) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Find consecutive same-vendor transactions within ``window_hours`` of each other
+
+    Dated transactions are sorted once by (vendor code, timestamp) and the
+    gaps between neighbours of the same vendor are taken with a single diff.
+    Returns the indices of the earlier and later transaction of each flagged
+    pair, in the original transaction order, and the hours between them.
+    """
+    dated = np.flatnonzero(~np.isnat(timestamps))
+    if len(dated) < 2:
+        empty = np.array([], dtype=np.intp)
+        return empty, empty, np.array([], dtype=np.float64)
+
+    seconds = timestamps[dated].astype('datetime64[s]').astype(np.int64)
+    order = dated[np.lexsort((seconds, vendor_codes[dated]))]
+    vendors = vendor_codes[order]
+    seconds = timestamps[order].astype('datetime64[s]').astype(np.int64)
+
+    hours = np.diff(seconds) / 3600.0
+    close = np.flatnonzero((vendors[1:] == vendors[:-1]) & (hours <= window_hours))
+    return order[close], order[close + 1], hours[close]
+
 
 class SpendScoreEngine:
     """Enhanced SpendScore calculation engine with detailed metrics"""
@@ -34,59 +93,170 @@ class SpendScoreEngine:
         'fast food', 'coffee', 'alcohol', 'tobacco', 'impulse purchases'
     }
     
-    def __init__(self, transactions: List[Dict[str, Any]]):
-        """Initialize with transaction data"""
-        self.transactions = transactions
-        self.total_amount = sum(t.get('amount', 0) for t in transactions)
-        self.num_transactions = len(transactions)
+    # Map common variations to standard categories (first matching key wins)
+    CATEGORY_MAPPINGS = {
+        'food': 'groceries',
+        'gas': 'fuel',
+        'petrol': 'fuel',
+        'restaurant': 'dining',
+        'cafe': 'coffee',
+        'subscription': 'subscriptions',
+        'streaming': 'subscriptions',
+        'electric': 'utilities',
+        'water': 'utilities',
+        'internet': 'utilities',
+        'phone': 'utilities'
+    }
+    
+    def __init__(self, transactions: Union[List[Dict[str, Any]], TransactionBatch] = None, batches: Iterable[List[Dict[str, Any]]] = None,
+                 context: AnalysisContext = None, quantile_mode: str = 'exact', metric_profile: Union[str, Iterable[str], Dict[str, Optional[float]]] = 'default'):
+        """Initialize with transaction data, either as a list or as streamed batches
+
+        ``transactions`` may also be a columnar ``TransactionBatch``, or a
+        precomputed ``AnalysisContext`` may be passed as ``context``; both
+        are scored from shared aggregates without building per-transaction
+        dicts. When ``batches`` is given (see ``csv_parser.iter_csv_batches``)
+        the transactions are consumed one batch at a time and only the
+        per-transaction columns needed for scoring are retained.
+
+        ``quantile_mode`` is one of QUANTILE_MODES. In 'sketch' mode the
+        median and quartiles come from a QuantileSketch instead of a sort,
+        and the sketch's relative error is reported in the score breakdown.
+
+        ``metric_profile`` selects the metrics scored and their weights: a
+        profile name registered in metric_registry, a list of metric names
+        or a mapping of metric names to weights.
+        """
+        if quantile_mode not in QUANTILE_MODES:
+            raise ValueError(f"Unknown quantile mode '{quantile_mode}'. Choose from: {', '.join(QUANTILE_MODES)}")
+        self.quantile_mode = quantile_mode
+        self.amount_sketch = None
+        self.weights = resolve_metrics(metric_profile)
+        self._factorized_categories = None
+        
+        # Per-transaction arrays recorded by the metrics for attribution
+        self.contributions = {}
+        
+        if context is None and isinstance(transactions, TransactionBatch):
+            context = AnalysisContext(transactions)
+        self.context = context
+        self.transactions = context.batch if context is not None else (transactions if transactions is not None else [])
         self.score_breakdown = {}
         
+        # Vendor code and date of every transaction, for redundancy detection
+        self.vendor_codes = np.array([], dtype=np.intp)
+        self.vendor_names = np.array([], dtype=object)
+        self.transaction_timestamps = np.array([], dtype='datetime64[s]')
+        self.redundant_pairs = None
+        
         # Process transaction data
-        self._prepare_data()
+        if context is not None:
+            self._prepare_context(context)
+        elif batches is not None:
+            self._prepare_data(transaction for batch in batches for transaction in batch)
+        else:
+            self._prepare_data(self.transactions)
+        
+        self.score_breakdown['quantile_mode'] = 'sketch' if self._use_sketch() else 'exact'
+        self.score_breakdown['quantile_error_bound'] = self._get_amount_sketch().error_bound if self._use_sketch() else 0.0
+        self.score_breakdown['quantile_collapsed'] = self._get_amount_sketch().collapsed if self._use_sketch() else False
     
-    def _prepare_data(self):
-        """Prepare and clean transaction data for analysis"""
+    def _prepare_context(self, context: AnalysisContext):
+        """Prepare analysis data from shared aggregates, normalizing each distinct category once"""
         try:
-            # Extract amounts and ensure numeric values
-            self.amounts = [float(t.get('amount', 0)) for t in self.transactions]
+            batch = context.batch
+            self.amounts = batch.amounts.tolist()
+            self.total_amount = context.total_amount
+            self.num_transactions = context.num_transactions
             
-            # Calculate median instead of average (as per requirements)
-            self.median_amount = median(self.amounts) if self.amounts else 0
-            self.mean_amount = mean(self.amounts) if self.amounts else 0
+            names, category_codes = self._normalize_category_codes(batch)
+            self.transaction_categories = np.array(names, dtype=object)[category_codes].tolist()
+            self.category_spending = defaultdict(float, zip(names, np.bincount(category_codes, weights=batch.amounts, minlength=len(names)).tolist()))
             
-            # Group by categories and vendors
-            self.category_spending = defaultdict(float)
-            self.vendor_spending = defaultdict(float)
-            self.vendor_frequency = defaultdict(int)
+            self.transaction_vendors = batch.vendors.tolist()
+            self.vendor_spending = defaultdict(float, context.vendor_totals)
+            self.vendor_frequency = defaultdict(int, context.vendor_counts)
             
-            # Process dates
-            self.transaction_dates = []
+            self.transaction_dates = context.sorted_dates.astype(object).tolist()
+            self.vendor_codes, self.vendor_names = batch.vendor_codes, batch.vendor_names
+            self.transaction_timestamps = batch.dates
             
-            for transaction in self.transactions:
+            self.median_amount = self._median()
+            self.mean_amount = context.mean_amount
+            
+        except Exception as e:
+            logging.error(f"Error preparing data: {str(e)}")
+            self.amounts = [0]
+            self.median_amount = 0
+            self.mean_amount = 0
+    
+    @classmethod
+    def _normalize_category_codes(cls, batch: TransactionBatch) -> Tuple[List[str], np.ndarray]:
+        """Normalize each distinct category of a batch once
+
+        Returns the normalized names in order of first appearance and the
+        normalized category code of every transaction.
+        """
+        names = []
+        positions = {}
+        lookup = np.zeros(len(batch.category_names), dtype=np.intp)
+        for i, name in enumerate(batch.category_names):
+            normalized = cls._normalize_category(name)
+            if normalized not in positions:
+                positions[normalized] = len(names)
+                names.append(normalized)
+            lookup[i] = positions[normalized]
+        return names, lookup[batch.category_codes]
+    
+    def _prepare_data(self, transactions: Iterable[Dict[str, Any]]):
+        """Prepare and clean transaction data for analysis"""
+        self.total_amount = 0
+        self.num_transactions = 0
+        self.amounts = []
+        self.transaction_vendors = []
+        self.transaction_categories = []
+        
+        # Group by categories and vendors
+        self.category_spending = defaultdict(float)
+        self.vendor_spending = defaultdict(float)
+        self.vendor_frequency = defaultdict(int)
+        
+        # Process dates, both sorted and aligned with each transaction (None when missing)
+        self.transaction_dates = []
+        timestamps = []
+        
+        try:
+            for transaction in transactions:
+                # Extract amounts and ensure numeric values
+                amount = float(transaction.get('amount', 0))
+                self.amounts.append(amount)
+                self.total_amount += amount
+                self.num_transactions += 1
+                
                 # Category grouping
                 category = self._normalize_category(transaction.get('category', 'Uncategorized'))
-                amount = float(transaction.get('amount', 0))
                 self.category_spending[category] += amount
+                self.transaction_categories.append(category)
                 
                 # Vendor grouping
                 vendor = transaction.get('vendor', 'Unknown')
                 self.vendor_spending[vendor] += amount
                 self.vendor_frequency[vendor] += 1
+                self.transaction_vendors.append(vendor)
                 
                 # Date processing
-                date = transaction.get('date')
-                if date:
-                    if isinstance(date, str):
-                        try:
-                            date = datetime.strptime(date, '%Y-%m-%d')
-                        except:
-                            try:
-                                date = datetime.strptime(date, '%m/%d/%Y')
-                            except:
-                                continue
+                date = self._parse_date(transaction.get('date'))
+                timestamps.append(date)
+                if date is not None:
                     self.transaction_dates.append(date)
             
             self.transaction_dates.sort()
+            self.vendor_codes, self.vendor_names = pd.factorize(pd.Series(self.transaction_vendors, dtype=object), use_na_sentinel=False)
+            self.transaction_timestamps = np.array(timestamps, dtype='datetime64[s]')
+            
+            # Calculate median instead of average (as per requirements)
+            self.median_amount = self._median()
+            self.mean_amount = mean(self.amounts) if self.amounts else 0
             
         except Exception as e:
             logging.error(f"Error preparing data: {str(e)}")
@@ -94,34 +264,106 @@ class SpendScoreEngine:
             self.median_amount = 0
             self.mean_amount = 0
     
-    def _normalize_category(self, category: str) -> str:
-        """Normalize category names for consistent analysis"""
+    @staticmethod
+    def _parse_date(date: Any) -> Optional[Any]:
+        """Return a transaction date as a date/datetime, or None when missing or unparseable"""
+        if not date:
+            return None
+        if isinstance(date, str):
+            for date_format in ('%Y-%m-%d', '%m/%d/%Y'):
+                try:
+                    return datetime.strptime(date, date_format)
+                except ValueError:
+                    continue
+            return None
+        return date
+    
+    def _use_sketch(self) -> bool:
+        """Whether quantiles come from the amount sketch rather than a sort"""
+        if self.quantile_mode == 'auto':
+            return self.num_transactions >= SKETCH_MIN_TRANSACTIONS
+        return self.quantile_mode == 'sketch'
+    
+    def _get_amount_sketch(self) -> QuantileSketch:
+        """Sketch of all amounts, shared with the context when there is one"""
+        if self.amount_sketch is None:
+            self.amount_sketch = self.context.amount_sketch if self.context is not None else QuantileSketch().add(self.amounts)
+        return self.amount_sketch
+    
+    def _median(self) -> float:
+        """Median amount, exact or sketched according to the quantile mode"""
+        if not self.num_transactions:
+            return 0
+        if self._use_sketch():
+            return self._get_amount_sketch().median()
+        if self.context is not None:
+            return self.context.median_amount
+        return median(self.amounts)
+    
+    def _quartiles(self) -> Tuple[float, float]:
+        """First and third quartiles at sorted positions n // 4 and 3n // 4"""
+        n = self.num_transactions
+        if self._use_sketch():
+            sketch = self._get_amount_sketch()
+            return sketch.value_at_rank(n // 4), sketch.value_at_rank(3 * n // 4)
+        if self.context is not None:
+            return self.context.q1, self.context.q3
+        sorted_amounts = sorted(self.amounts)
+        return sorted_amounts[n // 4], sorted_amounts[3 * n // 4]
+    
+    @classmethod
+    def _category_patterns(cls) -> Dict[str, Any]:
+        """Compile the category mapping and waste keyword patterns once per class
+
+        The mapping pattern is an alternation of lookaheads, one per key in
+        CATEGORY_MAPPINGS order, so the first key contained anywhere in the
+        category wins, exactly as a scan over the mapping would.
+        """
+        patterns = cls.__dict__.get('_compiled_patterns')
+        if patterns is None:
+            keys = list(cls.CATEGORY_MAPPINGS)
+            patterns = {
+                'keys': keys,
+                'mapping': re.compile('^(?:' + '|'.join(f'(?=.*?({re.escape(key)}))' for key in keys) + ')', re.DOTALL),
+                'low_value': re.compile('|'.join(re.escape(keyword) for keyword in sorted(cls.LOW_VALUE_CATEGORIES))),
+                'essential': re.compile('|'.join(re.escape(keyword) for keyword in sorted(cls.ESSENTIAL_CATEGORIES)))
+            }
+            cls._compiled_patterns = patterns
+        return patterns
+    
+    @classmethod
+    @lru_cache(maxsize=4096)
+    def _normalize_category(cls, category: str) -> str:
+        """Normalize category names for consistent analysis (memoized per distinct name)"""
         if not category:
             return 'Uncategorized'
         
         category = category.lower().strip()
         
         # Map common variations to standard categories
-        category_mappings = {
-            'food': 'groceries',
-            'gas': 'fuel',
-            'petrol': 'fuel',
-            'restaurant': 'dining',
-            'cafe': 'coffee',
-            'subscription': 'subscriptions',
-            'streaming': 'subscriptions',
-            'electric': 'utilities',
-            'water': 'utilities',
-            'internet': 'utilities',
-            'phone': 'utilities'
-        }
-        
-        for key, value in category_mappings.items():
-            if key in category:
-                return value
+        patterns = cls._category_patterns()
+        match = patterns['mapping'].match(category)
+        if match:
+            return cls.CATEGORY_MAPPINGS[patterns['keys'][match.lastindex - 1]]
         
         return category
     
+    @classmethod
+    @lru_cache(maxsize=4096)
+    def _waste_class(cls, category: str) -> Optional[str]:
+        """Classify a normalized category as 'low_value', 'essential' or neither (memoized)"""
+        category_lower = category.lower()
+        patterns = cls._category_patterns()
+        if patterns['low_value'].search(category_lower):
+            return 'low_value'
+        if patterns['essential'].search(category_lower):
+            return 'essential'
+        return None
+    
+    def _category_frequencies(self) -> Dict[str, int]:
+        """Number of transactions per normalized category"""
+        return Counter(self.transaction_categories)
+    
     def calculate_frequency_score(self) -> float:
         """
         Calculate frequency score (15% weight)
@@ -132,10 +374,7 @@ class SpendScoreEngine:
                 return 0.0
             
             # Calculate transaction frequency by category
-            category_frequencies = defaultdict(int)
-            for transaction in self.transactions:
-                category = self._normalize_category(transaction.get('category', 'Uncategorized'))
-                category_frequencies[category] += 1
+            category_frequencies = self._category_frequencies()
             
             # Calculate frequency distribution score
             total_transactions = sum(category_frequencies.values())
@@ -208,6 +447,9 @@ class SpendScoreEngine:
                     adherence_score = max(0, 100 * (1 - min(deviation, 2) / 2))
                     adherence_scores.append(adherence_score)
             
+            if adherence_scores:
+                self.contributions['deviation_penalty'] = 100 - np.array(adherence_scores)
+            
             score = mean(adherence_scores) if adherence_scores else 50
             self.score_breakdown['budget_adherence'] = round(score, 2)
             return score
@@ -216,36 +458,36 @@ class SpendScoreEngine:
             logging.error(f"Error calculating budget adherence: {str(e)}")
             return 50.0
     
+    def detect_redundant_pairs(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Flag consecutive same-vendor transactions within the redundancy window
+
+        Returns the earlier and later transaction index of each flagged pair,
+        the hours between them and the penalty each pair contributes. The
+        pairs are kept on the engine for ``get_redundancy_summary``.
+        """
+        first, second, hours = find_redundant_pairs(self.vendor_codes, self.transaction_timestamps)
+        penalties = np.maximum(0, 100 - hours * 2)  # Higher penalty for closer transactions
+        self.redundant_pairs = (first, second, hours)
+        return first, second, hours, penalties
+    
     def calculate_redundancy_detection(self) -> float:
         """
         Calculate redundancy detection score (15% weight)
         Repeated vendor/expense types within short timespan
         """
         try:
-            if len(self.transaction_dates) < 2:
+            if np.count_nonzero(~np.isnat(self.transaction_timestamps)) < 2:
                 return 100.0  # No redundancy possible with <2 transactions
             
-            # Group transactions by vendor and date
-            vendor_dates = defaultdict(list)
-            for i, transaction in enumerate(self.transactions):
-                vendor = transaction.get('vendor', 'Unknown')
-                if i < len(self.transaction_dates):
-                    vendor_dates[vendor].append(self.transaction_dates[i])
-            
-            redundancy_penalties = []
-            
-            # Check for transactions with same vendor within 24 hours
-            for vendor, dates in vendor_dates.items():
-                if len(dates) > 1:
-                    dates.sort()
-                    for i in range(len(dates) - 1):
-                        time_diff = (dates[i + 1] - dates[i]).total_seconds() / 3600  # hours
-                        if time_diff <= 24:  # Within 24 hours
-                            penalty = max(0, 100 - time_diff * 2)  # Higher penalty for closer transactions
-                            redundancy_penalties.append(penalty)
-            
-            if redundancy_penalties:
-                avg_penalty = mean(redundancy_penalties)
+            _, second, _, penalties = self.detect_redundant_pairs()
+            
+            # Each pair's penalty is charged to its later transaction
+            transaction_penalties = np.zeros(self.num_transactions)
+            transaction_penalties[second] = penalties
+            self.contributions['redundancy_penalty'] = transaction_penalties
+            
+            if len(penalties):
+                avg_penalty = _exact_mean(penalties)
                 score = max(0, 100 - avg_penalty)
             else:
                 score = 100  # No redundancy detected
@@ -257,6 +499,39 @@ class SpendScoreEngine:
             logging.error(f"Error calculating redundancy detection: {str(e)}")
             return 75.0
     
+    def get_redundancy_summary(self, limit: int = REDUNDANCY_PAIR_LIMIT) -> Dict[str, Any]:
+        """Flagged redundant pairs, closest together (then largest) first"""
+        if self.redundant_pairs is None:
+            self.detect_redundant_pairs()
+        first, second, hours = self.redundant_pairs
+        
+        amounts = np.asarray(self.amounts, dtype=np.float64)
+        
+        # Only pairs no further apart than the limit-th closest can be listed, so sort just those
+        candidates = np.arange(len(hours))
+        if len(hours) > limit > 0:
+            candidates = np.flatnonzero(hours <= np.partition(hours, limit - 1)[limit - 1])
+        pair_amounts = amounts[first[candidates]] + amounts[second[candidates]]
+        top = candidates[np.lexsort((-pair_amounts, hours[candidates]))][:limit]
+        
+        pairs = []
+        for i in top.tolist():
+            a, b = int(first[i]), int(second[i])
+            pairs.append({
+                'vendor': self.vendor_names[self.vendor_codes[a]],
+                'dates': [str(self.transaction_timestamps[a].astype('datetime64[D]')), str(self.transaction_timestamps[b].astype('datetime64[D]'))],
+                'amounts': [float(amounts[a]), float(amounts[b])],
+                'hours_apart': round(float(hours[i]), 2),
+                'transaction_indices': [a, b]
+            })
+        
+        return {
+            'window_hours': REDUNDANCY_WINDOW_HOURS,
+            'flagged_pairs': int(len(first)),
+            'flagged_amount': round(float(amounts[second].sum()), 2) if len(second) else 0.0,
+            'pairs': pairs
+        }
+    
     def calculate_spike_detection(self) -> float:
         """
         Calculate spike detection score (20% weight)
@@ -267,26 +542,27 @@ class SpendScoreEngine:
                 return 0.0
             
             # Calculate outliers using IQR method
-            sorted_amounts = sorted(self.amounts)
-            n = len(sorted_amounts)
+            n = len(self.amounts)
             
             if n < 4:
                 return 100.0  # Not enough data for outlier detection
             
-            q1 = sorted_amounts[n // 4]
-            q3 = sorted_amounts[3 * n // 4]
+            q1, q3 = self._quartiles()
             iqr = q3 - q1
             
             # Define outlier threshold
             outlier_threshold = q3 + 1.5 * iqr
             
             # Count outliers and calculate their impact
-            outliers = [amount for amount in self.amounts if amount > outlier_threshold]
-            outlier_ratio = len(outliers) / len(self.amounts)
+            amounts = np.asarray(self.amounts)
+            outlier = amounts > outlier_threshold
+            self.contributions['outlier'] = outlier
+            outlier_count = int(np.count_nonzero(outlier))
+            outlier_ratio = outlier_count / n
             
             # Calculate severity of outliers
-            if outliers and self.median_amount > 0:
-                max_outlier = max(outliers)
+            if outlier_count and self.median_amount > 0:
+                max_outlier = float(amounts[outlier].max())
                 outlier_severity = max_outlier / self.median_amount
                 
                 # Score decreases with more outliers and higher severity
@@ -315,15 +591,20 @@ class SpendScoreEngine:
             # Calculate spending on low-value categories
             low_value_spending = 0
             essential_spending = 0
+            low_value_categories = set()
             
             for category, amount in self.category_spending.items():
-                category_lower = category.lower()
+                waste_class = self._waste_class(category)
                 
-                if any(lv_cat in category_lower for lv_cat in self.LOW_VALUE_CATEGORIES):
+                if waste_class == 'low_value':
                     low_value_spending += amount
-                elif any(es_cat in category_lower for es_cat in self.ESSENTIAL_CATEGORIES):
+                    low_value_categories.add(category)
+                elif waste_class == 'essential':
                     essential_spending += amount
             
+            names, codes = self._transaction_category_codes()
+            self.contributions['waste'] = np.isin(np.asarray(names, dtype=object), list(low_value_categories))[codes]
+            
             # Calculate waste ratio
             if total_spending > 0:
                 waste_ratio = low_value_spending / total_spending
@@ -346,28 +627,52 @@ class SpendScoreEngine:
             logging.error(f"Error calculating waste ratio: {str(e)}")
             return 50.0
     
+    def _builtin_metric(self, metric: str) -> Optional[Callable[[], float]]:
+        """The engine's own ``calculate_*`` method for a built-in metric, or None to use the registry"""
+        return getattr(self, f'calculate_{metric}') if metric in self.WEIGHTS else None
+    
+    def _metric_inputs(self) -> MetricInputs:
+        """Columns and amount statistics for registered metrics, evaluated only when a metric needs them"""
+        return MetricInputs({
+            'amounts': lambda: np.asarray(self.amounts, dtype=np.float64),
+            'dates': lambda: self.transaction_timestamps,
+            'vendor_codes': lambda: self.vendor_codes,
+            'category_codes': lambda: self._transaction_category_codes()[1],
+            'category_names': lambda: self._transaction_category_codes()[0],
+            'median': lambda: self.median_amount,
+            'quartiles': self._quartiles
+        }, self.contributions)
+    
     def calculate_spend_score(self) -> float:
         """
         Calculate final weighted SpendScore (0-100)
         Normalized and rounded as per requirements
         """
         try:
-            # Calculate individual metric scores
-            scores = {
-                'frequency_score': self.calculate_frequency_score(),
-                'category_diversity': self.calculate_category_diversity(),
-                'budget_adherence': self.calculate_budget_adherence(),
-                'redundancy_detection': self.calculate_redundancy_detection(),
-                'spike_detection': self.calculate_spike_detection(),
-                'waste_ratio': self.calculate_waste_ratio()
-            }
+            # Calculate individual metric scores, with the engine's own method where it has one
+            scores = {}
+            for metric in self.weights:
+                method = self._builtin_metric(metric)
+                if method is not None:
+                    scores[metric] = method()
+            
+            # Everything else comes from the metric registry, sharing one set of inputs
+            registered = [metric for metric in self.weights if metric not in scores]
+            if registered:
+                inputs = self._metric_inputs()
+                for metric, score in compute_metrics(inputs, registered).items():
+                    scores[metric] = score
+                    self.score_breakdown[metric] = round(score, 2)
+                if 'redundant_pairs' in inputs:
+                    self.redundant_pairs = inputs['redundant_pairs']
+            scores = {metric: scores[metric] for metric in self.weights}
             
             # Apply weights and calculate final score
             weighted_score = 0
-            total_weight = sum(self.WEIGHTS.values())
+            total_weight = sum(self.weights.values())
             
             for metric, score in scores.items():
-                weight = self.WEIGHTS.get(metric, 0)
+                weight = self.weights[metric]
                 weighted_score += (score * weight / 100)
             
             # Normalize to 0-100 range
@@ -379,6 +684,7 @@ class SpendScoreEngine:
             # Store detailed breakdown
             self.score_breakdown['final_score'] = final_score
             self.score_breakdown['individual_scores'] = scores
+            self.score_breakdown['weights'] = dict(self.weights)
             
             logging.info(f"SpendScore calculation complete: {final_score}")
             logging.info(f"Score breakdown: {self.score_breakdown}")
@@ -389,7 +695,8 @@ class SpendScoreEngine:
             logging.error(f"Error calculating final spend score: {str(e)}")
             return 50
     
-    def get_score_tier(self, score: float) -> Dict[str, Any]:
+    @staticmethod
+    def get_score_tier(score: float) -> Dict[str, Any]:
         """
         Get traffic light tier and reward eligibility
         Red: 0-69, Amber: 70-89, Green: 90-100
@@ -416,6 +723,82 @@ class SpendScoreEngine:
                 'description': 'Significant opportunities for financial optimization'
             }
     
+    def _transaction_category_codes(self) -> Tuple[List[str], np.ndarray]:
+        """Normalized category names and the category code of every transaction"""
+        if self._factorized_categories is None:
+            codes, names = pd.factorize(pd.Series(self.transaction_categories, dtype=object), use_na_sentinel=False)
+            self._factorized_categories = (list(names), codes)
+        return self._factorized_categories
+    
+    def get_top_detractors(self, limit: int = DETRACTOR_LIMIT) -> List[Dict[str, Any]]:
+        """Transactions that cost the most SpendScore points, largest first
+
+        Each metric's lost points are shared among the transactions the
+        metrics recorded in ``contributions``: deviation from the median
+        (budget adherence), outlier flags (global or segmented spike
+        detection), redundant-pair
+        penalties (redundancy detection) and low-value categories (waste
+        ratio, in proportion to amount). ``score_impact`` is the estimated
+        number of final-score points each transaction costs. Candidates are
+        ranked with a heap, so only the top ``limit`` are ordered.
+        """
+        try:
+            n = self.num_transactions
+            if not n or 'individual_scores' not in self.score_breakdown:
+                return []
+            
+            scores = self.score_breakdown['individual_scores']
+            total_weight = sum(self.weights.values())
+            amounts = np.asarray(self.amounts, dtype=np.float64)
+            impact = np.zeros(n)
+            
+            deviation = self.contributions.get('deviation_penalty')
+            if deviation is not None:
+                impact += deviation / n * self.weights['budget_adherence'] / total_weight
+            
+            redundancy = self.contributions.get('redundancy_penalty')
+            if redundancy is not None and self.redundant_pairs is not None and len(self.redundant_pairs[0]):
+                impact += redundancy / len(self.redundant_pairs[0]) * self.weights['redundancy_detection'] / total_weight
+            
+            # Global and segmented spike detection each share their lost points among their own spikes
+            outlier = None
+            for key, metric in (('outlier', 'spike_detection'), ('segmented_outlier', 'segmented_spike_detection')):
+                flags = self.contributions.get(key)
+                if flags is not None and flags.any():
+                    impact += flags * (100 - scores[metric]) / np.count_nonzero(flags) * self.weights[metric] / total_weight
+                if flags is not None:
+                    outlier = flags if outlier is None else outlier | flags
+            
+            waste = self.contributions.get('waste')
+            total_spending = sum(self.category_spending.values())
+            if waste is not None and total_spending > 0:
+                impact += np.where(waste, np.maximum(amounts, 0), 0) * 100 / total_spending * self.weights['waste_ratio'] / total_weight
+            
+            candidates = np.flatnonzero(impact > 0)
+            top = heapq.nlargest(limit, zip(impact[candidates].tolist(), candidates.tolist()))
+            
+            names, codes = self._transaction_category_codes()
+            detractors = []
+            for points, i in top:
+                date = self.transaction_timestamps[i] if i < len(self.transaction_timestamps) else np.datetime64('NaT')
+                detractors.append({
+                    'index': i,
+                    'vendor': self.vendor_names[self.vendor_codes[i]],
+                    'date': None if np.isnat(date) else str(date.astype('datetime64[D]')),
+                    'category': names[codes[i]],
+                    'amount': float(amounts[i]),
+                    'score_impact': round(points, 3),
+                    'deviation_penalty': round(float(deviation[i]), 2) if deviation is not None else 0.0,
+                    'outlier': bool(outlier[i]) if outlier is not None else False,
+                    'redundancy_penalty': round(float(redundancy[i]), 2) if redundancy is not None else 0.0,
+                    'waste': bool(waste[i]) if waste is not None else False
+                })
+            return detractors
+            
+        except Exception as e:
+            logging.error(f"Error ranking detractors: {str(e)}")
+            return []
+    
     def get_detailed_analysis(self) -> Dict[str, Any]:
         """Get comprehensive analysis results"""
         final_score = self.calculate_spend_score()
@@ -425,6 +808,9 @@ class SpendScoreEngine:
             'final_score': final_score,
             'tier_info': tier_info,
             'score_breakdown': self.score_breakdown,
+            'redundancy': self.get_redundancy_summary() if 'redundancy_detection' in self.weights else None,
+            'top_detractors': self.get_top_detractors(),
+            'category_spending': dict(self.category_spending),
             'transaction_summary': {
                 'total_transactions': self.num_transactions,
                 'total_amount': self.total_amount,
@@ -436,7 +822,223 @@ class SpendScoreEngine:
         }
 
 
-def calculate_spend_score(transactions: List[Dict[str, Any]]) -> float:
+def _exact_mean(values: np.ndarray) -> float:
+    """Mean of a float array rounded once from the exact sum, as statistics.mean does"""
+    total = math.fsum(values.tolist())
+    residual = math.fsum(np.append(values, -total).tolist())
+    return float((Fraction(total) + Fraction(residual)) / len(values))
+
+
+class VectorizedSpendScoreEngine(SpendScoreEngine):
+    """SpendScore engine computing every metric with NumPy
+
+    Gives the same scores as ``SpendScoreEngine``, but keeps amounts, dates
+    and category/vendor codes as arrays instead of Python lists and scores
+    all metrics, built-in or not, through the metric registry, so large
+    uploads score in a fraction of the time.
+    """
+    
+    def __init__(self, transactions: Union[List[Dict[str, Any]], TransactionBatch] = None, batches: Iterable[List[Dict[str, Any]]] = None,
+                 context: AnalysisContext = None, quantile_mode: str = 'exact', metric_profile: Union[str, Iterable[str], Dict[str, Optional[float]]] = 'default'):
+        if context is None:
+            if batches is not None:
+                transactions = TransactionBatch.concat([TransactionBatch.coerce(batch) for batch in batches])
+            context = AnalysisContext(transactions if transactions is not None else [])
+        super().__init__(context=context, quantile_mode=quantile_mode, metric_profile=metric_profile)
+    
+    def _prepare_context(self, context: AnalysisContext):
+        """Keep the batch's columns as arrays and aggregate per normalized category"""
+        batch = context.batch
+        self.amounts = batch.amounts
+        self.total_amount = context.total_amount
+        self.num_transactions = context.num_transactions
+        
+        self.category_names, self.category_codes = self._normalize_category_codes(batch)
+        self.category_spending = defaultdict(float, zip(self.category_names, np.bincount(self.category_codes, weights=batch.amounts, minlength=len(self.category_names)).tolist()))
+        
+        self.vendor_spending = defaultdict(float, context.vendor_totals)
+        self.vendor_frequency = defaultdict(int, context.vendor_counts)
+        self.vendor_codes, self.vendor_names = batch.vendor_codes, batch.vendor_names
+        self.transaction_timestamps = batch.dates
+        
+        self.median_amount = self._median()
+        self.mean_amount = context.mean_amount
+    
+    def _transaction_category_codes(self) -> Tuple[List[str], np.ndarray]:
+        return self.category_names, self.category_codes
+    
+    def _builtin_metric(self, metric: str) -> Optional[Callable[[], float]]:
+        return None
+    
+    def _metric_inputs(self) -> MetricInputs:
+        return MetricInputs({
+            'amounts': lambda: self.amounts,
+            'dates': lambda: self.transaction_timestamps,
+            'vendor_codes': lambda: self.vendor_codes,
+            'category_codes': lambda: self.category_codes,
+            'category_names': lambda: self.category_names,
+            'median': lambda: self.median_amount,
+            'quartiles': self._quartiles
+        }, self.contributions)
+
+
+# Built-in metrics as registry plugins; the standard engine scores the same metrics with its own methods
+
+@register_precomputation('category_counts', requires=('category_codes', 'category_names'))
+def _category_counts(inputs: MetricInputs) -> np.ndarray:
+    """Transactions per normalized category"""
+    return np.bincount(inputs['category_codes'], minlength=len(inputs['category_names']))
+
+
+@register_precomputation('category_totals', requires=('amounts', 'category_codes', 'category_names'))
+def _category_totals(inputs: MetricInputs) -> np.ndarray:
+    """Total amount per normalized category"""
+    return np.bincount(inputs['category_codes'], weights=inputs['amounts'], minlength=len(inputs['category_names']))
+
+
+@register_precomputation('waste_classes', requires=('category_names',))
+def _waste_classes(inputs: MetricInputs) -> np.ndarray:
+    """Waste class ('essential', 'low_value' or None) of every normalized category"""
+    return np.array([SpendScoreEngine._waste_class(name) for name in inputs['category_names']], dtype=object)
+
+
+@register_precomputation('redundant_pairs', requires=('vendor_codes', 'dates'))
+def _redundant_pairs(inputs: MetricInputs) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Consecutive same-vendor transactions within the redundancy window"""
+    return find_redundant_pairs(inputs['vendor_codes'], inputs['dates'])
+
+
+@register_metric('frequency_score', SpendScoreEngine.WEIGHTS['frequency_score'], requires=('category_counts',))
+def _frequency_score(inputs: MetricInputs) -> float:
+    """Share of transactions per category, best between 5% and 25%"""
+    counts = inputs['category_counts']
+    counts = counts[counts > 0]
+    if not len(counts):
+        return 0.0
+    ratios = counts / counts.sum()
+    scores = np.where(ratios < 0.05, ratios / 0.05 * 100,
+                      np.where(ratios <= 0.25, 100.0, np.maximum(0, 100 * (1 - (ratios - 0.25) / 0.75))))
+    return _exact_mean(scores.astype(np.float64))
+
+
+@register_metric('category_diversity', SpendScoreEngine.WEIGHTS['category_diversity'], requires=('category_counts',))
+def _category_diversity(inputs: MetricInputs) -> float:
+    """Number of distinct categories, best between 5 and 15"""
+    unique_categories = int(np.count_nonzero(inputs['category_counts']))
+    if 5 <= unique_categories <= 15:
+        return 100
+    if unique_categories < 5:
+        return (unique_categories / 5) * 100
+    return max(0, 100 - (unique_categories - 15) * 5)
+
+
+@register_metric('budget_adherence', SpendScoreEngine.WEIGHTS['budget_adherence'], requires=('amounts', 'median'))
+def _budget_adherence(inputs: MetricInputs) -> float:
+    """Mean closeness of each amount to the median"""
+    amounts = inputs['amounts']
+    if not len(amounts):
+        return 0.0
+    benchmark = inputs['median']
+    if benchmark <= 0:
+        return 50
+    deviation = np.abs(amounts - benchmark) / benchmark
+    adherence = np.maximum(0, 100 * (1 - np.minimum(deviation, 2) / 2))
+    inputs.contributions['deviation_penalty'] = 100 - adherence
+    return _exact_mean(adherence)
+
+
+@register_metric('redundancy_detection', SpendScoreEngine.WEIGHTS['redundancy_detection'], requires=('dates', 'redundant_pairs'), fallback=75.0)
+def _redundancy_detection(inputs: MetricInputs) -> float:
+    """Mean penalty of same-vendor transactions close together"""
+    dates = inputs['dates']
+    if np.count_nonzero(~np.isnat(dates)) < 2:
+        return 100.0  # No redundancy possible with <2 transactions
+    _, second, hours = inputs['redundant_pairs']
+    penalties = np.maximum(0, 100 - hours * 2)  # Higher penalty for closer transactions
+    
+    # Each pair's penalty is charged to its later transaction
+    transaction_penalties = np.zeros(len(dates))
+    transaction_penalties[second] = penalties
+    inputs.contributions['redundancy_penalty'] = transaction_penalties
+    return max(0, 100 - _exact_mean(penalties)) if len(penalties) else 100
+
+
+@register_metric('spike_detection', SpendScoreEngine.WEIGHTS['spike_detection'], requires=('amounts', 'quartiles', 'median'), fallback=75.0)
+def _spike_detection(inputs: MetricInputs) -> float:
+    """Share and severity of amounts above the IQR outlier threshold"""
+    amounts = inputs['amounts']
+    n = len(amounts)
+    if n == 0:
+        return 0.0
+    if n < 4:
+        return 100.0  # Not enough data for outlier detection
+    
+    q1, q3 = inputs['quartiles']
+    outlier = amounts > q3 + 1.5 * (q3 - q1)
+    inputs.contributions['outlier'] = outlier
+    outliers = amounts[outlier]
+    median_amount = inputs['median']
+    if len(outliers) and median_amount > 0:
+        outlier_severity = float(outliers.max()) / median_amount
+        return max(0, 100 * (1 - len(outliers) / n) * (1 - min(outlier_severity / 10, 1)))
+    return 100
+
+
+@register_metric('segmented_spike_detection', SpendScoreEngine.WEIGHTS['spike_detection'],
+                 requires=('amounts', 'vendor_codes', 'category_codes'), fallback=75.0)
+def _segmented_spike_detection(inputs: MetricInputs) -> float:
+    """Share and severity of amounts far above the typical amount of their own vendor or category"""
+    amounts = inputs['amounts']
+    if not len(amounts):
+        return 0.0
+
+    scores = segment_z_scores(amounts, inputs['vendor_codes'], inputs['category_codes'])
+    by_vendor = scores['vendor'][0] >= scores['category'][0]
+    z_scores = np.where(by_vendor, scores['vendor'][0], scores['category'][0])
+    outlier = z_scores > ROBUST_Z_THRESHOLD
+    inputs.contributions['segmented_outlier'] = outlier
+    if not outlier.any():
+        return 100
+
+    # Severity is the largest spike relative to its group's median, as spike_detection uses the global median
+    typical = np.where(by_vendor, scores['vendor'][1][inputs['vendor_codes']], scores['category'][1][inputs['category_codes']])[outlier]
+    ratios = amounts[outlier][typical > 0] / typical[typical > 0]
+    outlier_severity = float(ratios.max()) if len(ratios) else 0.0
+    return max(0, 100 * (1 - np.count_nonzero(outlier) / len(amounts)) * (1 - min(outlier_severity / 10, 1)))
+
+
+@register_metric('waste_ratio', SpendScoreEngine.WEIGHTS['waste_ratio'], requires=('category_totals', 'waste_classes', 'category_codes'))
+def _waste_ratio(inputs: MetricInputs) -> float:
+    """Share of spending in low-value categories, with a bonus for essential spending"""
+    totals = inputs['category_totals']
+    if not len(totals):
+        return 50.0
+    waste_classes = inputs['waste_classes']
+    low_value = waste_classes == 'low_value'
+    essential = waste_classes == 'essential'
+    inputs.contributions['waste'] = low_value[inputs['category_codes']]
+    
+    # Summed in category order, as the standard engine does
+    total_spending = sum(totals.tolist())
+    if total_spending <= 0:
+        return 50
+    waste_score = max(0, 100 * (1 - sum(totals[low_value].tolist()) / total_spending))
+    essential_bonus = min(20, sum(totals[essential].tolist()) / total_spending * 40)
+    return min(100, waste_score + essential_bonus)
+
+
+register_profile('default', SpendScoreEngine.WEIGHTS)
+load_profiles()
+
+
+# Scoring backends selectable through get_enhanced_analysis
+ENGINES = {
+    'standard': SpendScoreEngine,
+    'vectorized': VectorizedSpendScoreEngine
+}
+
+
+def calculate_spend_score(transactions: Union[List[Dict[str, Any]], TransactionBatch]) -> float:
     """
     Main function to calculate SpendScore using the enhanced engine
     Compatible with existing codebase
@@ -459,7 +1061,65 @@ def get_score_color(score: float) -> str:
     return tier_info['color']
 
 
-def get_enhanced_analysis(transactions: List[Dict[str, Any]]) -> Dict[str, Any]:
-    """Get complete enhanced analysis"""
-    engine = SpendScoreEngine(transactions)
+def get_enhanced_analysis(transactions: Union[List[Dict[str, Any]], TransactionBatch] = None, batches: Iterable[List[Dict[str, Any]]] = None,
+                          context: AnalysisContext = None, engine: str = 'standard', quantile_mode: str = 'exact',
+                          metric_profile: Union[str, Iterable[str], Dict[str, Optional[float]]] = 'default') -> Dict[str, Any]:
+    """Get complete enhanced analysis from a transaction list, streamed batches or a shared AnalysisContext
+
+    ``engine`` selects the scoring backend: 'standard' or 'vectorized'.
+    ``quantile_mode`` selects exact or sketched quantiles (see QUANTILE_MODES).
+    ``metric_profile`` selects the metrics scored (see metric_registry).
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown SpendScore engine '{engine}'. Choose from: {', '.join(ENGINES)}")
+    engine = ENGINES[engine](transactions, batches=batches, context=context, quantile_mode=quantile_mode, metric_profile=metric_profile)
     return engine.get_detailed_analysis()
+
+
+def _score_chunk(datasets: List[Union[List[Dict[str, Any]], TransactionBatch]], engine: str, quantile_mode: str,
+                 metric_profile: Union[str, Iterable[str], Dict[str, Optional[float]]] = 'default') -> List[Dict[str, Any]]:
+    """Score each dataset of a chunk, turning a failure into an error entry"""
+    results = []
+    for transactions in datasets:
+        try:
+            results.append(get_enhanced_analysis(transactions, engine=engine, quantile_mode=quantile_mode, metric_profile=metric_profile))
+        except Exception as e:
+            logging.error(f"Error scoring dataset: {str(e)}")
+            results.append({'error': str(e)})
+    return results
+
+
+def score_many(datasets: List[Union[List[Dict[str, Any]], TransactionBatch]], engine: str = 'vectorized', quantile_mode: str = 'exact',
+               max_workers: Optional[int] = None, chunk_size: int = SCORE_MANY_CHUNK_SIZE,
+               metric_profile: Union[str, Iterable[str], Dict[str, Optional[float]]] = 'default') -> List[Dict[str, Any]]:
+    """Detailed analysis of many datasets, fanned out across a process pool
+
+    Datasets are submitted ``chunk_size`` at a time so each task amortizes
+    its pickling and scheduling over several datasets. Results come back in
+    input order; a dataset that fails to score (or whose worker dies) gets
+    ``{'error': message}`` in its place without affecting the others.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown SpendScore engine '{engine}'. Choose from: {', '.join(ENGINES)}")
+    if quantile_mode not in QUANTILE_MODES:
+        raise ValueError(f"Unknown quantile mode '{quantile_mode}'. Choose from: {', '.join(QUANTILE_MODES)}")
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    # Workers only see built-in and file-configured profiles, so resolve the weights here
+    metric_profile = resolve_metrics(metric_profile)
+
+    datasets = list(datasets)
+    if len(datasets) < SCORE_MANY_MIN_PARALLEL or max_workers == 1:
+        return _score_chunk(datasets, engine, quantile_mode, metric_profile)
+
+    chunks = [datasets[start:start + chunk_size] for start in range(0, len(datasets), chunk_size)]
+    results = []
+    with ProcessPoolExecutor(max_workers=min(max_workers or os.cpu_count() or 1, len(chunks))) as executor:
+        futures = [executor.submit(_score_chunk, chunk, engine, quantile_mode, metric_profile) for chunk in chunks]
+        for chunk, future in zip(chunks, futures):
+            try:
+                results.extend(future.result())
+            except Exception as e:
+                logging.error(f"Error scoring batch chunk: {str(e)}")
+                results.extend({'error': str(e)} for _ in chunk)
+    return results
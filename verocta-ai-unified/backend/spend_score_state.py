@@ -0,0 +1,304 @@
+"""
+VeroctaAI SpendScore State
+Mergeable accumulators that let a stored SpendScore be updated with new transactions
+"""
+
+import math
+import logging
+import numpy as np
+from collections import defaultdict
+from typing import List, Dict, Any, Union, Tuple, Optional
+
+from transaction_batch import TransactionBatch
+from quantile_sketch import QuantileSketch
+from spend_score_engine import SpendScoreEngine, find_redundant_pairs, REDUNDANCY_WINDOW_HOURS
+
+# (seconds since epoch, amount) of a vendor's earliest or latest dated transaction
+VendorBound = Tuple[int, float]
+
+
+class SpendScoreState:
+    """Running tallies of everything the SpendScore metrics need
+
+    ``add`` folds in a batch of new transactions and ``merge`` combines two
+    states, each in time proportional to the new data rather than the full
+    history. Amount quantiles come from a ``QuantileSketch``, so median,
+    quartile and budget-adherence figures are approximate within its
+    relative accuracy. Redundancy is tracked from each vendor's first and
+    last dated transaction and is exact as long as each vendor's deltas
+    arrive in date order; pairs across overlapping date spans are not
+    recoverable from the bounds and are skipped.
+    """
+
+    def __init__(self, relative_accuracy: Optional[float] = None):
+        self.count = 0
+        self.dated_count = 0
+        self.total_amount = 0.0
+        self.category_totals = defaultdict(float)
+        self.category_counts = defaultdict(int)
+        self.vendor_totals = defaultdict(float)
+        self.vendor_counts = defaultdict(int)
+        self.amount_sketch = QuantileSketch(relative_accuracy) if relative_accuracy else QuantileSketch()
+
+        # Redundancy: per-vendor date bounds and flagged same-vendor pairs so far
+        self.vendor_bounds: Dict[Any, Tuple[VendorBound, VendorBound]] = {}
+        self.redundant_pairs = 0
+        self.redundancy_penalty = 0.0
+        self.redundant_amount = 0.0
+
+    def add(self, transactions: Union[TransactionBatch, List[Dict[str, Any]]]) -> 'SpendScoreState':
+        """Fold new transactions into the state"""
+        batch = TransactionBatch.coerce(transactions)
+        if not len(batch):
+            return self
+
+        self.count += len(batch)
+        self.total_amount += math.fsum(batch.amounts.tolist())
+        self.amount_sketch.add(batch.amounts)
+
+        names, category_codes = SpendScoreEngine._normalize_category_codes(batch)
+        totals = np.bincount(category_codes, weights=batch.amounts, minlength=len(names))
+        counts = np.bincount(category_codes, minlength=len(names))
+        for name, total, count in zip(names, totals.tolist(), counts.tolist()):
+            self.category_totals[name] += total
+            self.category_counts[name] += count
+
+        for vendor, total in batch.group_totals('vendor').items():
+            self.vendor_totals[vendor] += total
+        for vendor, count in batch.group_counts('vendor').items():
+            self.vendor_counts[vendor] += count
+
+        self._add_redundancy(batch)
+        return self
+
+    def merge(self, other: 'SpendScoreState') -> 'SpendScoreState':
+        """Combine another state's tallies into this one"""
+        self.count += other.count
+        self.dated_count += other.dated_count
+        self.total_amount += other.total_amount
+        self.amount_sketch.merge(other.amount_sketch)
+
+        for name, total in other.category_totals.items():
+            self.category_totals[name] += total
+        for name, count in other.category_counts.items():
+            self.category_counts[name] += count
+        for vendor, total in other.vendor_totals.items():
+            self.vendor_totals[vendor] += total
+        for vendor, count in other.vendor_counts.items():
+            self.vendor_counts[vendor] += count
+
+        self.redundant_pairs += other.redundant_pairs
+        self.redundancy_penalty += other.redundancy_penalty
+        self.redundant_amount += other.redundant_amount
+        for vendor, (first, last) in other.vendor_bounds.items():
+            self._join_vendor(vendor, first, last)
+        return self
+
+    def score(self) -> Dict[str, Any]:
+        """Detailed SpendScore analysis of everything added so far"""
+        return StateSpendScoreEngine(self).get_detailed_analysis()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-serializable form of the state, for storing between uploads"""
+        return {
+            'count': self.count,
+            'dated_count': self.dated_count,
+            'total_amount': self.total_amount,
+            'category_totals': dict(self.category_totals),
+            'category_counts': dict(self.category_counts),
+            'vendor_totals': dict(self.vendor_totals),
+            'vendor_counts': dict(self.vendor_counts),
+            'amount_sketch': self.amount_sketch.to_dict(),
+            'vendor_bounds': [[vendor, list(first), list(last)] for vendor, (first, last) in self.vendor_bounds.items()],
+            'redundant_pairs': self.redundant_pairs,
+            'redundancy_penalty': self.redundancy_penalty,
+            'redundant_amount': self.redundant_amount
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'SpendScoreState':
+        """Rebuild a state from ``to_dict`` output"""
+        state = cls()
+        state.count = int(data.get('count', 0))
+        state.dated_count = int(data.get('dated_count', 0))
+        state.total_amount = float(data.get('total_amount', 0.0))
+        state.category_totals.update(data.get('category_totals', {}))
+        state.category_counts.update(data.get('category_counts', {}))
+        state.vendor_totals.update(data.get('vendor_totals', {}))
+        state.vendor_counts.update(data.get('vendor_counts', {}))
+        if data.get('amount_sketch'):
+            state.amount_sketch = QuantileSketch.from_dict(data['amount_sketch'])
+        state.vendor_bounds = {
+            vendor: ((int(first[0]), float(first[1])), (int(last[0]), float(last[1])))
+            for vendor, first, last in data.get('vendor_bounds', [])
+        }
+        state.redundant_pairs = int(data.get('redundant_pairs', 0))
+        state.redundancy_penalty = float(data.get('redundancy_penalty', 0.0))
+        state.redundant_amount = float(data.get('redundant_amount', 0.0))
+        return state
+
+    def _add_redundancy(self, batch: TransactionBatch):
+        """Flag same-vendor pairs within the batch and against each vendor's earlier transactions"""
+        dated = ~np.isnat(batch.dates)
+        self.dated_count += int(np.count_nonzero(dated))
+        if not dated.any():
+            return
+
+        _, second, hours = find_redundant_pairs(batch.vendor_codes, batch.dates)
+        self._flag(hours, batch.amounts[second])
+
+        # Earliest and latest dated transaction of each vendor in the batch
+        rows = np.flatnonzero(dated)
+        seconds = batch.dates[rows].astype('datetime64[s]').astype(np.int64)
+        order = np.lexsort((seconds, batch.vendor_codes[rows]))
+        rows, seconds = rows[order], seconds[order]
+        codes = batch.vendor_codes[rows]
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        ends = np.r_[starts[1:], len(rows)] - 1
+
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            vendor = batch.vendor_names[codes[start]]
+            first = (int(seconds[start]), float(batch.amounts[rows[start]]))
+            last = (int(seconds[end]), float(batch.amounts[rows[end]]))
+            self._join_vendor(vendor, first, last)
+
+    def _join_vendor(self, vendor: Any, first: VendorBound, last: VendorBound):
+        """Extend a vendor's date bounds, flagging the pair where the two spans meet"""
+        current = self.vendor_bounds.get(vendor)
+        if current is None:
+            self.vendor_bounds[vendor] = (first, last)
+            return
+
+        current_first, current_last = current
+        if current_last[0] <= first[0]:
+            self._flag(np.array([(first[0] - current_last[0]) / 3600.0]), np.array([first[1]]))
+        elif last[0] <= current_first[0]:
+            self._flag(np.array([(current_first[0] - last[0]) / 3600.0]), np.array([current_first[1]]))
+
+        self.vendor_bounds[vendor] = (min(current_first, first, key=lambda bound: bound[0]),
+                                      max(current_last, last, key=lambda bound: bound[0]))
+
+    def _flag(self, hours: np.ndarray, later_amounts: np.ndarray):
+        """Count pairs within the redundancy window and accumulate their penalties"""
+        close = hours <= REDUNDANCY_WINDOW_HOURS
+        if not close.any():
+            return
+        self.redundant_pairs += int(np.count_nonzero(close))
+        self.redundancy_penalty += math.fsum(np.maximum(0, 100 - hours[close] * 2).tolist())
+        self.redundant_amount += math.fsum(later_amounts[close].tolist())
+
+
+class StateSpendScoreEngine(SpendScoreEngine):
+    """SpendScore engine reading a SpendScoreState's accumulators instead of transactions
+
+    Category-based metrics are inherited unchanged; metrics that need the
+    amount distribution read it from the state's quantile sketch.
+    """
+
+    def __init__(self, state: SpendScoreState):
+        self.state = state
+        super().__init__([], quantile_mode='sketch')
+
+    def _prepare_data(self, transactions):
+        state = self.state
+        self.amounts = []
+        self.transaction_categories = []
+        self.total_amount = state.total_amount
+        self.num_transactions = state.count
+
+        self.category_spending = defaultdict(float, state.category_totals)
+        self.category_counts = dict(state.category_counts)
+        self.vendor_spending = defaultdict(float, state.vendor_totals)
+        self.vendor_frequency = defaultdict(int, state.vendor_counts)
+
+        self.median_amount = self._median()
+        self.mean_amount = state.total_amount / state.count if state.count else 0
+
+    def _get_amount_sketch(self) -> QuantileSketch:
+        return self.state.amount_sketch
+
+    def _category_frequencies(self) -> Dict[str, int]:
+        return self.category_counts
+
+    def calculate_budget_adherence(self) -> float:
+        """Budget adherence (20% weight) over the sketch's buckets, weighted by count"""
+        try:
+            if self.num_transactions == 0:
+                return 0.0
+
+            benchmark = self.median_amount
+            if benchmark > 0:
+                values, counts = self.state.amount_sketch.buckets()
+                deviation = np.abs(values - benchmark) / benchmark
+                adherence = np.maximum(0, 100 * (1 - np.minimum(deviation, 2) / 2))
+                score = float(math.fsum((adherence * counts).tolist()) / counts.sum())
+            else:
+                score = 50
+
+            self.score_breakdown['budget_adherence'] = round(score, 2)
+            return score
+
+        except Exception as e:
+            logging.error(f"Error calculating budget adherence: {str(e)}")
+            return 50.0
+
+    def calculate_redundancy_detection(self) -> float:
+        """Redundancy detection (15% weight) from the accumulated pair penalties"""
+        try:
+            state = self.state
+            if state.dated_count < 2:
+                return 100.0  # No redundancy possible with <2 transactions
+
+            if state.redundant_pairs:
+                score = max(0, 100 - state.redundancy_penalty / state.redundant_pairs)
+            else:
+                score = 100  # No redundancy detected
+
+            self.score_breakdown['redundancy_detection'] = round(score, 2)
+            return score
+
+        except Exception as e:
+            logging.error(f"Error calculating redundancy detection: {str(e)}")
+            return 75.0
+
+    def calculate_spike_detection(self) -> float:
+        """Spike detection (20% weight) using sketched quartiles and outlier count"""
+        try:
+            n = self.num_transactions
+            if n == 0:
+                return 0.0
+            if n < 4:
+                return 100.0  # Not enough data for outlier detection
+
+            sketch = self.state.amount_sketch
+            q1, q3 = self._quartiles()
+            outlier_threshold = q3 + 1.5 * (q3 - q1)
+
+            outlier_count = sketch.count_above(outlier_threshold)
+            outlier_ratio = outlier_count / n
+
+            if outlier_count and self.median_amount > 0:
+                outlier_severity = sketch.max / self.median_amount
+                score = max(0, 100 * (1 - outlier_ratio) * (1 - min(outlier_severity / 10, 1)))
+            else:
+                score = 100
+
+            self.score_breakdown['spike_detection'] = round(score, 2)
+            return score
+
+        except Exception as e:
+            logging.error(f"Error calculating spike detection: {str(e)}")
+            return 75.0
+
+    def get_redundancy_summary(self, limit: int = 0) -> Dict[str, Any]:
+        """Flagged pair totals; individual pairs are not retained by the state"""
+        return {
+            'window_hours': REDUNDANCY_WINDOW_HOURS,
+            'flagged_pairs': self.state.redundant_pairs,
+            'flagged_amount': round(self.state.redundant_amount, 2),
+            'pairs': []
+        }
+
+    def get_top_detractors(self, limit: int = 0) -> List[Dict[str, Any]]:
+        """Individual transactions are not retained by the state"""
+        return []
@@ -0,0 +1,141 @@
+"""
+VeroctaAI Subscription Detector
+Recurring charges found from each vendor's charge intervals and amount stability
+"""
+
+import re
+import numpy as np
+from typing import Dict, Any
+
+from transaction_batch import TransactionBatch
+
+# Billing cadences: typical days between charges and the fewest charges that establish one
+CADENCES = {
+    'weekly': {'days': 7.0, 'min_charges': 3},
+    'monthly': {'days': 30.44, 'min_charges': 3},
+    'quarterly': {'days': 91.31, 'min_charges': 3},
+    'annual': {'days': 365.25, 'min_charges': 2}
+}
+
+# Relative deviation from a cadence an interval may have and still match it
+CADENCE_TOLERANCE = 0.2
+
+# Share of a vendor's intervals that must match its cadence
+MIN_REGULAR_SHARE = 0.6
+
+# Largest coefficient of variation of a vendor's charge amounts
+MAX_AMOUNT_VARIATION = 0.25
+
+
+def normalize_vendor(name: Any) -> str:
+    """Lowercase a vendor name and drop digits and punctuation, so 'NETFLIX.COM 0423' matches 'Netflix.com'"""
+    return ' '.join(re.sub(r'[^a-z]+', ' ', str(name).lower()).split())
+
+
+def interval_medians(groups: np.ndarray, days: np.ndarray, num_groups: int):
+    """Intervals between consecutive charges of each group, and each group's median interval
+
+    ``groups`` and ``days`` must be sorted by (group, day). Returns the
+    group of each interval, the intervals, the number per group and the
+    per-group median (0 for groups with a single charge).
+    """
+    same = groups[1:] == groups[:-1]
+    interval_groups = groups[1:][same]
+    intervals = np.diff(days)[same]
+    interval_counts = np.bincount(interval_groups, minlength=num_groups)
+
+    # Per-group median interval from one sort by (group, interval)
+    sorted_intervals = intervals[np.lexsort((intervals, interval_groups))]
+    starts = np.concatenate([[0], np.cumsum(interval_counts)[:-1]])
+    has_intervals = interval_counts > 0
+    lower = starts + np.maximum(interval_counts - 1, 0) // 2
+    upper = starts + interval_counts // 2
+    median_interval = np.zeros(num_groups)
+    median_interval[has_intervals] = (sorted_intervals[lower[has_intervals]] + sorted_intervals[upper[has_intervals]]) / 2
+    return interval_groups, intervals, interval_counts, median_interval
+
+
+def detect_subscriptions(batch: TransactionBatch, tolerance: float = CADENCE_TOLERANCE,
+                         min_regular_share: float = MIN_REGULAR_SHARE,
+                         max_amount_variation: float = MAX_AMOUNT_VARIATION) -> Dict[str, Any]:
+    """Find vendors charged at a regular cadence with a stable amount
+
+    Vendors are grouped by normalized name across the whole batch. Dated
+    charges are sorted by (vendor, date) once; intervals, their per-vendor
+    median, and amount means and variation all come from diffs and
+    bincounts over that order. A vendor's cadence is the one its median
+    interval falls within ``tolerance`` of, and it counts as a subscription
+    when at least ``min_regular_share`` of its intervals match that cadence
+    and its amounts vary by at most ``max_amount_variation``.
+    """
+    result = {'count': 0, 'annualized_cost': 0.0, 'subscriptions': []}
+
+    dated = np.flatnonzero(~np.isnat(batch.dates) & (batch.amounts != 0))
+    if len(dated) < 2:
+        return result
+
+    # Normalize each distinct vendor name once
+    names = [normalize_vendor(name) for name in batch.vendor_names]
+    group_names, group_of_name = np.unique(np.array(names, dtype=object), return_inverse=True)
+    num_groups = len(group_names)
+
+    order = dated[np.lexsort((batch.dates[dated].astype('datetime64[s]').astype(np.int64), group_of_name[batch.vendor_codes[dated]]))]
+    groups = group_of_name[batch.vendor_codes[order]]
+    days = batch.dates[order].astype('datetime64[s]').astype(np.int64) / 86400.0
+    amounts = np.abs(batch.amounts[order])
+
+    charges = np.bincount(groups, minlength=num_groups)
+    amount_sums = np.bincount(groups, weights=amounts, minlength=num_groups)
+    amount_squares = np.bincount(groups, weights=amounts * amounts, minlength=num_groups)
+
+    # Intervals between consecutive charges of the same vendor, and each vendor's median interval
+    interval_groups, intervals, interval_counts, median_interval = interval_medians(groups, days, num_groups)
+    has_intervals = interval_counts > 0
+
+    # Cadence whose period the median interval is closest to, if within tolerance
+    cadence_names = list(CADENCES)
+    periods = np.array([CADENCES[name]['days'] for name in cadence_names])
+    min_charges = np.array([CADENCES[name]['min_charges'] for name in cadence_names])
+    deviation = np.abs(median_interval[:, None] - periods[None, :]) / periods[None, :]
+    cadence = np.argmin(deviation, axis=1)
+    matched = has_intervals & (deviation[np.arange(num_groups), cadence] <= tolerance) & (group_names != '')
+
+    # Share of each vendor's intervals within tolerance of its cadence
+    interval_periods = periods[cadence[interval_groups]]
+    regular = np.abs(intervals - interval_periods) <= tolerance * interval_periods
+    regular_share = np.zeros(num_groups)
+    regular_share[has_intervals] = np.bincount(interval_groups, weights=regular, minlength=num_groups)[has_intervals] / interval_counts[has_intervals]
+
+    mean_amount = amount_sums / np.maximum(charges, 1)
+    variance = np.maximum(amount_squares / np.maximum(charges, 1) - mean_amount ** 2, 0)
+    variation = np.sqrt(variance) / np.where(mean_amount > 0, mean_amount, 1)
+
+    recurring = np.flatnonzero(matched & (charges >= min_charges[cadence]) &
+                               (regular_share >= min_regular_share) & (variation <= max_amount_variation))
+
+    # Display name: the raw vendor name of the vendor's latest charge
+    group_ends = np.cumsum(charges) - 1
+    subscriptions = []
+    for group in recurring.tolist():
+        period = float(periods[cadence[group]])
+        annualized = float(mean_amount[group]) * 365.25 / period
+        last = order[group_ends[group]]
+        first = order[group_ends[group] - charges[group] + 1]
+        subscriptions.append({
+            'vendor': str(batch.vendor_names[batch.vendor_codes[last]]),
+            'cadence': cadence_names[cadence[group]],
+            'median_interval_days': round(float(median_interval[group]), 1),
+            'charges': int(charges[group]),
+            'average_amount': round(float(mean_amount[group]), 2),
+            'amount_variation': round(float(variation[group]), 3),
+            'first_charge': str(batch.dates[first].astype('datetime64[D]')),
+            'last_charge': str(batch.dates[last].astype('datetime64[D]')),
+            'next_expected': str((batch.dates[last].astype('datetime64[D]') + np.timedelta64(int(round(median_interval[group])), 'D'))),
+            'annualized_cost': round(annualized, 2)
+        })
+    subscriptions.sort(key=lambda subscription: subscription['annualized_cost'], reverse=True)
+
+    result['count'] = len(subscriptions)
+    result['annualized_cost'] = round(sum(subscription['annualized_cost'] for subscription in subscriptions), 2)
+    result['subscriptions'] = subscriptions
+    return result
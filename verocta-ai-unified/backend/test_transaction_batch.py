@@ -0,0 +1,44 @@
+"""
+Tests for TransactionBatch subsets
+"""
+
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from transaction_batch import TransactionBatch
+from spend_score_engine import get_enhanced_analysis
+
+CATEGORIES = ['Rent', 'Food', 'Travel', 'Software', 'Coffee shop']
+
+
+def _records():
+    return [{
+        'amount': round(10 + (i * 37) % 500 + i / 7, 2),
+        'vendor': f'Vendor {i % 6}',
+        'date': date(2024, 1, 1) + timedelta(days=i % 45),
+        'category': CATEGORIES[i % len(CATEGORIES)],
+        'description': ''
+    } for i in range(60)]
+
+
+@pytest.mark.parametrize('engine', ['standard', 'vectorized'])
+@pytest.mark.parametrize('indices', [[7], [0, 1], [3, 8, 13, 18], list(range(0, 60, 4))])
+def test_take_scores_like_the_same_rows_as_dicts(engine, indices):
+    records = _records()
+    subset = TransactionBatch.from_records(records).take(np.array(indices))
+
+    from_batch = get_enhanced_analysis(subset, engine=engine)
+    from_dicts = get_enhanced_analysis([records[i] for i in indices], engine=engine)
+
+    assert from_batch['score_breakdown'] == from_dicts['score_breakdown']
+    assert from_batch['category_spending'] == from_dicts['category_spending']
+
+
+def test_take_keeps_only_names_in_the_subset():
+    subset = TransactionBatch.from_records(_records())[10:12]
+
+    assert subset.group_counts('vendor') == {'Vendor 4': 1, 'Vendor 5': 1}
+    assert subset.group_counts('category') == {'Rent': 1, 'Food': 1}
+    assert list(subset.categories) == ['Rent', 'Food']
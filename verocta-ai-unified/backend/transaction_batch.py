@@ -0,0 +1,198 @@
+"""
+VeroctaAI Transaction Batch
+Columnar container for standardized transactions shared by the parser,
+SpendScore engine, GPT insights and PDF report
+"""
+
+import numpy as np
+import pandas as pd
+from typing import List, Dict, Any, Iterator, Union
+
+# Fields of a standardized transaction, in output order
+TRANSACTION_FIELDS = ['amount', 'vendor', 'date', 'category', 'description']
+
+
+class TransactionBatch:
+    """Standardized transactions stored as NumPy columns
+
+    Amounts are float64, dates datetime64[D] (NaT when missing), and vendors
+    and categories are integer codes into arrays of distinct names, in order
+    of first appearance. Iterating or indexing yields the same dicts the
+    parser has always produced, built on demand, so code written for a list
+    of transactions keeps working.
+    """
+
+    def __init__(self, amounts: np.ndarray, dates: np.ndarray,
+                 vendor_codes: np.ndarray, vendor_names: np.ndarray,
+                 category_codes: np.ndarray, category_names: np.ndarray,
+                 descriptions: np.ndarray):
+        self.amounts = amounts
+        self.dates = dates
+        self.vendor_codes = vendor_codes
+        self.vendor_names = vendor_names
+        self.category_codes = category_codes
+        self.category_names = category_names
+        self.descriptions = descriptions
+
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame) -> 'TransactionBatch':
+        """Build a batch from a DataFrame with the standard transaction columns"""
+        vendor_codes, vendor_names = pd.factorize(frame['vendor'], use_na_sentinel=False)
+        category_codes, category_names = pd.factorize(frame['category'], use_na_sentinel=False)
+        dates = pd.to_datetime(frame['date'], errors='coerce')
+
+        return cls(
+            amounts=frame['amount'].to_numpy(dtype=np.float64),
+            dates=dates.to_numpy(dtype='datetime64[D]'),
+            vendor_codes=vendor_codes,
+            vendor_names=np.asarray(vendor_names, dtype=object),
+            category_codes=category_codes,
+            category_names=np.asarray(category_names, dtype=object),
+            descriptions=frame['description'].to_numpy(dtype=object)
+        )
+
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]]) -> 'TransactionBatch':
+        """Build a batch from transaction dicts, e.g. JSON from the API"""
+        frame = pd.DataFrame(list(records), columns=TRANSACTION_FIELDS)
+        frame['amount'] = pd.to_numeric(frame['amount'], errors='coerce').fillna(0.0)
+        frame['vendor'] = frame['vendor'].where(frame['vendor'].notna(), 'Unknown')
+        frame['category'] = frame['category'].where(frame['category'].notna(), 'Uncategorized')
+        frame['description'] = frame['description'].where(frame['description'].notna(), '')
+
+        dates = frame['date']
+        if dates.map(lambda value: isinstance(value, str)).any():
+            # Imported lazily: csv_parser imports this module
+            from csv_parser import parse_date_series
+            frame['date'] = parse_date_series(dates.where(dates.isna(), dates.astype(str)))
+
+        return cls.from_frame(frame)
+
+    @classmethod
+    def coerce(cls, transactions: Union['TransactionBatch', pd.DataFrame, List[Dict[str, Any]], None]) -> 'TransactionBatch':
+        """Return ``transactions`` as a batch, converting a DataFrame or list of dicts"""
+        if isinstance(transactions, cls):
+            return transactions
+        if isinstance(transactions, pd.DataFrame):
+            return cls.from_frame(transactions)
+        return cls.from_records(transactions or [])
+
+    @classmethod
+    def concat(cls, batches: List['TransactionBatch']) -> 'TransactionBatch':
+        """Join batches into one, re-coding vendors and categories"""
+        frames = [batch.to_frame() for batch in batches if len(batch)]
+        if not frames:
+            return cls.from_records([])
+        return cls.from_frame(pd.concat(frames, ignore_index=True))
+
+    def __len__(self) -> int:
+        return len(self.amounts)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        columns = zip(self.amounts.tolist(), self.vendors.tolist(), self.dates.astype(object).tolist(),
+                      self.categories.tolist(), self.descriptions.tolist())
+        for row in columns:
+            yield dict(zip(TRANSACTION_FIELDS, row))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.take(np.arange(len(self))[index])
+        return {
+            'amount': float(self.amounts[index]),
+            'vendor': self.vendor_names[self.vendor_codes[index]],
+            'date': self.dates[index].astype(object),
+            'category': self.category_names[self.category_codes[index]],
+            'description': self.descriptions[index]
+        }
+
+    @property
+    def vendors(self) -> np.ndarray:
+        """Vendor name of every transaction"""
+        return self.vendor_names[self.vendor_codes]
+
+    @property
+    def categories(self) -> np.ndarray:
+        """Category name of every transaction"""
+        return self.category_names[self.category_codes]
+
+    def take(self, indices: np.ndarray) -> 'TransactionBatch':
+        """Return the transactions at ``indices`` as a new batch
+
+        Vendors and categories are re-coded so the name arrays hold only the
+        names present in the subset, in order of first appearance, as
+        ``from_records`` would build them; group-bys then have no empty groups.
+        """
+        vendor_codes, vendors = pd.factorize(self.vendor_codes[indices])
+        category_codes, categories = pd.factorize(self.category_codes[indices])
+        return TransactionBatch(
+            self.amounts[indices], self.dates[indices],
+            vendor_codes, self.vendor_names[vendors],
+            category_codes, self.category_names[categories],
+            self.descriptions[indices]
+        )
+
+    def total_amount(self) -> float:
+        """Sum of all amounts"""
+        return float(self.amounts.sum())
+
+    def group_totals(self, field: str, absolute: bool = False) -> Dict[Any, float]:
+        """Total amount per vendor or category, in order of first appearance"""
+        codes, names = self._codes(field)
+        amounts = np.abs(self.amounts) if absolute else self.amounts
+        totals = np.bincount(codes, weights=amounts, minlength=len(names))
+        return dict(zip(names.tolist(), totals.tolist()))
+
+    def group_counts(self, field: str) -> Dict[Any, int]:
+        """Number of transactions per vendor or category, in order of first appearance"""
+        codes, names = self._codes(field)
+        return dict(zip(names.tolist(), np.bincount(codes, minlength=len(names)).tolist()))
+
+    def month_totals(self, absolute: bool = False) -> Dict[str, float]:
+        """Total amount per 'YYYY-MM' month, sorted by month, ignoring undated transactions"""
+        dated = ~np.isnat(self.dates)
+        if not dated.any():
+            return {}
+        months, inverse = np.unique(self.dates[dated].astype('datetime64[M]'), return_inverse=True)
+        amounts = np.abs(self.amounts[dated]) if absolute else self.amounts[dated]
+        totals = np.bincount(inverse, weights=amounts, minlength=len(months))
+        return dict(zip(months.astype(str).tolist(), totals.tolist()))
+
+    def group_month_totals(self, field: str, absolute: bool = False):
+        """Names, consecutive months (datetime64[M]) and a names x months array of totals, ignoring undated transactions
+
+        Months between the first and last dated transaction with no
+        spending are included as zeros, so each row is an evenly spaced series.
+        """
+        codes, names = self._codes(field)
+        dated = ~np.isnat(self.dates)
+        if not dated.any():
+            return names, np.array([], dtype='datetime64[M]'), np.zeros((len(names), 0))
+        month_numbers = self.dates[dated].astype('datetime64[M]').astype(np.int64)
+        first = int(month_numbers.min())
+        num_months = int(month_numbers.max()) - first + 1
+        amounts = np.abs(self.amounts[dated]) if absolute else self.amounts[dated]
+        cells = codes[dated] * num_months + (month_numbers - first)
+        totals = np.bincount(cells, weights=amounts, minlength=len(names) * num_months).reshape(len(names), num_months)
+        months = np.arange(first, first + num_months).astype('datetime64[M]')
+        return names, months, totals
+
+    def to_frame(self) -> pd.DataFrame:
+        """Return the transactions as a DataFrame with a datetime64 date column"""
+        return pd.DataFrame({
+            'amount': self.amounts,
+            'vendor': self.vendors,
+            'date': self.dates,
+            'category': self.categories,
+            'description': self.descriptions
+        }, columns=TRANSACTION_FIELDS)
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        """Materialize the transactions as a list of dicts"""
+        return list(self)
+
+    def _codes(self, field: str):
+        if field == 'vendor':
+            return self.vendor_codes, self.vendor_names
+        if field == 'category':
+            return self.category_codes, self.category_names
+        raise ValueError(f"Cannot group transactions by '{field}'")
@@ -0,0 +1,318 @@
+"""
+VeroctaAI Vendor Resolution
+Maps raw bank descriptors to canonical vendors with rule-based cleaning and MinHash clustering
+"""
+
+import os
+import re
+import json
+import zlib
+import logging
+import threading
+import numpy as np
+import pandas as pd
+from collections import defaultdict
+from typing import List, Dict, Any, Optional, Tuple
+
+from transaction_batch import TransactionBatch
+
+VENDOR_MAP_DIR = os.environ.get('VENDOR_MAP_DIR', os.path.join('cache', 'vendor_maps'))
+
+# Character n-gram length and MinHash signature shape (bands x rows per band)
+NGRAM_SIZE = 3
+LSH_BANDS = 16
+LSH_ROWS = 2
+
+# Jaccard similarity of n-gram sets at which two cleaned names are the same vendor
+SIMILARITY_THRESHOLD = 0.6
+
+# Blocking buckets larger than this are skipped rather than compared pairwise
+MAX_BUCKET_SIZE = 64
+
+# Abbreviations banks use for well-known merchants
+VENDOR_ALIASES = {
+    'amzn': 'amazon',
+    'msft': 'microsoft',
+    'wal mart': 'walmart',
+    'wm supercenter': 'walmart'
+}
+
+# Trailing words that describe a channel or region rather than the vendor
+DESCRIPTOR_WORDS = {
+    'mktp', 'mktpl', 'mktplace', 'marketplace', 'digital', 'retail', 'online', 'web', 'store', 'stores', 'shop',
+    'payment', 'payments', 'purchase', 'pos', 'debit', 'card', 'com', 'co', 'uk', 'us', 'usa', 'gb',
+    'inc', 'ltd', 'llc', 'plc', 'corp', 'intl', 'eu'
+}
+
+# Payment processor prefixes in front of the merchant name, e.g. 'SQ *BLUE BOTTLE'
+PROCESSOR_PREFIXES = re.compile(r'^(?:sq|tst|sp|pp|paypal|ppl|zettle|izettle|sumup|pos|card|visa|dd|so)\s*\*+\s*')
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_random = np.random.RandomState(20240901)
+_HASH_A = _random.randint(1, 1 << 31, size=LSH_BANDS * LSH_ROWS).astype(np.uint64)
+_HASH_B = _random.randint(0, 1 << 31, size=LSH_BANDS * LSH_ROWS).astype(np.uint64)
+
+
+def clean_vendor(raw: Any) -> str:
+    """Reduce a bank descriptor to a comparable key
+
+    Lowercases, drops processor prefixes, card suffixes after '*' or '#',
+    web domains, dates, store and reference numbers (all digits go), applies
+    VENDOR_ALIASES and drops trailing channel or region words.
+    'AMAZON MKTPL*2K4', 'Amazon Mktp US' and 'AMZN Digital' all become 'amazon'.
+    """
+    text = str(raw).lower().strip()
+    text = PROCESSOR_PREFIXES.sub('', text)
+    text = re.sub(r'[*#].*$', ' ', text)                                   # card/reference suffixes
+    text = re.sub(r'\b\d{1,2} ?(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\b', ' ', text)  # dates like 12JAN
+    text = re.sub(r'\.(?:com|co\.uk|net|org)\b', ' ', text)                 # web domains
+    text = re.sub(r"[^a-z&' ]+", ' ', text)                                 # store numbers and punctuation
+    text = re.sub(r"'", ' ', text)
+    words = text.split()
+
+    # Aliases may span two words ('wal mart')
+    key = ' '.join(words)
+    for alias, vendor in VENDOR_ALIASES.items():
+        if key == alias or key.startswith(alias + ' '):
+            key = vendor + key[len(alias):]
+            break
+    words = key.split()
+
+    while len(words) > 1 and words[-1] in DESCRIPTOR_WORDS:
+        words.pop()
+    return ' '.join(words)
+
+
+def _ngrams(key: str) -> set:
+    padded = f' {key} '
+    return {padded[i:i + NGRAM_SIZE] for i in range(max(len(padded) - NGRAM_SIZE + 1, 1))}
+
+
+def _jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def minhash_signatures(ngram_sets: List[set]) -> np.ndarray:
+    """MinHash signature (one row per set) of n-gram sets, computed for all sets at once"""
+    lengths = np.array([len(ngrams) for ngrams in ngram_sets], dtype=np.intp)
+    if not len(lengths):
+        return np.zeros((0, LSH_BANDS * LSH_ROWS), dtype=np.uint64)
+    hashes = np.fromiter((zlib.crc32(gram.encode('utf-8')) for ngrams in ngram_sets for gram in ngrams),
+                         dtype=np.uint64, count=int(lengths.sum()))
+    permuted = (hashes[:, None] * _HASH_A[None, :] + _HASH_B[None, :]) % np.uint64(_MERSENNE_PRIME)
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    return np.minimum.reduceat(permuted, starts, axis=0)
+
+
+def _band_keys(signatures: np.ndarray) -> List[List[Tuple[int, bytes]]]:
+    """LSH bucket of each signature in every band"""
+    bands = signatures.reshape(len(signatures), LSH_BANDS, LSH_ROWS)
+    return [[(band, bands[i, band].tobytes()) for band in range(LSH_BANDS)] for i in range(len(signatures))]
+
+
+class _TenantVendors:
+    """One tenant's raw-to-canonical map and blocking index over its canonical keys"""
+
+    def __init__(self, raw_map: Optional[Dict[str, str]] = None):
+        self.raw_map = {}
+        self.key_map = {}
+        self.canonical_ngrams = {}
+        self.buckets = defaultdict(list)
+        self.merge(raw_map or {})
+
+    def merge(self, raw_map: Dict[str, str]):
+        """Adopt stored entries; where a raw name was mapped both here and in ``raw_map``, the stored one wins"""
+        new_canonicals = set()
+        for raw, canonical in raw_map.items():
+            self.raw_map[raw] = canonical
+            self.key_map.setdefault(clean_vendor(raw), canonical)
+            if canonical not in self.canonical_ngrams:
+                new_canonicals.add(canonical)
+        canonicals = sorted(new_canonicals)
+        self._index(canonicals, [clean_vendor(canonical) for canonical in canonicals])
+
+    def _index(self, canonicals: List[str], keys: List[str]):
+        ngram_sets = [_ngrams(key) for key in keys]
+        for canonical, ngrams, bands in zip(canonicals, ngram_sets, _band_keys(minhash_signatures(ngram_sets))):
+            self.canonical_ngrams[canonical] = ngrams
+            for bucket in bands:
+                self.buckets[bucket].append(canonical)
+
+    def resolve(self, raw_names: List[str], counts: Optional[Dict[str, int]] = None) -> Tuple[List[str], int]:
+        """Canonical vendor of each raw name, and how many names were not already mapped
+
+        ``counts`` gives how often each raw name occurs, so the most frequent
+        spelling of a new vendor names it.
+        """
+        unknown = sorted({raw for raw in raw_names if raw not in self.raw_map})
+        if unknown:
+            self._resolve_new(unknown, counts or {})
+        return [self.raw_map[raw] for raw in raw_names], len(unknown)
+
+    def _resolve_new(self, raw_names: List[str], counts: Dict[str, int]):
+        # Rule-based cleaning settles every name whose key is already known
+        pending = defaultdict(list)
+        for raw in raw_names:
+            key = clean_vendor(raw) or str(raw).strip().lower()
+            if key in self.key_map:
+                self.raw_map[raw] = self.key_map[key]
+            else:
+                pending[key].append(raw)
+        if not pending:
+            return
+
+        # Cluster the new keys with each other and with existing canonical vendors,
+        # comparing only pairs that share an LSH bucket
+        keys = list(pending)
+        ngram_sets = [_ngrams(key) for key in keys]
+        band_keys = _band_keys(minhash_signatures(ngram_sets))
+        parent = list(range(len(keys)))
+        matched = [None] * len(keys)
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        new_buckets = defaultdict(list)
+        for i, bands in enumerate(band_keys):
+            for bucket in bands:
+                new_buckets[bucket].append(i)
+
+        for bucket, members in new_buckets.items():
+            if len(members) > MAX_BUCKET_SIZE:
+                continue
+            for canonical in self.buckets.get(bucket, [])[:MAX_BUCKET_SIZE]:
+                for i in members:
+                    if matched[i] is None and _jaccard(ngram_sets[i], self.canonical_ngrams[canonical]) >= SIMILARITY_THRESHOLD:
+                        matched[i] = canonical
+            for position, i in enumerate(members):
+                for j in members[position + 1:]:
+                    if find(i) != find(j) and _jaccard(ngram_sets[i], ngram_sets[j]) >= SIMILARITY_THRESHOLD:
+                        parent[find(j)] = find(i)
+
+        clusters = defaultdict(list)
+        for i in range(len(keys)):
+            clusters[find(i)].append(i)
+
+        new_canonicals = []
+        for members in clusters.values():
+            existing = next((matched[i] for i in members if matched[i] is not None), None)
+            if existing is not None:
+                canonical = existing
+            else:
+                # Cleaned keys are only for matching; the most frequent original spelling
+                # (then the shortest) names the vendor
+                spellings = [(raw, i) for i in members for raw in pending[keys[i]]]
+                raw, representative = min(spellings, key=lambda spelling: (-counts.get(spelling[0], 1), len(spelling[0].strip()), spelling[0]))
+                canonical = raw.strip() or raw
+                new_canonicals.append((canonical, keys[representative]))
+            for i in members:
+                self.key_map[keys[i]] = canonical
+                for raw in pending[keys[i]]:
+                    self.raw_map[raw] = canonical
+
+        if new_canonicals:
+            self._index([canonical for canonical, _ in new_canonicals], [key for _, key in new_canonicals])
+
+
+class VendorResolver:
+    """Per-tenant canonical vendor maps, persisted as JSON files shared by all workers
+
+    A raw descriptor seen before resolves with one dictionary lookup; new
+    ones are cleaned, matched to known vendors by cleaned key, and otherwise
+    clustered through the MinHash blocking index, so comparisons stay near
+    linear in the number of distinct vendors.
+    """
+
+    def __init__(self, directory: str = VENDOR_MAP_DIR):
+        self.directory = directory
+        self.tenants = {}
+        self._loaded_mtimes = {}
+        self._lock = threading.RLock()
+
+    def _path(self, tenant: str) -> str:
+        return os.path.join(self.directory, f"{re.sub(r'[^A-Za-z0-9_.-]', '_', str(tenant))}.json")
+
+    def _tenant(self, tenant: str) -> _TenantVendors:
+        """A tenant's vendors, merged with whatever other workers have saved since the last load"""
+        if tenant not in self.tenants:
+            self.tenants[tenant] = _TenantVendors()
+        self._reload(tenant)
+        return self.tenants[tenant]
+
+    def _reload(self, tenant: str):
+        """Merge a tenant's map file into memory if it changed since the last load"""
+        path = self._path(tenant)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return
+        if mtime == self._loaded_mtimes.get(tenant):
+            return
+
+        try:
+            with open(path, 'r') as f:
+                raw_map = json.load(f)
+            self.tenants[tenant].merge(raw_map)
+            self._loaded_mtimes[tenant] = mtime
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not load vendor map for {tenant}: {str(e)}")
+
+    def _save(self, tenant: str, vendors: _TenantVendors):
+        """Atomically persist a tenant's raw-to-canonical map"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(tenant)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(vendors.raw_map, f)
+        os.replace(tmp_path, path)
+        self._loaded_mtimes[tenant] = os.path.getmtime(path)
+
+    def resolve_names(self, raw_names: List[Any], tenant: str = 'default', counts: Optional[List[int]] = None) -> List[str]:
+        """Canonical vendor name of each raw name, given how often each occurs if known"""
+        raw_names = [str(raw) for raw in raw_names]
+        with self._lock:
+            vendors = self._tenant(tenant)
+            canonical, added = vendors.resolve(raw_names, dict(zip(raw_names, counts)) if counts is not None else None)
+            if added:
+                try:
+                    # Keep mappings other workers saved while these names were resolved
+                    self._reload(tenant)
+                    self._save(tenant, vendors)
+                except OSError as e:
+                    logging.warning(f"Could not save vendor map for {tenant}: {str(e)}")
+                canonical = [vendors.raw_map[raw] for raw in raw_names]
+        return canonical
+
+    def resolve_batch(self, batch: TransactionBatch, tenant: str = 'default') -> Tuple[TransactionBatch, Dict[str, Any]]:
+        """Return the batch with vendors replaced by canonical vendors, and a summary of the merge
+
+        Only the batch's distinct vendor names are resolved; transactions are
+        remapped with one array lookup.
+        """
+        counts = np.bincount(batch.vendor_codes, minlength=len(batch.vendor_names))
+        canonical = self.resolve_names(list(batch.vendor_names), tenant, counts.tolist())
+
+        # Vendor names are in order of first appearance, so their canonical codes are too
+        codes, names = pd.factorize(pd.Series(canonical, dtype=object), use_na_sentinel=False)
+        resolved = TransactionBatch(
+            batch.amounts, batch.dates,
+            codes[batch.vendor_codes], np.asarray(names, dtype=object),
+            batch.category_codes, batch.category_names,
+            batch.descriptions
+        )
+
+        merged = defaultdict(list)
+        for raw, vendor in zip(batch.vendor_names, canonical):
+            merged[vendor].append(str(raw))
+        summary = {
+            'raw_vendors': int(len(batch.vendor_names)),
+            'canonical_vendors': int(len(names)),
+            'merged': {vendor: raws for vendor, raws in merged.items() if len(raws) > 1}
+        }
+        return resolved, summary
+
+
+vendor_resolver = VendorResolver()
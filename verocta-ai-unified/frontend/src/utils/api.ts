@@ -64,6 +64,7 @@ export const endpoints = {
 
   // Analysis
   upload: '/upload',
+  uploadPreview: '/upload/preview',
   spendScore: '/spend-score',
   downloadReport: '/report',
 